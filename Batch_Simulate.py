@@ -0,0 +1,220 @@
+"""
+Simulates a folder of TSV sample sheets in parallel and reports which ones pass.
+
+Each sheet is run through PCR.py in its own worker process with PCR_TSV_FILE pointing at the sheet.  By default the
+sheets run against Mock_Protocol, which takes a fraction of a second each.  --opentrons uses opentrons.simulate
+instead.  The run log and plate layout for each sheet, or the error that stopped it, is written to the output folder
+along with summary.tsv.
+
+Results are kept in Simulation_Cache so a sheet that has not changed is not simulated again.  --no-cache turns that
+off.
+
+    python Batch_Simulate.py sheets/ --output batch_simulation
+    python Batch_Simulate.py "sheets/*ddPCR*.tsv" --workers 4 --opentrons
+"""
+import argparse
+import contextlib
+import glob
+import io
+import os
+import sys
+import tempfile
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+import Labware_Index
+import Run_Estimator
+import Run_Log
+import Simulation_Cache
+
+__version__ = "0.1.0"
+
+SUMMARY_COLUMNS = ["Sheet", "Result", "Commands", "Tips", "Warnings", "Estimated Run Time", "Simulation Seconds",
+                   "Cached", "Error"]
+
+
+def find_sheets(sheet_path):
+    """
+    Return the TSV files in a folder or matching a glob pattern.
+    @param sheet_path:
+    @return:
+    """
+    if os.path.isdir(sheet_path):
+        sheet_path = os.path.join(sheet_path, "*.tsv")
+
+    return sorted(glob.glob(sheet_path))
+
+
+def run_sheet(tsv_file, protocol_file, use_opentrons):
+    """
+    Simulate one sheet.
+    @param tsv_file:
+    @param protocol_file:
+    @param use_opentrons: Use opentrons.simulate instead of Mock_Protocol.
+    @return: The run log, a list of warnings and the plate layout.
+    """
+    with tempfile.TemporaryDirectory() as temp_path:
+        plate_layout_file = os.path.join(temp_path, "PlateLayout.tsv")
+        os.environ["PCR_PLATE_LAYOUT_FILE"] = plate_layout_file
+
+        if use_opentrons:
+            from opentrons.simulate import simulate
+
+            os.environ["PCR_TSV_FILE"] = os.path.abspath(tsv_file)
+            labware_paths = Labware_Index.labware_paths(tsv_file=tsv_file)
+            with open(protocol_file) as protocol:
+                run_log, __bundle__ = simulate(protocol, custom_labware_paths=labware_paths)
+            # The same lines Simulate_PCR.py stores in the cache.
+            run_log, warnings = "\n".join(Run_Log.runlog_lines(run_log)), []
+        else:
+            import Mock_Protocol
+
+            context = Mock_Protocol.simulate(protocol_file, tsv_file=tsv_file)
+            run_log, warnings = Mock_Protocol.format_runlog(context.commands), context.warnings
+
+        plate_layout = ""
+        if os.path.isfile(plate_layout_file):
+            with open(plate_layout_file) as layout:
+                plate_layout = layout.read()
+
+    return run_log, warnings, plate_layout
+
+
+def simulate_sheet(tsv_file, protocol_file, output_path, use_opentrons=False, cache_path=None):
+    """
+    Simulate one sheet and write its run log and plate layout.  Runs in a worker process.
+    @param tsv_file:
+    @param protocol_file:
+    @param output_path:
+    @param use_opentrons:
+    @param cache_path: Simulation_Cache folder.  None to always simulate.
+    @return: Dictionary with a value for each of the SUMMARY_COLUMNS.
+    """
+    sheet_name = os.path.splitext(os.path.basename(tsv_file))[0]
+    start_time = time.perf_counter()
+
+    cache = cache_key = cached = None
+    if cache_path is not None:
+        cache = Simulation_Cache.SimulationCache(cache_path)
+        cache_key = cache.key(tsv_file, protocol_file, use_opentrons)
+        cached = cache.get(cache_key)
+
+    if cached is not None:
+        run_log, plate_layout, stats = cached.run_log, cached.plate_layout, cached.stats
+    else:
+        run_log = plate_layout = ""
+        output = io.StringIO()
+
+        try:
+            # PCR.py and the temperature module print to stdout.  Keep that in the sheet's log.
+            with contextlib.redirect_stdout(output):
+                run_log, warnings, plate_layout = run_sheet(tsv_file, protocol_file, use_opentrons)
+            stats = Simulation_Cache.result_stats("PASS", warnings, output.getvalue())
+        except Exception as error:
+            stats = Simulation_Cache.result_stats("FAIL", output=output.getvalue(),
+                                                  error="{}: {}".format(type(error).__name__, error),
+                                                  trace=traceback.format_exc())
+
+        stats["simulation_seconds"] = round(time.perf_counter() - start_time, 2)
+        if cache is not None:
+            cache.put(cache_key, run_log, plate_layout, stats)
+
+    result = dict.fromkeys(SUMMARY_COLUMNS, "")
+    result.update({"Result": stats["result"], "Error": stats["error"],
+                   "Simulation Seconds": stats["simulation_seconds"], "Cached": "yes" if cached is not None else ""})
+    if stats["result"] == "PASS":
+        lines = run_log.split("\n")
+        run_time, stage_times = Run_Estimator.estimate(lines)
+        result.update({"Commands": sum(1 for line in lines if line.strip()), "Warnings": len(stats["warnings"]),
+                       "Tips": sum(1 for line in lines if line.startswith("Picking up tip")),
+                       "Estimated Run Time": Run_Estimator.format_duration(run_time)})
+        log_text = "{}\n\n{}\n{}".format(run_log, Run_Estimator.format_estimate(run_time, stage_times),
+                                         "".join("Warning: {}\n".format(warning) for warning in stats["warnings"]))
+    else:
+        log_text = stats["traceback"]
+
+    if stats["output"]:
+        log_text = "{}\n{}".format(stats["output"], log_text)
+
+    result["Sheet"] = os.path.basename(tsv_file)
+    with open(os.path.join(output_path, "{}.log".format(sheet_name)), "w", encoding="utf-8") as log:
+        log.write(log_text)
+    if plate_layout:
+        with open(os.path.join(output_path, "{}_PlateLayout.tsv".format(sheet_name)), "w", encoding="utf-8") \
+                as layout:
+            layout.write(plate_layout)
+
+    return result
+
+
+def batch_simulate(tsv_files, output_path, protocol_file=None, workers=None, use_opentrons=False, use_cache=True):
+    """
+    Simulate the sheets in parallel and write summary.tsv.
+    @param tsv_files:
+    @param output_path:
+    @param protocol_file: Defaults to PCR.py next to this file.
+    @param workers: Number of worker processes.  Defaults to the number of CPUs.
+    @param use_opentrons:
+    @param use_cache: Use and update the Simulation_Cache.
+    @return: List of result dictionaries in the order of the sheets.
+    """
+    if protocol_file is None:
+        protocol_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "PCR.py")
+
+    os.makedirs(output_path, exist_ok=True)
+
+    # Build the labware index before the workers start so they only ever read it.
+    Labware_Index.build_index()
+    cache = Simulation_Cache.SimulationCache() if use_cache else None
+    cache_path = cache.cache_path if use_cache else None
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(simulate_sheet, tsv_file, protocol_file, output_path, use_opentrons, cache_path)
+                   for tsv_file in tsv_files]
+        results = [future.result() for future in futures]
+
+    if cache is not None:
+        cache.evict()
+
+    with open(os.path.join(output_path, "summary.tsv"), "w", encoding="utf-8") as summary:
+        summary.write("\t".join(SUMMARY_COLUMNS) + "\n")
+        for result in results:
+            summary.write("\t".join(str(result[column]) for column in SUMMARY_COLUMNS) + "\n")
+
+    return results
+
+
+def format_summary(results):
+    passed = sum(1 for result in results if result["Result"] == "PASS")
+    lines = ["{} of {} sheets passed".format(passed, len(results))]
+    for result in results:
+        lines.append("{}\t{}\t{} tips\t{}\t{}".format(result["Result"], result["Sheet"], result["Tips"] or 0,
+                                                      result["Estimated Run Time"], result["Error"]).rstrip())
+
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate a batch of PCR.py sample sheets in parallel.")
+    parser.add_argument("sheets", help="Folder of TSV files or a glob pattern.")
+    parser.add_argument("--output", default="batch_simulation", help="Folder for the run logs and summary.tsv.")
+    parser.add_argument("--protocol", default=None, help="Protocol file.  Defaults to PCR.py.")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes.")
+    parser.add_argument("--opentrons", action="store_true", help="Use opentrons.simulate instead of Mock_Protocol.")
+    parser.add_argument("--no-cache", action="store_true", help="Simulate every sheet even if it is cached.")
+    options = parser.parse_args(argv)
+
+    tsv_files = find_sheets(options.sheets)
+    if not tsv_files:
+        print("No TSV files found in {}".format(options.sheets))
+        return 1
+
+    results = batch_simulate(tsv_files, options.output, options.protocol, options.workers, options.opentrons,
+                             not options.no_cache)
+    print(format_summary(results))
+
+    return 0 if all(result["Result"] == "PASS" for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,199 @@
+"""
+Fits a ramp model for a Parhelia cold plate from the temperature logs PCR.py writes.
+
+The plate is modeled as first order plus dead time.  After the setpoint changes nothing happens for the dead time,
+then the temperature closes on the setpoint exponentially with time constant tau:
+
+    T(t) = S + (T0 - S) * exp(-(t - dead time) / tau)
+
+Each log is split where the setpoint changes.  Every step of at least MIN_STEP degrees is a heating or cooling
+segment.  The dead time and tau for each direction are found with a grid search that minimizes the squared error
+over all of the segments.  The result is added to the model file under the plate serial number.  Copy the file to
+/var/lib/jupyter/notebooks/ColdPlateModels.json on the robot and quick_temp will use it.
+
+    python Cold_Plate_Calibration.py ddPCR_Temperature.csv ddPCR_Temperature.json --serial 29517
+"""
+import argparse
+import csv
+import datetime
+import json
+import os
+import sys
+import numpy as np
+
+__version__ = "0.1.0"
+
+# Smallest setpoint step, degrees C, used for fitting.
+MIN_STEP = 2.0
+
+DEAD_TIME_GRID = np.arange(0, 60.5, 0.5)
+TAU_GRID = np.geomspace(5, 3000, 400)
+
+
+def read_trace(trace_file):
+    """
+    Read a temperature log.
+    @param trace_file: CSV or JSON file from TemperatureTelemetry.write.
+    @return: Serial number from the file or "" and a list of (seconds, setpoint, temperature).
+    """
+    if trace_file.endswith(".json"):
+        with open(trace_file) as json_file:
+            trace = json.load(json_file)
+        serial_number = trace.get("serial_number", "")
+        readings = trace["readings"]
+    else:
+        serial_number = ""
+        with open(trace_file, newline="") as csv_file:
+            readings = list(csv.DictReader(csv_file))
+
+    samples = []
+    for reading in readings:
+        try:
+            samples.append((float(reading["Elapsed Seconds"]), float(reading["Setpoint"]),
+                            float(reading["Temperature"])))
+        except (TypeError, ValueError):
+            # The plate was off or the reading failed.
+            continue
+
+    return serial_number, samples
+
+
+def split_segments(samples):
+    """
+    Split a trace where the setpoint changes.
+    @param samples: List of (seconds, setpoint, temperature).
+    @return: Dictionary of "heating" and "cooling" to lists of (times from the step, temperatures, start, setpoint).
+    """
+    segments = {"heating": [], "cooling": []}
+    start = 0
+    for i in range(1, len(samples) + 1):
+        if i < len(samples) and samples[i][1] == samples[start][1]:
+            continue
+
+        # The first setpoint in the log has no step to fit.
+        if start == 0:
+            start = i
+            continue
+
+        # The setpoint changed at some point between the last reading before it shows up and the first one after.
+        segment = samples[start:i]
+        step_time, start_temp = (samples[start - 1][0] + samples[start][0]) / 2, samples[start - 1][2]
+        setpoint = segment[0][1]
+        if abs(setpoint - start_temp) >= MIN_STEP and len(segment) >= 3:
+            times = np.array([sample[0] - step_time for sample in segment])
+            temps = np.array([sample[2] for sample in segment])
+            direction = "heating" if setpoint > start_temp else "cooling"
+            segments[direction].append((times, temps, start_temp, setpoint))
+        start = i
+
+    return segments
+
+
+def predict(times, start_temp, setpoint, dead_time, tau):
+    """
+    Temperature from the first order plus dead time model.  Works on arrays of dead times and taus.
+    """
+    elapsed = np.maximum(times - dead_time, 0)
+    return setpoint + (start_temp - setpoint) * np.exp(-elapsed / tau)
+
+
+def fit_segments(segments):
+    """
+    Find the dead time and tau that fit all of the segments best.
+    @param segments: List of (times, temperatures, start temperature, setpoint).
+    @return: Dictionary with dead_time_sec, tau_sec, rmse and segments, or None if there are no segments.
+    """
+    if not segments:
+        return None
+
+    dead_times = DEAD_TIME_GRID[:, np.newaxis, np.newaxis]
+    taus = TAU_GRID[np.newaxis, :, np.newaxis]
+    squared_error = np.zeros((len(DEAD_TIME_GRID), len(TAU_GRID)))
+    sample_count = 0
+
+    for times, temps, start_temp, setpoint in segments:
+        predicted = predict(times[np.newaxis, np.newaxis, :], start_temp, setpoint, dead_times, taus)
+        squared_error += ((predicted - temps) ** 2).sum(axis=2)
+        sample_count += len(times)
+
+    dead_time_index, tau_index = np.unravel_index(np.argmin(squared_error), squared_error.shape)
+
+    return {"dead_time_sec": round(float(DEAD_TIME_GRID[dead_time_index]), 1),
+            "tau_sec": round(float(TAU_GRID[tau_index]), 1),
+            "rmse": round(float(np.sqrt(squared_error[dead_time_index, tau_index] / sample_count)), 3),
+            "segments": len(segments)}
+
+
+def calibrate(trace_files):
+    """
+    Fit the heating and cooling models from one or more temperature logs.
+    @param trace_files:
+    @return: Serial number found in the files or "" and the model dictionary.
+    """
+    serial_number = ""
+    segments = {"heating": [], "cooling": []}
+    for trace_file in trace_files:
+        file_serial_number, samples = read_trace(trace_file)
+        serial_number = serial_number or file_serial_number
+        for direction, direction_segments in split_segments(samples).items():
+            segments[direction].extend(direction_segments)
+
+    model = {"fitted": datetime.datetime.today().isoformat(timespec="seconds"),
+             "traces": [os.path.basename(trace_file) for trace_file in trace_files]}
+    for direction in segments:
+        fit = fit_segments(segments[direction])
+        if fit is not None:
+            model[direction] = fit
+
+    return serial_number, model
+
+
+def save_model(model_file, serial_number, model):
+    """
+    Add or replace the model for one plate in the model file.
+    @param model_file:
+    @param serial_number:
+    @param model:
+    """
+    models = {}
+    if os.path.isfile(model_file):
+        with open(model_file) as json_file:
+            models = json.load(json_file)
+
+    models[serial_number] = model
+    temp_file = "{}.{}.tmp".format(model_file, os.getpid())
+    with open(temp_file, "w") as json_file:
+        json.dump(models, json_file, indent=1)
+    os.replace(temp_file, model_file)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fit a cold plate ramp model from PCR.py temperature logs.")
+    parser.add_argument("traces", nargs="+", help="Temperature log CSV or JSON files.")
+    parser.add_argument("--serial", default="", help="Plate serial number.  Taken from a JSON log if not given.")
+    parser.add_argument("--output", default="ColdPlateModels.json", help="Model file to add the plate to.")
+    options = parser.parse_args(argv)
+
+    serial_number, model = calibrate(options.traces)
+    serial_number = options.serial or serial_number
+    if not serial_number:
+        print("No serial number in the logs.  Use --serial.")
+        return 1
+
+    if "heating" not in model and "cooling" not in model:
+        print("No setpoint steps of at least {} C in the logs".format(MIN_STEP))
+        return 1
+
+    save_model(options.output, serial_number, model)
+    for direction in ("heating", "cooling"):
+        if direction in model:
+            print("{}: dead time {} s, tau {} s, rmse {} C from {} steps".format(
+                direction, model[direction]["dead_time_sec"], model[direction]["tau_sec"],
+                model[direction]["rmse"], model[direction]["segments"]))
+    print("Saved {} to {}".format(serial_number, options.output))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,245 @@
+"""
+Emulates a Parhelia cold plate on a Linux pseudo-terminal so ColdPlateSlimDriver can be run and timed without the
+hardware.
+
+The emulator answers the driver's commands, info, getTempActual, setTempTarget###, tempOn and tempOff, with CRLF
+terminated replies after a configurable delay and jitter.  The plate temperature follows a first order plus dead
+time response to the setpoint while the plate is on and drifts back to ambient when it is off.  Point the driver at
+the port the emulator prints:
+
+    python Cold_Plate_Emulator.py --link /tmp/ttyColdPlate
+    ColdPlateSlimDriver(protocol, port="/tmp/ttyColdPlate")
+
+--benchmark times the driver commands against the emulator and exits.
+"""
+import argparse
+import math
+import os
+import pty
+import random
+import select
+import sys
+import threading
+import time
+import tty
+
+__version__ = "0.1.0"
+
+
+class ColdPlateEmulator:
+    def __init__(self, serial_number="29517", ambient_temp=22.0, heating=(5.0, 60.0), cooling=(8.0, 45.0),
+                 off_tau_sec=300.0, reply_delay=0.005, jitter=0.002, acknowledge=True, link=None):
+        """
+        @param serial_number:
+        @param ambient_temp: Temperature the plate starts at and drifts to when off.
+        @param heating: (dead time, time constant) in seconds while heating.
+        @param cooling: (dead time, time constant) in seconds while cooling.
+        @param off_tau_sec: Time constant for drifting to ambient when off.
+        @param reply_delay: Seconds before each reply.
+        @param jitter: Up to this many seconds are added to each reply delay at random.
+        @param acknowledge: Reply OK to the set commands.  False leaves them unanswered like some firmware does.
+        @param link: Also make the port available at this path.
+        """
+        self.serial_number = serial_number
+        self.ambient_temp = ambient_temp
+        self.heating = heating
+        self.cooling = cooling
+        self.off_tau_sec = off_tau_sec
+        self.reply_delay = reply_delay
+        self.jitter = jitter
+        self.acknowledge = acknowledge
+        self.link = link
+
+        self.temp = ambient_temp
+        self.setpoint = ambient_temp
+        self.target = ambient_temp
+        self.on = False
+        self.commands = []
+        self._time = time.monotonic()
+
+        # (time the change takes effect, setpoint or None for off)
+        self._pending = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self._master, self._slave = pty.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        if link:
+            if os.path.islink(link):
+                os.remove(link)
+            os.symlink(self.port, link)
+
+    def _advance(self, now):
+        """
+        Bring the temperature up to now.  The response is exact for a setpoint that holds between changes.
+        """
+        while self._time < now:
+            step_end = now
+            if self._pending and self._pending[0][0] < now:
+                step_end = max(self._pending[0][0], self._time)
+
+            if self.on:
+                setpoint = self.setpoint
+                tau = self.heating[1] if setpoint > self.temp else self.cooling[1]
+            else:
+                setpoint, tau = self.ambient_temp, self.off_tau_sec
+            self.temp = setpoint + (self.temp - setpoint) * math.exp(-(step_end - self._time) / tau)
+            self._time = step_end
+
+            if self._pending and self._pending[0][0] <= self._time:
+                effective_time, setpoint = self._pending.pop(0)
+                self.on = setpoint is not None
+                if self.on:
+                    self.setpoint = setpoint
+
+    def _change(self, setpoint):
+        """
+        Schedule a setpoint change, or None to turn off, after the dead time.
+        """
+        direction = self.heating if setpoint is not None and setpoint > self.temp else self.cooling
+        self._pending.append((time.monotonic() + direction[0], setpoint))
+        self._pending.sort(key=lambda change: change[0])
+
+    def temperature(self):
+        with self._lock:
+            self._advance(time.monotonic())
+            return self.temp
+
+    def reply(self, command):
+        """
+        Return the reply for one command or None for no reply.
+        @param command: Command without the CRLF.
+        @return:
+        """
+        with self._lock:
+            self._advance(time.monotonic())
+            self.commands.append(command)
+
+            if command == "info":
+                return "Parhelia Cold Plate Emulator {} SN {}".format(__version__, self.serial_number)
+            if command == "getTempActual":
+                return "{:.1f}".format(self.temp)
+            if command.startswith("setTempTarget"):
+                try:
+                    self.target = int(command[len("setTempTarget"):]) / 10
+                except ValueError:
+                    return "ERROR invalid temperature {}".format(command[len("setTempTarget"):])
+                if self.on:
+                    self._change(self.target)
+                return "OK" if self.acknowledge else None
+            if command == "tempOn":
+                self._change(self.target)
+                return "OK" if self.acknowledge else None
+            if command == "tempOff":
+                self._change(None)
+                return "OK" if self.acknowledge else None
+
+        return "ERROR unknown command {}".format(command)
+
+    def _serve(self):
+        buffer = b""
+        while not self._stop.is_set():
+            readable, writable, failed = select.select([self._master], [], [], 0.1)
+            if not readable:
+                continue
+            try:
+                buffer += os.read(self._master, 1024)
+            except OSError:
+                return
+
+            while b"\r\n" in buffer:
+                line, buffer = buffer.split(b"\r\n", 1)
+                command = line.decode("utf-8", errors="replace").strip()
+                if not command:
+                    continue
+
+                response = self.reply(command)
+                time.sleep(self.reply_delay + random.uniform(0, self.jitter))
+                if response is not None:
+                    os.write(self._master, "{}\r\n".format(response).encode())
+
+    def start(self):
+        self._thread = threading.Thread(target=self._serve, name="cold_plate_emulator", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        os.close(self._master)
+        os.close(self._slave)
+        if self.link and os.path.islink(self.link):
+            os.remove(self.link)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+def benchmark(emulator, count=50):
+    """
+    Time the driver commands against the emulator.
+    @param emulator:
+    @param count: Number of times each command is sent.
+    @return: Dictionary of command name to a list of milliseconds.
+    """
+    from types import SimpleNamespace
+    import PCR
+
+    protocol = SimpleNamespace(is_simulating=lambda: False, comment=print, delay=None)
+    driver = PCR.ColdPlateSlimDriver(protocol, port=emulator.port)
+    commands = {"info": driver.get_info, "getTempActual": driver.get_temp, "set_temp": lambda: driver.set_temp(20)}
+
+    timings = {}
+    for name, command in commands.items():
+        timings[name] = []
+        for i in range(count):
+            start_time = time.perf_counter()
+            command()
+            timings[name].append((time.perf_counter() - start_time) * 1000)
+
+    driver.deactivate()
+    driver.close()
+    return timings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Emulate a Parhelia cold plate on a pseudo-terminal.")
+    parser.add_argument("--link", default=None, help="Also make the port available at this path.")
+    parser.add_argument("--serial", default="29517", help="Serial number the emulator reports.")
+    parser.add_argument("--delay", type=float, default=0.005, help="Seconds before each reply.")
+    parser.add_argument("--jitter", type=float, default=0.002, help="Most seconds added to each reply at random.")
+    parser.add_argument("--ambient", type=float, default=22.0, help="Starting and ambient temperature.")
+    parser.add_argument("--no-ack", action="store_true", help="Don't reply to setTempTarget, tempOn and tempOff.")
+    parser.add_argument("--benchmark", type=int, default=0, metavar="N",
+                        help="Time N of each driver command against the emulator and exit.")
+    options = parser.parse_args(argv)
+
+    emulator = ColdPlateEmulator(options.serial, options.ambient, reply_delay=options.delay, jitter=options.jitter,
+                                 acknowledge=not options.no_ack, link=options.link)
+
+    with emulator:
+        if options.benchmark:
+            for name, timings in benchmark(emulator, options.benchmark).items():
+                timings.sort()
+                print("{}\tmedian {:.1f} ms\tmax {:.1f} ms".format(name, timings[len(timings) // 2], timings[-1]))
+            return 0
+
+        print("Cold plate emulator on {}".format(options.link or emulator.port))
+        try:
+            while True:
+                time.sleep(60)
+                print("{:.1f} C".format(emulator.temperature()))
+        except KeyboardInterrupt:
+            pass
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
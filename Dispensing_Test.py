@@ -1,8 +1,13 @@
 import datetime
 import math
 import os
-import platform
-from opentrons.simulate import simulate, format_runlog
+from opentrons.simulate import simulate
+
+# The well geometry model lives in PCR.py.  It is not available when this file is run by itself on the robot.
+try:
+    from PCR import WellGeometry
+except ImportError:
+    WellGeometry = None
 
 # metadata
 metadata = {
@@ -28,16 +33,20 @@ def load_tipracks(protocol, tiprack_list, labware_dict):
     return tiprack_labware
 
 
-def res_tip_height(res_vol, well_dia, cone_vol):
+def res_tip_height(res_vol, well_dia, cone_vol, well=None):
     """
     Calculate the the height of the liquid in a reservoir and return the value to set the pipette tip height.
-    This works for both conical shapes and cylinders.
+    This works for both conical shapes and cylinders.  If the well is given and PCR.WellGeometry can be imported the
+    height comes from the labware definition instead of the cone volume.
     @param res_vol:
     @param well_dia:
     @param cone_vol:
+    @param well:
     @return:
     """
-    if res_vol > cone_vol:
+    if WellGeometry is not None and well is not None:
+        height = WellGeometry(well).height(res_vol)-5
+    elif res_vol > cone_vol:
         cone_height = (3*cone_vol/(math.pi*((well_dia/2)**2)))
         height = ((res_vol-cone_vol)/(math.pi*((well_dia/2)**2)))-5+cone_height
     else:
@@ -108,7 +117,8 @@ def run(ctx):
     source_well = "D1"
     destination_well = "D3"
     water_res_well_dia = reagent_labware["A1"].diameter
-    water_tip_height = res_tip_height(initial_water_volume, water_res_well_dia, cone_vol)
+    water_res_well = reagent_labware[source_well]
+    water_tip_height = res_tip_height(initial_water_volume, water_res_well_dia, cone_vol, water_res_well)
     water_aspirated = 0
     count = 0
     ctx.comment("{}; {}".format(left_pipette, right_pipette))
@@ -121,14 +131,16 @@ def run(ctx):
                         reagent_labware[destination_well], left_dispensed_vol, NewTip=False, MixReaction=False)
 
         water_aspirated += left_dispensed_vol
-        water_tip_height = res_tip_height(initial_water_volume-water_aspirated, water_res_well_dia, cone_vol)
+        water_tip_height = \
+            res_tip_height(initial_water_volume-water_aspirated, water_res_well_dia, cone_vol, water_res_well)
 
         # Test Right Pipette
         dispensing_loop(1, right_pipette, reagent_labware[source_well].bottom(water_tip_height),
                         reagent_labware[destination_well], right_dispensed_vol, NewTip=False, MixReaction=False)
 
         water_aspirated += right_dispensed_vol
-        water_tip_height = res_tip_height(initial_water_volume-water_aspirated, water_res_well_dia, cone_vol)
+        water_tip_height = \
+            res_tip_height(initial_water_volume-water_aspirated, water_res_well_dia, cone_vol, water_res_well)
 
         count += 1
 
@@ -137,22 +149,22 @@ def run(ctx):
 
 
 if __name__ == "__main__":
+    # Only used for the simulation.  These modules are not on the robot.
+    import Labware_Index
+    import Run_Log
+
     protocol_file = open('Dispensing_Test.py')
     labware_path = "{}{}custom_labware".format(os.getcwd(), os.sep)
-    run_log, __bundle__ = simulate(protocol_file, custom_labware_paths=[labware_path])
+
+    # The reagent tubes are the only labware in run() that is not Opentrons labware.
+    labware_paths = Labware_Index.labware_paths(load_names=["vwrmicrocentrifugetube1.5ml_24_tuberack_1500ul"],
+                                                labware_path=labware_path)
+    run_log, __bundle__ = simulate(protocol_file, custom_labware_paths=labware_paths)
+    protocol_file.close()
     run_date = datetime.datetime.today().strftime("%a %b %d %H:%M %Y")
-    i = 1
-    t = format_runlog(run_log).split("\n")
 
-    outstring = "Opentrons OT-2 Steps for {}.\nDate:  {}\nProgram File: Dispensing_Test.py\n\nStep\tCommand\n" \
+    header = "Opentrons OT-2 Steps for {}.\nDate:  {}\nProgram File: Dispensing_Test.py\n\n" \
         .format(metadata['protocolName'], run_date)
 
-    for l in t:
-        outstring += "{}\t{}\n".format(i, l)
-        i += 1
-    if platform.system() == "Windows":
-        outfile = open("C:{0}Users{0}{1}{0}Documents{0}Dispensing_Simulation.txt"
-                       .format(os.sep, os.getlogin()), 'w', encoding="UTF-16")
-        outfile.write(outstring)
-        outfile.close()
-    protocol_file.close()
+    output, encoding = Run_Log.default_output("Dispensing_Simulation.txt")
+    Run_Log.write_runlog(run_log, output, header, encoding=encoding)
@@ -0,0 +1,197 @@
+"""
+Builds an index of the custom labware definitions so simulations only load the labware a run uses.
+
+Each definition in custom_labware is validated once and written in compact form to its own folder in
+.labware_cache, keyed by load name and the SHA-256 of the source file.  A definition is only parsed and validated
+again when its file changes.  simulate() takes folders of labware, so the folders for the labware in the Slot1 to
+Slot11 lines of a TSV are passed to it instead of the whole custom_labware folder.
+"""
+import csv
+import glob
+import hashlib
+import json
+import os
+
+__version__ = "0.1.0"
+
+INDEX_FILE = "index.json"
+WELL_KEYS = ("depth", "shape", "totalLiquidVolume", "x", "y", "z")
+
+
+def default_paths():
+    """
+    Return the custom labware folder and the cache folder next to this file.
+    @return:
+    """
+    repo_path = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(repo_path, "custom_labware"), os.path.join(repo_path, ".labware_cache")
+
+
+def default_tsv_file():
+    """
+    The same TSV locations PCR.py uses.  PCR_TSV_FILE if it is set, on the OT-2 next, then the temp file on Windows
+    computers.
+    @return:
+    """
+    if os.path.isfile(os.environ.get("PCR_TSV_FILE", "")):
+        return os.environ["PCR_TSV_FILE"]
+
+    tsv_file_path = "{0}var{0}lib{0}jupyter{0}notebooks{0}ProcedureFile.tsv".format(os.sep)
+
+    if not os.path.isfile(tsv_file_path):
+        tsv_file_path = "C:{0}Users{0}{1}{0}Documents{0}TempTSV.tsv".format(os.sep, os.getlogin())
+
+    return tsv_file_path
+
+
+def validate_definition(definition):
+    """
+    Check a labware definition has what the Opentrons API and PCR.py use.
+    @param definition:
+    @return: List of problems.  Empty if the definition is good.
+    """
+    problems = []
+    for key in ("parameters", "wells", "ordering", "dimensions", "metadata", "cornerOffsetFromSlot"):
+        if key not in definition:
+            problems.append("missing {}".format(key))
+    if problems:
+        return problems
+
+    if not definition["parameters"].get("loadName"):
+        problems.append("missing parameters.loadName")
+
+    wells = definition["wells"]
+    for column in definition["ordering"]:
+        for well_name in column:
+            if well_name not in wells:
+                problems.append("well {} is in ordering but not in wells".format(well_name))
+
+    for well_name, well in wells.items():
+        for key in WELL_KEYS:
+            if key not in well:
+                problems.append("well {} missing {}".format(well_name, key))
+        if well.get("shape") == "circular" and "diameter" not in well:
+            problems.append("well {} missing diameter".format(well_name))
+        elif well.get("shape") == "rectangular" and ("xDimension" not in well or "yDimension" not in well):
+            problems.append("well {} missing xDimension or yDimension".format(well_name))
+
+    return problems
+
+
+def read_index(cache_path):
+    index_file = os.path.join(cache_path, INDEX_FILE)
+    if not os.path.isfile(index_file):
+        return {}
+
+    with open(index_file) as index:
+        return json.load(index)
+
+
+def write_json(file_name, data, **kwargs):
+    """
+    Write to a temporary file and rename it so simulations running at the same time never read a partial file.
+    @param file_name:
+    @param data:
+    @param kwargs: Passed to json.dump
+    """
+    temp_file_name = "{}.{}.tmp".format(file_name, os.getpid())
+    with open(temp_file_name, "w") as json_file:
+        json.dump(data, json_file, **kwargs)
+    os.replace(temp_file_name, file_name)
+
+
+def build_index(labware_path=None, cache_path=None):
+    """
+    Validate the labware definitions and write the compact copies and the index.  Definitions whose files have not
+    changed since the last build are not parsed again.
+    @param labware_path:
+    @param cache_path:
+    @return: Dictionary of load name to index entry.
+    """
+    default_labware_path, default_cache_path = default_paths()
+    labware_path = labware_path or default_labware_path
+    cache_path = cache_path or default_cache_path
+    os.makedirs(cache_path, exist_ok=True)
+
+    old_index = read_index(cache_path)
+    known_hashes = {entry["hash"]: (load_name, entry) for load_name, entry in old_index.items()}
+    index = {}
+
+    for labware_file in sorted(glob.glob(os.path.join(labware_path, "*.json"))):
+        with open(labware_file, "rb") as definition_file:
+            raw = definition_file.read()
+        content_hash = hashlib.sha256(raw).hexdigest()
+
+        cached = known_hashes.get(content_hash)
+        if cached and os.path.isdir(os.path.join(cache_path, cached[1]["folder"])):
+            load_name, entry = cached
+        else:
+            definition = json.loads(raw.decode("utf-8"))
+            problems = validate_definition(definition)
+            if problems:
+                raise ValueError("{} is not a valid labware definition: {}".format(labware_file, "; ".join(problems)))
+
+            load_name = definition["parameters"]["loadName"]
+            entry = {"hash": content_hash, "folder": "{}-{}".format(load_name, content_hash[:16])}
+            os.makedirs(os.path.join(cache_path, entry["folder"]), exist_ok=True)
+            write_json(os.path.join(cache_path, entry["folder"], "definition.json"), definition,
+                       separators=(",", ":"))
+
+        if load_name in index:
+            raise ValueError("{} is defined by both {} and {}"
+                             .format(load_name, index[load_name]["source"], os.path.basename(labware_file)))
+
+        index[load_name] = dict(entry, source=os.path.basename(labware_file))
+
+    write_json(os.path.join(cache_path, INDEX_FILE), index, indent=1, sort_keys=True)
+
+    return index
+
+
+def tsv_labware(tsv_file):
+    """
+    Return the load names in the --Slot1 to --Slot11 lines of a TSV file.
+    @param tsv_file:
+    @return:
+    """
+    slot_keys = {"--Slot{}".format(i + 1) for i in range(11)}
+    load_names = []
+    with open(tsv_file) as tsv:
+        for line in csv.reader(tsv, delimiter='\t'):
+            if len(line) > 1 and line[0].strip() in slot_keys:
+                load_name = line[1].split("#")[0].strip()
+                if load_name:
+                    load_names.append(load_name)
+
+    return load_names
+
+
+def labware_paths(load_names=None, tsv_file=None, labware_path=None, cache_path=None):
+    """
+    Return the folders to pass to simulate() as custom_labware_paths for the labware a run uses.  Opentrons labware
+    is not in the index and is skipped.  If there is nothing to select from, the whole custom labware folder is
+    returned.
+    @param load_names: Load names to include.
+    @param tsv_file: TSV file whose slots give the load names.
+    @param labware_path:
+    @param cache_path:
+    @return:
+    """
+    default_labware_path, default_cache_path = default_paths()
+    labware_path = labware_path or default_labware_path
+    cache_path = cache_path or default_cache_path
+
+    if load_names is None:
+        if tsv_file is None or not os.path.isfile(tsv_file):
+            return [labware_path]
+        load_names = tsv_labware(tsv_file)
+
+    index = build_index(labware_path, cache_path)
+
+    return [os.path.join(cache_path, index[load_name]["folder"]) for load_name in dict.fromkeys(load_names)
+            if load_name in index]
+
+
+if __name__ == "__main__":
+    labware_index = build_index()
+    print("Indexed {} labware definitions".format(len(labware_index)))
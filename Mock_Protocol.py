@@ -0,0 +1,674 @@
+"""
+A lightweight stand-in for the Opentrons ProtocolContext that can plan and check PCR.py without the opentrons package.
+
+Only the part of the API that PCR.py uses is here: load_labware, load_instrument, params, comment, delay, pause,
+set_rail_lights, is_simulating and the aspirate, dispense, mix, blow_out, touch_tip, pick_up_tip and drop_tip pipette
+commands.  Every command is recorded in MockProtocolContext.commands as a dictionary with the same "name" and "text"
+the opentrons run log uses, so format_runlog gives the same kind of output as opentrons.simulate.format_runlog.
+
+The pipettes check that they have a tip, that a tip is not picked up twice, that tip racks do not run out and that
+the liquid in a tip stays between zero and the smaller of the pipette and tip volumes.  Any problem raises a
+MockProtocolError.
+
+Labware definitions come from custom_labware through Labware_Index, then from opentrons_shared_data if it is
+installed, then from the few standard tip racks and reservoirs defined at the bottom of this file.
+
+    python Mock_Protocol.py [protocol file]
+"""
+import importlib.util
+import json
+import os
+import sys
+import time
+from collections import namedtuple, defaultdict
+from types import ModuleType, SimpleNamespace
+import Labware_Index
+
+__version__ = "0.1.0"
+
+# Front left corner of each OT-2 deck slot in mm.
+SLOT_ORIGINS = \
+    {"1": (0.0, 0.0), "2": (132.5, 0.0), "3": (265.0, 0.0), "4": (0.0, 90.5), "5": (132.5, 90.5),
+     "6": (265.0, 90.5), "7": (0.0, 181.0), "8": (132.5, 181.0), "9": (265.0, 181.0), "10": (0.0, 271.5),
+     "11": (132.5, 271.5), "12": (265.0, 271.5)}
+
+TRASH = "Trash Bin on slot 12"
+
+# Pipette model, channels, min and max volume and the default aspirate, dispense and blow out flow rates for API 2.20
+PIPETTE_SPECS = \
+    {"p10_single": ("P10 Single-Channel GEN1", 1, 1.0, 10.0, 5.0, 10.0, 1000.0),
+     "p20_single_gen2": ("P20 Single-Channel GEN2", 1, 1.0, 20.0, 7.56, 7.56, 7.56),
+     "p300_single_gen2": ("P300 Single-Channel GEN2", 1, 20.0, 300.0, 92.86, 92.86, 92.86),
+     "p20_multi_gen2": ("P20 8-Channel GEN2", 8, 1.0, 20.0, 7.6, 7.6, 7.6),
+     "p300_multi_gen2": ("P300 8-Channel GEN2", 8, 20.0, 300.0, 94.0, 94.0, 94.0)}
+
+
+class MockProtocolError(Exception):
+    pass
+
+
+class RuntimeParameterRequired(MockProtocolError):
+    """
+    Raised, like the opentrons error of the same name, when a CSV parameter has no file.
+    """
+
+
+class Point(namedtuple("Point", ["x", "y", "z"])):
+    def __add__(self, other):
+        return Point(self.x + other.x, self.y + other.y, self.z + other.z)
+
+    def __sub__(self, other):
+        return Point(self.x - other.x, self.y - other.y, self.z - other.z)
+
+
+class Location:
+    def __init__(self, point, labware):
+        self.point = point
+        self.labware = labware
+
+    def move(self, point):
+        return Location(self.point + point, self.labware)
+
+    def __str__(self):
+        return str(self.labware)
+
+    def __repr__(self):
+        return "Location(point={}, labware={})".format(self.point, self.labware)
+
+
+class Well:
+    def __init__(self, parent, well_name, well_definition):
+        self.parent = parent
+        self.well_name = well_name
+        self.depth = well_definition["depth"]
+        self.max_volume = well_definition["totalLiquidVolume"]
+        self.diameter = well_definition.get("diameter")
+        self.length = well_definition.get("xDimension")
+        self.width = well_definition.get("yDimension")
+        self.has_tip = parent.is_tiprack
+        self._bottom = parent.origin + Point(well_definition["x"], well_definition["y"], well_definition["z"])
+
+    def as_well(self):
+        return self
+
+    def bottom(self, z=0.0):
+        return Location(self._bottom + Point(0, 0, z), self)
+
+    def top(self, z=0.0):
+        return Location(self._bottom + Point(0, 0, self.depth + z), self)
+
+    def center(self):
+        return Location(self._bottom + Point(0, 0, self.depth / 2), self)
+
+    def __str__(self):
+        return "{} of {} on slot {}".format(self.well_name, self.parent, self.parent.parent)
+
+    __repr__ = __str__
+
+
+class Labware:
+    def __init__(self, definition, slot, label=None):
+        self.load_name = definition["parameters"]["loadName"]
+        self.parameters = definition["parameters"]
+        self.is_tiprack = bool(definition["parameters"].get("isTiprack"))
+        self.name = label or definition["metadata"]["displayName"]
+        self.parent = str(slot)
+
+        slot_x, slot_y = SLOT_ORIGINS[self.parent]
+        offset = definition["cornerOffsetFromSlot"]
+        self.origin = Point(slot_x + offset["x"], slot_y + offset["y"], offset["z"])
+
+        self._wells = {}
+        self._columns = []
+        for column in definition["ordering"]:
+            self._columns.append([])
+            for well_name in column:
+                well = Well(self, well_name, definition["wells"][well_name])
+                self._wells[well_name] = well
+                self._columns[-1].append(well)
+
+        self.tip_length = definition["parameters"].get("tipLength")
+        self.max_tip_volume = max((well.max_volume for well in self._wells.values()), default=0)
+
+    def __getitem__(self, well_name):
+        return self._wells[well_name]
+
+    def wells(self):
+        return [well for column in self._columns for well in column]
+
+    def wells_by_name(self):
+        return dict(self._wells)
+
+    def columns(self):
+        return [list(column) for column in self._columns]
+
+    def rows(self):
+        row_count = max(len(column) for column in self._columns)
+        return [[column[i] for column in self._columns if i < len(column)] for i in range(row_count)]
+
+    def next_tip(self, channels=1, starting_tip=None):
+        """
+        Return the first well of the next free tips.  An 8-channel pipette needs a whole column.
+        @param channels:
+        @param starting_tip: Well to start looking from.
+        @return: None if there are no tips left.
+        """
+        started = starting_tip is None
+        for column in self._columns:
+            for index, well in enumerate(column):
+                if not started and well is starting_tip:
+                    started = True
+                if not started:
+                    continue
+
+                tips = column[index:index + channels]
+                if len(tips) == channels and all(tip.has_tip for tip in tips):
+                    return well
+        return None
+
+    def use_tips(self, well, channels=1):
+        column = next(column for column in self._columns if well in column)
+        for tip in column[column.index(well):column.index(well) + channels]:
+            tip.has_tip = False
+
+    def __str__(self):
+        return self.name
+
+    __repr__ = __str__
+
+
+class InstrumentContext:
+    def __init__(self, context, instrument_name, mount, tip_racks=None):
+        if instrument_name not in PIPETTE_SPECS:
+            raise MockProtocolError("{} is not a pipette the mock protocol knows".format(instrument_name))
+
+        model, self.channels, self.min_volume, self.max_volume, aspirate, dispense, blow_out = \
+            PIPETTE_SPECS[instrument_name]
+        self.name = instrument_name
+        self.model = model
+        self.mount = mount
+        self.tip_racks = list(tip_racks or [])
+        self.starting_tip = None
+        self.flow_rate = SimpleNamespace(aspirate=aspirate, dispense=dispense, blow_out=blow_out)
+        self.current_volume = 0.0
+        self.has_tip = False
+        self.tips_used = 0
+        self._context = context
+        self._tip_volume = 0
+        self._location = None
+
+    def __str__(self):
+        return "{} on {} mount".format(self.model, self.mount)
+
+    __repr__ = __str__
+
+    def _record(self, name, text, **payload):
+        self._context.record(name, text, pipette=self.mount, **payload)
+
+    def _check_tip(self, command):
+        if not self.has_tip:
+            raise MockProtocolError("{} can't {} without a tip".format(self, command))
+
+    def _move_to(self, location):
+        if location is None:
+            if self._location is None:
+                raise MockProtocolError("{} has no location to work at".format(self))
+            return self._location
+
+        if isinstance(location, Well):
+            location = location.bottom(1.0)
+        self._location = location
+        return location
+
+    def aspirate(self, volume=None, location=None, rate=1.0):
+        self._check_tip("aspirate")
+        location = self._move_to(location)
+        capacity = min(self.max_volume, self._tip_volume)
+        if volume is None:
+            volume = capacity - self.current_volume
+
+        new_volume = round(self.current_volume + volume, 6)
+        if new_volume > capacity:
+            raise MockProtocolError("{} can't aspirate {} uL.  The tip would hold {} uL and only takes {} uL"
+                                    .format(self, volume, new_volume, capacity))
+        if volume < self.min_volume:
+            self._context.warnings.append("{} aspirating {} uL, below its {} uL minimum"
+                                          .format(self, volume, self.min_volume))
+
+        flow = round(self.flow_rate.aspirate * rate, 2)
+        self.current_volume = new_volume
+        self._record("aspirate", "Aspirating {} uL from {} at {} uL/sec".format(float(volume), location, flow),
+                     volume=float(volume), location=location, flow_rate=flow)
+        return self
+
+    def dispense(self, volume=None, location=None, rate=1.0):
+        self._check_tip("dispense")
+        location = self._move_to(location)
+        if volume is None:
+            volume = self.current_volume
+
+        if round(volume - self.current_volume, 6) > 0:
+            raise MockProtocolError("{} can't dispense {} uL.  It only holds {} uL"
+                                    .format(self, volume, self.current_volume))
+
+        flow = round(self.flow_rate.dispense * rate, 2)
+        self.current_volume = round(self.current_volume - volume, 6)
+        self._record("dispense", "Dispensing {} uL into {} at {} uL/sec".format(float(volume), location, flow),
+                     volume=float(volume), location=location, flow_rate=flow)
+        return self
+
+    def mix(self, repetitions=1, volume=None, location=None, rate=1.0):
+        self._check_tip("mix")
+        if volume is None:
+            volume = min(self.max_volume, self._tip_volume)
+
+        self._record("mix", "Mixing {} times with a volume of {} ul".format(repetitions, float(volume)),
+                     repetitions=repetitions, volume=float(volume))
+        self._context.depth += 1
+        try:
+            for i in range(repetitions):
+                self.aspirate(volume, location, rate)
+                self.dispense(volume, None, rate)
+        finally:
+            self._context.depth -= 1
+        return self
+
+    def blow_out(self, location=None):
+        self._check_tip("blow out")
+        location = self._move_to(location)
+        self.current_volume = 0.0
+        text = "Blowing out into {}" if location == TRASH else "Blowing out at {}"
+        self._record("blow_out", text.format(location), location=location, flow_rate=self.flow_rate.blow_out)
+        return self
+
+    @property
+    def trash_container(self):
+        return TRASH
+
+    def air_gap(self, volume=None, height=None):
+        self._check_tip("air gap")
+        if self._location is None or self._location.labware is None:
+            raise MockProtocolError("{} has no well to take an air gap above".format(self))
+
+        well = self._location.labware
+        location = self._move_to(well.top(5 if height is None else height))
+        self._record("air_gap", "Air gap", volume=volume)
+        self._context.depth += 1
+        try:
+            self.aspirate(volume, location)
+        finally:
+            self._context.depth -= 1
+        return self
+
+    def touch_tip(self, location=None, radius=1.0, v_offset=-1.0, speed=60.0):
+        self._check_tip("touch tip")
+        self._move_to(location)
+        self._record("touch_tip", "Touching tip", radius=radius, v_offset=v_offset, speed=speed)
+        return self
+
+    def pick_up_tip(self, location=None):
+        if self.has_tip:
+            raise MockProtocolError("{} already has a tip".format(self))
+
+        if location is None:
+            for tip_rack in self.tip_racks:
+                starting_tip = self.starting_tip if self.starting_tip in tip_rack.wells() else None
+                well = tip_rack.next_tip(self.channels, starting_tip)
+                if well is not None:
+                    location = well
+                    break
+            else:
+                raise MockProtocolError("{} is out of tips".format(self))
+
+        well = location.labware if isinstance(location, Location) else location
+        if not well.parent.is_tiprack or not well.has_tip:
+            raise MockProtocolError("{} has no tip at {}".format(self, well))
+
+        well.parent.use_tips(well, self.channels)
+        self.has_tip = True
+        self.tips_used += self.channels
+        self._tip_volume = well.max_volume
+        self._location = well.top()
+        self._record("pick_up_tip", "Picking up tip from {}".format(well), location=well)
+        return self
+
+    def drop_tip(self, location=None):
+        if not self.has_tip:
+            raise MockProtocolError("{} has no tip to drop".format(self))
+
+        self.has_tip = False
+        self.current_volume = 0.0
+        self._tip_volume = 0
+        self._location = None
+        self._record("drop_tip", "Dropping tip into {}".format(location or TRASH), location=location or TRASH)
+        return self
+
+
+class CSVParameter:
+    """
+    The value of a CSV file runtime parameter.  Like opentrons, a parameter without a file raises an error when it is
+    read.
+    """
+    def __init__(self, file_path):
+        self.file_path = file_path
+
+    def _check_file(self):
+        if self.file_path is None:
+            raise RuntimeParameterRequired("CSV parameter has no file.  Pass a file path in the parameters.")
+
+    @property
+    def file(self):
+        self._check_file()
+        return open(self.file_path)
+
+    @property
+    def contents(self):
+        self._check_file()
+        with open(self.file_path) as csv_file:
+            return csv_file.read()
+
+    def parse_as_csv(self, detect_dialect=True):
+        import csv
+
+        contents = self.contents
+        dialect = csv.Sniffer().sniff(contents) if detect_dialect else csv.excel
+        return list(csv.reader(contents.splitlines(), dialect))
+
+
+class Parameters:
+    """
+    Collects the runtime parameters a protocol's add_parameters defines.  Values default to the parameter default
+    and can be overridden with a dictionary of variable name to value.  CSV file parameters take a file path.
+    """
+    def __init__(self, values=None):
+        self.definitions = {}
+        self._values = dict(values or {})
+
+    def _add(self, kind, variable_name, **definition):
+        self.definitions[variable_name] = dict(definition, type=kind)
+
+    def add_str(self, variable_name, display_name, default, choices=None, description=None):
+        self._add("str", variable_name, display_name=display_name, default=default, choices=choices,
+                  description=description)
+
+    def add_int(self, variable_name, display_name, default, minimum=None, maximum=None, choices=None,
+                description=None, unit=None):
+        self._add("int", variable_name, display_name=display_name, default=default, choices=choices,
+                  description=description, minimum=minimum, maximum=maximum, unit=unit)
+
+    def add_float(self, variable_name, display_name, default, minimum=None, maximum=None, choices=None,
+                  description=None, unit=None):
+        self._add("float", variable_name, display_name=display_name, default=default, choices=choices,
+                  description=description, minimum=minimum, maximum=maximum, unit=unit)
+
+    def add_bool(self, variable_name, display_name, default, description=None):
+        self._add("bool", variable_name, display_name=display_name, default=default, description=description)
+
+    def add_csv_file(self, variable_name, display_name, description=None):
+        self._add("csv_file", variable_name, display_name=display_name, default=None, description=description)
+
+    def values(self):
+        params = {}
+        for variable_name, definition in self.definitions.items():
+            value = self._values.get(variable_name, definition["default"])
+            if definition["type"] == "csv_file":
+                value = CSVParameter(value)
+            params[variable_name] = value
+
+        return SimpleNamespace(**params)
+
+
+class MockProtocolContext:
+    def __init__(self, params=None, labware_path=None):
+        self.params = params or SimpleNamespace()
+        self.labware_path = labware_path
+        self.commands = []
+        self.warnings = []
+        self.depth = 0
+        self.deck = {}
+        self.instruments = {}
+        self.rail_lights_on = False
+        self._index = None
+
+    def is_simulating(self):
+        return True
+
+    def record(self, name, text, **payload):
+        self.commands.append(dict(payload, name=name, text=text, depth=self.depth))
+
+    def comment(self, msg):
+        self.record("comment", msg)
+
+    def delay(self, seconds=0, minutes=0, msg=None):
+        actual_min, actual_sec = divmod(minutes * 60 + seconds, 60)
+        text = "Delaying for {} minutes and {} seconds".format(int(actual_min), round(actual_sec, 3))
+        if msg:
+            text = "{}. {}".format(text, msg)
+        self.record("delay", text, minutes=actual_min, seconds=actual_sec)
+
+    def pause(self, msg=None):
+        text = "Pausing robot operation"
+        if msg:
+            text = "{}: {}".format(text, msg)
+        self.record("pause", text)
+
+    def set_rail_lights(self, on):
+        self.rail_lights_on = bool(on)
+
+    def home(self):
+        self.record("home", "Homing")
+
+    def load_definition(self, load_name):
+        """
+        Find a labware definition.  Custom labware first, then the Opentrons library if installed, then the standard
+        labware defined here.
+        @param load_name:
+        @return:
+        """
+        if self._index is None:
+            labware_path, cache_path = Labware_Index.default_paths()
+            self._index = Labware_Index.build_index(self.labware_path or labware_path, cache_path)
+            self._cache_path = cache_path
+
+        if load_name in self._index:
+            with open(os.path.join(self._cache_path, self._index[load_name]["folder"], "definition.json")) as labware:
+                return json.load(labware)
+
+        try:
+            from opentrons_shared_data.labware import load_definition
+            return load_definition(load_name, 1)
+        except (ImportError, FileNotFoundError, ValueError):
+            pass
+
+        if load_name in STANDARD_LABWARE:
+            return standard_definition(load_name)
+
+        raise MockProtocolError("No labware definition found for {}".format(load_name))
+
+    def load_labware(self, load_name, location, label=None, namespace=None, version=None):
+        slot = str(location)
+        if slot not in SLOT_ORIGINS or slot == "12":
+            raise MockProtocolError("{} is not a deck slot".format(slot))
+        if slot in self.deck:
+            raise MockProtocolError("Slot {} already has {}".format(slot, self.deck[slot]))
+
+        self.deck[slot] = Labware(self.load_definition(load_name), slot, label)
+        return self.deck[slot]
+
+    def load_instrument(self, instrument_name, mount, tip_racks=None, replace=False):
+        if mount in self.instruments and not replace:
+            raise MockProtocolError("The {} mount already has {}".format(mount, self.instruments[mount]))
+
+        self.instruments[mount] = InstrumentContext(self, instrument_name, mount, tip_racks)
+        return self.instruments[mount]
+
+    def command_counts(self):
+        counts = defaultdict(int)
+        for command in self.commands:
+            counts[command["name"]] += 1
+        return dict(counts)
+
+
+def format_runlog(commands):
+    """
+    Format the recorded commands like opentrons.simulate.format_runlog.  Commands inside a mix are indented.
+    @param commands:
+    @return:
+    """
+    return "\n".join("\t" * command["depth"] + command["text"] for command in commands)
+
+
+def protocol_api_shim():
+    """
+    Modules that stand in for opentrons and opentrons.protocol_api while a protocol is imported.
+    @return: Dictionary of module name to module.
+    """
+    opentrons = ModuleType("opentrons")
+    protocol_api = ModuleType("opentrons.protocol_api")
+    types = ModuleType("opentrons.types")
+    protocols = ModuleType("opentrons.protocols")
+    parameters = ModuleType("opentrons.protocols.parameters")
+    exceptions = ModuleType("opentrons.protocols.parameters.exceptions")
+
+    protocol_api.ProtocolContext = MockProtocolContext
+    protocol_api.InstrumentContext = InstrumentContext
+    protocol_api.Labware = Labware
+    protocol_api.Well = Well
+    protocol_api.Parameters = Parameters
+    types.Point = Point
+    types.Location = Location
+    exceptions.RuntimeParameterRequired = RuntimeParameterRequired
+    opentrons.protocol_api = protocol_api
+    opentrons.types = types
+    opentrons.protocols = protocols
+    protocols.parameters = parameters
+    parameters.exceptions = exceptions
+
+    return {"opentrons": opentrons, "opentrons.protocol_api": protocol_api, "opentrons.types": types,
+            "opentrons.protocols": protocols, "opentrons.protocols.parameters": parameters,
+            "opentrons.protocols.parameters.exceptions": exceptions}
+
+
+def load_protocol(protocol_file):
+    """
+    Import a protocol file with the mock opentrons modules in place of the real ones.
+    @param protocol_file:
+    @return:
+    """
+    shim = protocol_api_shim()
+    saved_modules = {name: sys.modules.get(name) for name in shim}
+    sys.modules.update(shim)
+    try:
+        spec = importlib.util.spec_from_file_location("mock_protocol_{}".format(id(shim)), protocol_file)
+        protocol = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(protocol)
+    finally:
+        for name, module in saved_modules.items():
+            if module is None:
+                sys.modules.pop(name, None)
+            else:
+                sys.modules[name] = module
+
+    return protocol
+
+
+def simulate(protocol_file=None, parameters=None, labware_path=None, tsv_file=None):
+    """
+    Run a protocol against the mock context.
+    @param protocol_file: Defaults to PCR.py next to this file.
+    @param parameters: Dictionary of runtime parameter values to use instead of the defaults.
+    @param labware_path: Custom labware folder.
+    @param tsv_file: TSV file to run.  Passed to PCR.py in PCR_TSV_FILE.  Without it PCR.py reads its TSV file from
+    where it always does.
+    @return: The MockProtocolContext with the recorded commands.
+    """
+    if protocol_file is None:
+        protocol_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "PCR.py")
+
+    saved_tsv_file = os.environ.get("PCR_TSV_FILE")
+    if tsv_file is not None:
+        os.environ["PCR_TSV_FILE"] = os.path.abspath(tsv_file)
+
+    try:
+        protocol = load_protocol(protocol_file)
+        runtime_parameters = Parameters(parameters)
+        if hasattr(protocol, "add_parameters"):
+            protocol.add_parameters(runtime_parameters)
+
+        context = MockProtocolContext(runtime_parameters.values(), labware_path)
+        protocol.run(context)
+    finally:
+        if saved_tsv_file is None:
+            os.environ.pop("PCR_TSV_FILE", None)
+        else:
+            os.environ["PCR_TSV_FILE"] = saved_tsv_file
+
+    return context
+
+
+# Standard Opentrons labware used with PCR.py, for when opentrons_shared_data is not installed.
+# Load name: (display name, format, rows, columns, well definition, first well x, first well y, z dimension)
+STANDARD_LABWARE = \
+    {"opentrons_96_tiprack_10ul":
+        ("Opentrons OT-2 96 Tip Rack 10 µL", "96Standard", 8, 12,
+         {"depth": 39.2, "shape": "circular", "diameter": 3.27, "totalLiquidVolume": 10, "z": 25.49},
+         14.38, 74.24, 64.69),
+     "opentrons_96_tiprack_20ul":
+        ("Opentrons OT-2 96 Tip Rack 20 µL", "96Standard", 8, 12,
+         {"depth": 39.2, "shape": "circular", "diameter": 3.27, "totalLiquidVolume": 20, "z": 25.49},
+         14.38, 74.24, 64.69),
+     "opentrons_96_filtertiprack_20ul":
+        ("Opentrons OT-2 96 Filter Tip Rack 20 µL", "96Standard", 8, 12,
+         {"depth": 39.2, "shape": "circular", "diameter": 3.27, "totalLiquidVolume": 20, "z": 25.49},
+         14.36, 74.26, 64.69),
+     "opentrons_96_tiprack_300ul":
+        ("Opentrons OT-2 96 Tip Rack 300 µL", "96Standard", 8, 12,
+         {"depth": 59.3, "shape": "circular", "diameter": 5.23, "totalLiquidVolume": 300, "z": 5.39},
+         14.38, 74.24, 64.49),
+     "opentrons_96_filtertiprack_200ul":
+        ("Opentrons OT-2 96 Filter Tip Rack 200 µL", "96Standard", 8, 12,
+         {"depth": 59.3, "shape": "circular", "diameter": 5.23, "totalLiquidVolume": 200, "z": 5.39},
+         14.38, 74.24, 64.49),
+     "nest_12_reservoir_15ml":
+        ("NEST 12 Well Reservoir 15 mL", "trough", 1, 12,
+         {"depth": 26.85, "shape": "rectangular", "xDimension": 8.2, "yDimension": 71.2, "totalLiquidVolume": 15000,
+          "z": 4.55},
+         14.38, 42.78, 31.4)}
+
+
+def standard_definition(load_name):
+    """
+    Build the labware definition for one of the STANDARD_LABWARE entries.  Wells are on a 9 mm grid.
+    @param load_name:
+    @return:
+    """
+    display_name, labware_format, rows, columns, well_definition, x, y, z_dimension = STANDARD_LABWARE[load_name]
+    row_labels = "ABCDEFGHIJKLMNOP"
+    ordering = [["{}{}".format(row_labels[r], c + 1) for r in range(rows)] for c in range(columns)]
+
+    wells = {}
+    for c, column in enumerate(ordering):
+        for r, well_name in enumerate(column):
+            wells[well_name] = dict(well_definition, x=round(x + 9 * c, 2), y=round(y - 9 * r, 2))
+
+    parameters = {"format": labware_format, "isTiprack": "tiprack" in load_name, "loadName": load_name}
+    if parameters["isTiprack"]:
+        parameters["tipLength"] = well_definition["depth"]
+
+    return {"parameters": parameters, "wells": wells, "ordering": ordering,
+            "metadata": {"displayName": display_name},
+            "dimensions": {"xDimension": 127.76, "yDimension": 85.48, "zDimension": z_dimension},
+            "cornerOffsetFromSlot": {"x": 0, "y": 0, "z": 0}}
+
+
+if __name__ == "__main__":
+    start_time = time.perf_counter()
+    protocol_context = simulate(sys.argv[1] if len(sys.argv) > 1 else None)
+    elapsed = time.perf_counter() - start_time
+
+    print(format_runlog(protocol_context.commands))
+    print("\n{} commands in {} ms".format(len(protocol_context.commands), round(elapsed * 1000)))
+    for pipette in protocol_context.instruments.values():
+        print("{} used {} tips".format(pipette, pipette.tips_used))
+    for warning in protocol_context.warnings:
+        print("Warning: {}".format(warning))
@@ -9,18 +9,26 @@ email: dennis@email.unc.edu
 Copyright:  2025
 """
 
+import asyncio
+import concurrent.futures
 import datetime
+import glob
 import os
+import re
 import csv
+import json
 import platform
 from distutils.util import strtobool
 import serial
+import threading
 import time
 from types import SimpleNamespace
 from contextlib import suppress
-from collections import defaultdict
+from collections import defaultdict, deque, OrderedDict
 from opentrons import protocol_api
+from opentrons.protocols.parameters.exceptions import RuntimeParameterRequired
 import math
+import numpy as np
 # import Tool_Box
 
 # metadata
@@ -33,135 +41,477 @@ metadata = {
 # requirements
 requirements = {"robotType": "OT-2", "apiLevel": "2.20"}
 
+# Pipetting settings for each kind of liquid.  Rates are multiples of the pipette default flow rates.  Delays are in
+# seconds after the aspirate or dispense and the air gap is in uL.  blow_out is where a transfer blows out:
+# destination, source, trash or blank for none.  A distribute puts its disposal volume back in the source unless
+# blow_out is trash.  mix_reps is the most mix repetitions, 0 for no mixing.  The mixing planner uses the fewest
+# repetitions that leave no more than mix_target of the well unmixed, drawing up to mix_fraction of the well, and
+# slows the mix so a stroke takes at least mix_stroke_time seconds.  These can be changed with a LiquidClasses.json
+# file or a --LiquidClass_<name> line in the TSV file.
+LIQUID_CLASSES = \
+    {"water": {"aspirate_rate": 1.0, "dispense_rate": 1.0, "blow_out_rate": 1.0, "mix_reps": 0, "mix_rate": 1.0,
+               "mix_target": 0.1, "mix_fraction": 0.7, "mix_stroke_time": 0.5, "touch_tip": False,
+               "touch_speed": 20.0, "blow_out": "destination", "air_gap": 0.0, "aspirate_delay": 0.0,
+               "dispense_delay": 0.0},
+     "master_mix": {"aspirate_rate": 0.5, "dispense_rate": 0.5, "blow_out_rate": 0.5, "mix_reps": 0,
+                    "mix_rate": 1.0, "mix_target": 0.1, "mix_fraction": 0.7, "mix_stroke_time": 0.5,
+                    "touch_tip": True, "touch_speed": 10.0, "blow_out": "destination", "air_gap": 0.0,
+                    "aspirate_delay": 0.5, "dispense_delay": 0.0},
+     "dna": {"aspirate_rate": 0.75, "dispense_rate": 0.75, "blow_out_rate": 1.0, "mix_reps": 6, "mix_rate": 2.0,
+             "mix_target": 0.1, "mix_fraction": 0.7, "mix_stroke_time": 0.5, "touch_tip": True,
+             "touch_speed": 10.0, "blow_out": "destination", "air_gap": 0.0, "aspirate_delay": 0.0,
+             "dispense_delay": 0.0},
+     "glycerol_primer": {"aspirate_rate": 0.3, "dispense_rate": 0.3, "blow_out_rate": 0.5, "mix_reps": 0,
+                         "mix_rate": 1.0, "mix_target": 0.1, "mix_fraction": 0.7, "mix_stroke_time": 1.0,
+                         "touch_tip": True, "touch_speed": 10.0, "blow_out": "destination", "air_gap": 0.0,
+                         "aspirate_delay": 1.0, "dispense_delay": 0.5}
+     }
+
 
 def add_parameters(parameters: protocol_api.Parameters):
 
     """
-    Parse the TSV file and fill in some parameter information.  This is duplicated from Utilities.  I don't know
-    another method to pass the information when on the robot.
+    Define the runtime parameters.  The sample sheet is a CSV file parameter and the Opentrons app requires it.  Its
+    contents are not available until the run so the run label only carries the date and time.  ProcedureFile.tsv is
+    only a fallback for simulations.
     @param parameters:
     """
-    # TSV file location on OT-2
-    tsv_file_path = "{0}var{0}lib{0}jupyter{0}notebooks{0}ProcedureFile.tsv".format(os.sep)
-
-    # If not on the OT-2, get temp TSV file location on Windows Computers for simulation
-    if not os.path.isfile(tsv_file_path):
-        tsv_file_path = "C:{0}Users{0}{1}{0}Documents{0}TempTSV.tsv".format(os.sep, os.getlogin())
-
-    line_num = 0
-    options_dictionary = defaultdict(str)
-    sample_dictionary = defaultdict(list)
-    index_file = list(csv.reader(open(tsv_file_path), delimiter='\t'))
-
-    for line in index_file:
-        if line_num == 0:
-            options_dictionary["Version"] = line[1]
-            options_dictionary["Template"] = line[0].strip("#")
-        line_num += 1
-        col_count = len(line)
-        tmp_line = []
-        sample_key = ""
-        if col_count > 0 and "#" not in line[0] and len(line[0].split("#")[0]) > 0:
-            # Skip any lines that are blank or comments.
-            for i in range(7):
-                try:
-                    line[i] = line[i].split("#")[0]  # Strip out end-of-line comments.
-                except IndexError:
-                    continue
+    parameters.add_csv_file(
+        variable_name="sample_sheet",
+        display_name="Sample Sheet",
+        description="Setup file from the PCR GUI.  Required to run."
+    )
 
-                if i == 0 and "--" in line[0]:
-                    key = line[0].strip('--')
-                    key_value = line[1]
-                    if "Target_" in key or "PositiveControl_" in key:
-                        try:
-                            key_value = (line[1], line[2], line[3])
-                        except IndexError:
-                            pass
-                    options_dictionary[key] = key_value
-                elif "--" not in line[0] and int(line[0]) < 12:
-                    sample_key = line[0], line[1]
-                    tmp_line.append(line[i])
-            if sample_key:
-                sample_dictionary[sample_key] = tmp_line
-
-    args = SimpleNamespace(**options_dictionary)
-
-    # We have limited space for the run_label.  To make sure the label is unique, I use the unix timestamp for the run_date.
-    run_date = datetime.datetime.today().strftime("%f")
-    if "Illumina_Dual_Indexing" in args.Template:
-        run_type = "Dual_Indexing"
-    else:
-        run_type = args.Template.split(" ")[1]
+    # We have limited space for the run_label.  The date and time to the second keep it unique.
+    run_label = "PCR {}".format(datetime.datetime.today().strftime("%y%m%d %H%M%S"))
 
     # This is used by the Opentrons app to make each run unique.
     parameters.add_str(
         variable_name="run_label",
-        display_name="{} {} {}".format(run_type, args.User, run_date),
+        display_name=run_label,
         choices=[
-            {"display_name": "Run Label", "value": "{} {} {}".format(run_type, args.User, run_date)},],
-        default="{} {} {}".format(run_type, args.User, run_date),
+            {"display_name": "Run Label", "value": run_label},],
+        default=run_label,
     )
 
     parameters.add_str(
         variable_name="left_pipette",
-        display_name="Left Pipette".format(run_type, args.User, run_date),
+        display_name="Left Pipette",
         choices=[
             {"display_name": "P20 Single Gen2", "value": "p20_single_gen2"},
-            {"display_name": "P300 Single Gen2", "value": "p300_single_gen2"},],
+            {"display_name": "P300 Single Gen2", "value": "p300_single_gen2"},
+            {"display_name": "P20 8-Channel Gen2", "value": "p20_multi_gen2"},
+            {"display_name": "P300 8-Channel Gen2", "value": "p300_multi_gen2"},],
         default="p300_single_gen2",
     )
 
     parameters.add_str(
         variable_name="right_pipette",
-        display_name="Right Pipette".format(run_type, args.User, run_date),
+        display_name="Right Pipette",
         choices=[
             {"display_name": "P20 Single Gen2", "value": "p20_single_gen2"},
-            {"display_name": "P300 Single Gen2", "value": "p300_single_gen2"},],
+            {"display_name": "P300 Single Gen2", "value": "p300_single_gen2"},
+            {"display_name": "P20 8-Channel Gen2", "value": "p20_multi_gen2"},
+            {"display_name": "P300 8-Channel Gen2", "value": "p300_multi_gen2"},],
         default="p20_single_gen2",
     )
 
-    """   
-    parameters.add_csv_file(
-        variable_name="dragons_run",
-        display_name="Dragon Hunting",
-        description="Looking to initialize Opentrons csv commands."
-    )
+
+def parameter_file_path():
+    """
+    Return the TSV file location.  The PCR_TSV_FILE environment variable can point simulations at another file.
+    @return:
+    """
+    tsv_file_path = os.environ.get("PCR_TSV_FILE", "")
+    if os.path.isfile(tsv_file_path):
+        return tsv_file_path
+
+    # TSV file location on OT-2
+    tsv_file_path = "{0}var{0}lib{0}jupyter{0}notebooks{0}ProcedureFile.tsv".format(os.sep)
+
+    # If not on the OT-2, get temp TSV file location on Windows Computers for simulation
+    if not os.path.isfile(tsv_file_path):
+        tsv_file_path = "C:{0}Users{0}{1}{0}Documents{0}TempTSV.tsv".format(os.sep, os.getlogin())
+
+    return tsv_file_path
+
+
+def liquid_class_file_path():
+    """
+    Return the liquid class file or None if there isn't one.  PCR_LIQUID_CLASS_FILE can point at another file.
+    @return:
+    """
+    for file_path in (os.environ.get("PCR_LIQUID_CLASS_FILE", ""),
+                      "{0}var{0}lib{0}jupyter{0}notebooks{0}LiquidClasses.json".format(os.sep)):
+        if os.path.isfile(file_path):
+            return file_path
+
+    return None
+
+
+def cold_plate_model_file_path():
+    """
+    Return the cold plate ramp model file from Cold_Plate_Calibration.py or None if there isn't one.
+    PCR_COLD_PLATE_MODEL_FILE can point at another file.
+    @return:
+    """
+    for file_path in (os.environ.get("PCR_COLD_PLATE_MODEL_FILE", ""),
+                      "{0}var{0}lib{0}jupyter{0}notebooks{0}ColdPlateModels.json".format(os.sep)):
+        if os.path.isfile(file_path):
+            return file_path
+
+    return None
+
+
+def cold_plate_ports():
+    """
+    Return the serial ports listed in PCR_COLD_PLATE_PORT, separated by commas, or [] to find the plates on the USB
+    serial ports.  Pointing this at Cold_Plate_Emulator.py lets a simulation talk to emulated plates.
+    @return:
+    """
+    return [port.strip() for port in os.environ.get("PCR_COLD_PLATE_PORT", "").split(",") if port.strip()]
+
+
+def cold_plate_manager(protocol, block_names):
+    """
+    Connect a cold plate for each block.  The ports come from PCR_COLD_PLATE_PORT in order.  Without it a run finds
+    the plates on the USB serial ports and a simulation uses dummy plates.
+    @param protocol:
+    @param block_names:
+    @return: ColdPlateManager
+    """
+    ports = cold_plate_ports()
+    if ports or protocol.is_simulating():
+        ports += [None] * (len(block_names) - len(ports))
+        return ColdPlateManager(protocol, dict(zip(block_names, ports)))
+
+    return ColdPlateManager.discover(protocol, block_names)
+
+
+def liquid_class_settings(name, settings, source):
+    """
+    Check and convert the settings for one liquid class.
+    @param name: Liquid class name.
+    @param settings: Dictionary of setting: value.  Values can be text.
+    @param source: Where the settings came from, for error messages.
+    @return:
+    """
+    converted = {}
+    for setting, value in settings.items():
+        setting = setting.strip()
+        if setting not in LIQUID_CLASSES["water"]:
+            raise Exception("{} liquid class {} has no setting {}".format(source, name, setting))
+
+        setting_type = type(LIQUID_CLASSES["water"][setting])
+        converted[setting] = \
+            ProcedureSettings.convert("LiquidClass_{} {}".format(name, setting), str(value).strip(), setting_type)
+
+    if converted.get("blow_out", "destination") not in ("destination", "source", "trash", ""):
+        raise Exception("{} liquid class {} blow_out must be destination, source, trash or blank, not {}"
+                        .format(source, name, converted["blow_out"]))
+
+    return converted
+
+
+def load_liquid_classes(args):
+    """
+    Build the liquid classes.  The built in ones are changed by the liquid class file and then by the TSV file.
+    Classes that are not built in start from water.
+    @param args:
+    @return: Dictionary of name: SimpleNamespace of settings
+    """
+    liquid_classes = {name: dict(settings) for name, settings in LIQUID_CLASSES.items()}
+    changes = []
+
+    liquid_class_file = liquid_class_file_path()
+    if liquid_class_file:
+        with open(liquid_class_file) as json_file:
+            for name, settings in json.load(json_file).items():
+                changes.append((name, liquid_class_settings(name, settings, liquid_class_file)))
+
+    changes.extend(args.liquid_classes.items())
+
+    for name, settings in changes:
+        liquid_classes.setdefault(name, dict(LIQUID_CLASSES["water"])).update(settings)
+
+    return {name: SimpleNamespace(name=name, **settings) for name, settings in liquid_classes.items()}
+
+
+class ProcedureSettings:
+    """
+    The -- settings from the TSV file converted to their types once when the file is read.  Settings that are not
+    in FIELDS, like the index primer wells, are kept as text and can be read as attributes.  --LiquidClass_<name>
+    lines hold setting=value pairs separated by commas or tabs.
+    """
+    # Setting: type.  Missing numbers are None, missing text is "".
+    FIELDS = \
+        {"Version": str, "Template": str, "User": str, "LeftPipetteFirstTip": str, "RightPipetteFirstTip": str,
+         "BottomOffset": float, "UseTemperatureModule": bool, "Temperature": float, "PCR_PlateSlot": str,
+         "DilutionPlateSlot": str, "ReagentSlot": str, "IndexPrimerSlot": str, "DNA_in_Reaction": float,
+         "PCR_Volume": float, "MasterMixPerRxn": float, "WaterResWell": str, "WaterResVol": float,
+         "PCR_ReagentWell": str, "TotalReagentVolume": float, "TemperatureLogInterval": float,
+         "ReagentTemperature": float}
+
+    __slots__ = tuple(FIELDS) + ("labware_slots", "targets", "liquid_classes", "extra")
+
+    def __init__(self):
+        for field, field_type in self.FIELDS.items():
+            setattr(self, field, "" if field_type is str else None)
+        self.UseTemperatureModule = False
+
+        # Slot number as a string: labware load name
+        self.labware_slots = {str(i + 1): "" for i in range(11)}
+
+        # Target number: (name, reagent well, reagent volume).  Targets left blank in the file are "".
+        self.targets = {}
+
+        # Liquid class name: {setting: value} for the settings the TSV file changes.
+        self.liquid_classes = {}
+        self.extra = {}
+
+    def __getattr__(self, name):
+        try:
+            return self.extra[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def set(self, key, values):
+        """
+        Convert and store one setting.
+        @param key: Setting name without the --
+        @param values: The values that followed it on the line.
+        """
+        value = values[0].strip() if values else ""
+
+        if key.startswith("Slot") and key[4:] in self.labware_slots:
+            self.labware_slots[key[4:]] = value
+        elif key.startswith("LiquidClass_"):
+            settings = {}
+            for pair in ",".join(values).split(","):
+                if not pair.strip():
+                    continue
+                if "=" not in pair:
+                    raise Exception("--{} settings must be setting=value, not {}".format(key, pair.strip()))
+                setting, setting_value = pair.split("=", 1)
+                settings[setting] = setting_value
+            self.liquid_classes[key[len("LiquidClass_"):]] = liquid_class_settings(key[len("LiquidClass_"):],
+                                                                                   settings, "--{}".format(key))
+        elif "Target_" in key or "PositiveControl_" in key:
+            if "Illumina_Dual_Indexing" in self.Template:
+                self.extra[key] = value
+                return
+
+            name, well, volume = (list(values) + ["", "", ""])[:3]
+            if not any(v.strip() for v in (name, well, volume)):
+                target = ""
+            else:
+                target = (name, well, self.convert(key, volume, float) if volume.strip() else None)
+
+            if "Target_" in key:
+                self.targets[int(key.split("_")[1])] = target
+            else:
+                self.extra[key] = target
+        elif key in self.FIELDS:
+            if value:
+                setattr(self, key, self.convert(key, value, self.FIELDS[key]))
+        else:
+            self.extra[key] = value
+
+    @staticmethod
+    def convert(key, value, field_type):
+        try:
+            if field_type is bool:
+                return bool(strtobool(value))
+            return field_type(value)
+        except ValueError:
+            expected = {bool: "True or False", float: "a number", int: "a whole number"}[field_type]
+            raise Exception("--{} must be {}, not {}".format(key, expected, value))
+
+
+class Sample:
+    """
+    One line of the sample table.  Targets are the comma separated target numbers, or the index primer pair for
+    Illumina_Dual_Indexing.
+    """
+    __slots__ = ("slot", "well", "name", "concentration", "targets", "replicates", "template_in_rxn")
+
+    def __init__(self, values, line_num):
+        values = [value.strip() for value in values] + [""] * (7 - len(values))
+        self.slot, self.well, self.name = values[0:3]
+        self.targets = values[4].split(",")
+
+        try:
+            self.concentration = float(values[3])
+            self.replicates = int(values[5]) if values[5] else 1
+            self.template_in_rxn = float(values[6]) if values[6] else None
+        except ValueError:
+            raise Exception("Sample {} on line {} of the TSV file has a value that is not a number"
+                            .format(self.name, line_num))
+
+
+# TSV file name: ((modification time, size), settings, samples)
+_procedure_files = {}
+
+
+def sample_sheet_contents(protocol):
+    """
+    Return the text of the sample sheet runtime parameter or "" if no file was given.  Only simulations can run
+    without one.  A run on the robot must not fall back to a ProcedureFile.tsv left from an earlier run.
+    @param protocol:
+    @return:
+    """
+    sample_sheet = getattr(protocol.params, "sample_sheet", None)
+    if sample_sheet is None:
+        return ""
+
+    try:
+        return sample_sheet.contents
+    except RuntimeParameterRequired:
+        if not protocol.is_simulating():
+            raise
+        return ""
+
+
+def read_procedure_text(contents):
+    """
+    Parse the sample sheet from the runtime parameter.  Our GUI writes it tab delimited.  If it was saved as a comma
+    delimited CSV file instead that is read too.
+    @param contents:
+    @return: ProcedureSettings and a dictionary of (slot, well): Sample
+    """
+    first_line = contents.split("\n", 1)[0]
+    delimiter = '\t' if '\t' in first_line or ',' not in first_line else ','
+
+    return parse_procedure_lines(csv.reader(contents.splitlines(), delimiter=delimiter))
+
+
+def read_procedure_file(tsv_file_path):
+    """
+    Parse the TSV file into the settings and the sample table in one pass.  The result is kept for as long as the
+    file is unchanged so it is only parsed once.
+    @param tsv_file_path:
+    @return: ProcedureSettings and a dictionary of (slot, well): Sample
+    """
+    file_stat = os.stat(tsv_file_path)
+    file_version = (file_stat.st_mtime_ns, file_stat.st_size)
+    if tsv_file_path in _procedure_files and _procedure_files[tsv_file_path][0] == file_version:
+        return _procedure_files[tsv_file_path][1:]
+
+    with open(tsv_file_path) as tsv_file:
+        settings, samples = parse_procedure_lines(csv.reader(tsv_file, delimiter='\t'))
+
+    _procedure_files[tsv_file_path] = (file_version, settings, samples)
+
+    return settings, samples
+
+
+def parse_procedure_lines(lines):
+    """
+    Parse the lines of a TSV file.
+    @param lines: Lists of column values.
+    @return: ProcedureSettings and a dictionary of (slot, well): Sample
     """
+    settings = ProcedureSettings()
+    samples = {}
+
+    for line_num, line in enumerate(lines):
+        if line_num == 0:
+            settings.Version = line[1] if len(line) > 1 else ""
+            settings.Template = line[0].strip("#")
+
+        # Skip any lines that are blank or comments and strip out end-of-line comments.
+        if not line or "#" in line[0] or not line[0].split("#")[0]:
+            continue
+        line = [value.split("#")[0] for value in line[:7]]
+
+        if "--" in line[0]:
+            settings.set(line[0].strip('--'), line[1:])
+        elif int(line[0]) < 12:
+            samples[line[0], line[1]] = Sample(line, line_num + 1)
 
+    return settings, samples
 
-def calculate_volumes(args, sample_concentration, template_in_rxn):
+
+def calculate_volumes(args, sample_concentrations, templates_in_rxn, max_step_dilution=100, well_counts=None,
+                      min_volume=1.0, max_step_volume=None):
     """
-    Calculates volumes for dilution and distribution of sample.
-    Returns a list of tuples consisting of
-    (uL of sample to dilute, uL of water for dilution), (uL of diluted sample in reaction, uL of water in reaction)
+    Calculates volumes for dilution and distribution of all the samples in one pass.
+    A 1:d dilution puts d*template_in_rxn/sample_concentration uL of diluted sample in the reaction.  We want at least
+    2 uL of that per well so the smallest even dilution is 2*ceil(sample_concentration/template_in_rxn).  Anything
+    larger than max_step_dilution is done as a serial dilution using the same even dilution for each step.
+
+    Each step makes enough diluted sample for the sample's wells plus 3 more.  The sample moved in each step is never
+    less than min_volume so the pipette can move it, with the diluent scaled to match.
+
+    Returns a tuple of arrays
+    (uL of sample to dilute, uL of water for dilution, uL of diluted sample in reaction, uL of water in reaction,
+    total dilution, dilution steps) and the max template volume.  The sample and water for dilution are per step.
 
     :param args:
-    :param sample_concentration:
-    :param template_in_rxn:
+    :param sample_concentrations:
+    :param templates_in_rxn:
+    :param max_step_dilution:
+    :param well_counts: Number of reaction wells for each sample.  None makes 1 uL of sample per step.
+    :param min_volume: Smallest volume the pipettes can move.
+    :param max_step_volume: Most a dilution well holds.  None for no limit.
     :return:
     """
 
-    max_template_vol = round(float(args.PCR_Volume)-float(args.MasterMixPerRxn), ndigits=1)
+    max_template_vol = round(args.PCR_Volume-args.MasterMixPerRxn, ndigits=1)
+    sample_concentrations = np.asarray(sample_concentrations, dtype=float)
+    templates_in_rxn = np.asarray(templates_in_rxn, dtype=float)
+    neat_vol = templates_in_rxn/sample_concentrations
 
     # If at least 2 uL of sample is needed then no dilution is necessary
-    if template_in_rxn/sample_concentration >= 2:
-        sample_vol = round(template_in_rxn/sample_concentration, ndigits=1)
-        return sample_vol, 0, 0, max_template_vol-sample_vol, max_template_vol
+    neat = neat_vol >= 2
+
+    # Smallest dilution that still gives 2 uL of diluted sample in the reaction.  The 1e-9 keeps floating point noise
+    # from pushing us up a step.
+    min_dilution = np.where(neat, 1, 2/neat_vol)
+    steps = np.where(neat, 0, np.maximum(1, np.ceil(np.log(min_dilution)/np.log(max_step_dilution) - 1e-9)))
+    step_dilution = \
+        np.where(neat, 1, 2*np.ceil(min_dilution**(1/np.maximum(steps, 1))/2 - 1e-9))
+    dilution = step_dilution**steps
+
+    diluted_sample_vol = np.where(neat, 0, np.round(neat_vol*dilution, 1))
+    if well_counts is None:
+        step_sample_vol = np.ones_like(neat_vol)
+    else:
+        # Rounded up to 0.1 uL so the step never makes less than the wells need.
+        step_sample_vol = \
+            np.ceil(diluted_sample_vol*(np.asarray(well_counts, dtype=float) + 3)/step_dilution*10 - 1e-9)/10
+    step_sample_vol = np.maximum(step_sample_vol, min_volume)
 
-    # This will test a series of dilutions up to a 1:200.
-    for i in range(50):
-        dilution = (i+1)*2
-        diluted_dna_conc = sample_concentration/dilution
+    sample_vol = np.where(neat, np.round(neat_vol, 1), step_sample_vol)
+    diluent_vol = np.where(neat, 0, np.round(step_sample_vol*(step_dilution - 1), 1))
+    reaction_water_vol = max_template_vol - np.where(neat, sample_vol, diluted_sample_vol)
 
-        # Want to pipette at least 2 uL of diluted sample per well
-        if 2 <= template_in_rxn/diluted_dna_conc <= max_template_vol:
-            diluted_sample_vol = round(template_in_rxn/diluted_dna_conc, ndigits=1)
-            reaction_water_vol = max_template_vol-diluted_sample_vol
+    for i in np.flatnonzero(reaction_water_vol < 0):
+        raise Exception("{} ng of template does not fit in {} uL from a {} ng/uL sample"
+                        .format(templates_in_rxn[i], max_template_vol, sample_concentrations[i]))
 
-            return 1, dilution - 1, diluted_sample_vol, reaction_water_vol, max_template_vol
+    if max_step_volume is not None:
+        for i in np.flatnonzero(~neat & (sample_vol + diluent_vol > max_step_volume)):
+            raise Exception("A 1:{} dilution step for the {} ng/uL sample needs {} uL of sample, with a {} uL pipette "
+                            "minimum, and {} uL of diluent.  That is more than the {} uL a dilution well holds"
+                            .format(int(step_dilution[i]), sample_concentrations[i], sample_vol[i], min_volume,
+                                    diluent_vol[i], max_step_volume))
 
+    return (sample_vol, diluent_vol, diluted_sample_vol, reaction_water_vol, dilution, steps.astype(int)), \
+        max_template_vol
 
-def sample_processing(args, sample_parameters, target_info_dict, utility):
+
+def sample_processing(args, sample_parameters, target_info_dict, utility, min_volume=1.0, max_step_volume=None):
+    """
+    Work out the sample, dilution and water volumes and where every reaction goes on the plate.
+    @param args:
+    @param sample_parameters:
+    @param target_info_dict:
+    @param utility:
+    @param min_volume: Smallest volume the single channel pipettes can move.
+    @param max_step_volume: Most a dilution well holds.
+    @return:
+    """
     sample_data_dict = defaultdict(list)
     target_well_dict = defaultdict(list)
     water_well_dict = defaultdict(float)
@@ -170,32 +520,43 @@ def sample_processing(args, sample_parameters, target_info_dict, utility):
     dest_well_count = 0
     target_list = []
 
-    for sample_key in sample_parameters:
-        sample_name = sample_parameters[sample_key][2]
-        sample_concentration = float(sample_parameters[sample_key][3])
-
+    # Solve the dilutions for every sample at once.
+    sample_concentrations = []
+    templates_in_rxn = []
+    well_counts = []
+    for sample in sample_parameters.values():
+        sample_concentrations.append(sample.concentration)
         if "Illumina_Dual_Indexing" in args.Template:
-            # Extract indices.  Always going to be two values.
-            # sample_targets = sample_parameters[sample_key][4].split("+")
-            sample_targets = [sample_parameters[sample_key][4]]
-            replicates = 1
+            well_counts.append(len(sample.targets))
         else:
-            sample_targets = sample_parameters[sample_key][4].split(",")
-            replicates = int(sample_parameters[sample_key][5])
+            well_counts.append(len(sample.targets) * sample.replicates)
 
         # Generic PCR allows different amounts of DNA in each reaction.
         if "Generic PCR" in args.Template:
-            template_in_rxn = float(sample_parameters[sample_key][6])
+            templates_in_rxn.append(sample.template_in_rxn)
+        else:
+            templates_in_rxn.append(args.DNA_in_Reaction)
+
+    volumes, max_template_vol = calculate_volumes(args, sample_concentrations, templates_in_rxn,
+                                                  well_counts=well_counts, min_volume=min_volume,
+                                                  max_step_volume=max_step_volume)
+
+    for sample_index, (sample_key, sample) in enumerate(sample_parameters.items()):
+        sample_name = sample.name
+
+        # For Illumina_Dual_Indexing the target is the index primer pair.
+        sample_targets = sample.targets
+        if "Illumina_Dual_Indexing" in args.Template:
+            replicates = 1
         else:
-            template_in_rxn = float(args.DNA_in_Reaction)
+            replicates = sample.replicates
 
-        # sample_string = sample_name
-        ucv = calculate_volumes(args, sample_concentration, template_in_rxn)
-        sample_vol = round(ucv[0], ndigits=1)
-        diluent_vol = round(ucv[1], ndigits=1)
-        diluted_sample_vol = round(ucv[2], ndigits=1)
-        reaction_water_vol = ucv[3]
-        max_template_vol = ucv[4]
+        sample_vol = round(float(volumes[0][sample_index]), ndigits=1)
+        diluent_vol = round(float(volumes[1][sample_index]), ndigits=1)
+        diluted_sample_vol = round(float(volumes[2][sample_index]), ndigits=1)
+        reaction_water_vol = float(volumes[3][sample_index])
+        total_dilution = int(volumes[4][sample_index])
+        dilution_steps = int(volumes[5][sample_index])
 
         sample_wells = []
         for target in sample_targets:
@@ -218,15 +579,7 @@ def sample_processing(args, sample_parameters, target_info_dict, utility):
                     dilution = "Neat"
                     s_volume = sample_vol
                 else:
-                    dilution = "1:{}".format(int((sample_vol + diluent_vol) / sample_vol))
-
-                    required_vol = round(
-                        (diluted_sample_vol * len(sample_targets) * replicates) + (3 * diluted_sample_vol), ndigits=1)
-                    dilution_factor = round(sample_vol / (sample_vol + diluent_vol), ndigits=4)
-                    final_sample_vol = round(dilution_factor * required_vol, ndigits=1)
-
-                    sample_vol = round(dilution_factor * required_vol, ndigits=1)
-                    diluent_vol = round(required_vol - final_sample_vol, ndigits=1)
+                    dilution = "1:{}".format(total_dilution)
 
                 layout_data[row][column] = "{}|{}|{}|{}"\
                     .format(sample_name, target_name, dilution, s_volume)
@@ -237,7 +590,7 @@ def sample_processing(args, sample_parameters, target_info_dict, utility):
                 used_wells.append(well)
                 dest_well_count += 1
 
-        sample_data_dict[sample_key] = [sample_vol, diluent_vol, diluted_sample_vol, sample_wells]
+        sample_data_dict[sample_key] = [sample_vol, diluent_vol, diluted_sample_vol, sample_wells, dilution_steps]
 
     # Define our no template control wells for the targets.
     for target in target_well_dict:
@@ -280,9 +633,9 @@ def run(protocol: protocol_api.ProtocolContext):
 
     # Set the location of the first tip in the tipbox.
     with suppress(IndexError):
-        left_pipette.starting_tip = left_tipracks[0].wells_by_name()[args.LeftPipetteFirstTip.upper()]
+        left_pipette.starting_tip = first_tip(protocol, left_pipette, left_tipracks, args.LeftPipetteFirstTip)
     with suppress(IndexError):
-        right_pipette.starting_tip = right_tipracks[0].wells_by_name()[args.RightPipetteFirstTip.upper()]
+        right_pipette.starting_tip = first_tip(protocol, right_pipette, right_tipracks, args.RightPipetteFirstTip)
 
     # Turn off rail lights for actual run.
     if not protocol.is_simulating():
@@ -290,90 +643,220 @@ def run(protocol: protocol_api.ProtocolContext):
 
     if args.UseTemperatureModule:
         protocol.comment("Using Temperature Module")
-        temp_mod = ColdPlateSlimDriver(protocol)
+        # A ReagentTemperature adds a block for the reagents.  Each block ramps on its own thread so the two ramps
+        # overlap.
+        block_names = ["plate"] if args.ReagentTemperature is None else ["plate", "reagent"]
+        cold_plates = cold_plate_manager(protocol, block_names)
+        temp_mod = cold_plates["plate"]
         # Parhelia does a set temp to room temperature, then a quick temp to final temperature.
         #  Doesn't seem like this should be necessary.  They also use int instead of float for the temp.
-        temp_mod.set_temp(20)
-        temp_mod.quick_temp(int(args.Temperature))
+        #  The future is waited on with plate_ready so an error from it is not lost.
+        plate_set = cold_plates.set_temp("plate", 20)
+
+        # 0 turns the temperature log off.
+        if args.TemperatureLogInterval is None or args.TemperatureLogInterval > 0:
+            temp_mod.start_telemetry(args.TemperatureLogInterval or 5)
+
+        # The water and master mix are dispensed while the plate cools.  The samples wait for it below.
+        plate_ready = cold_plates.quick_temp("plate", int(args.Temperature))
         protocol.comment("Setting Temperature Module to {}".format(args.Temperature))
 
-    target_info_dict = defaultdict(list)
+        if args.ReagentTemperature is not None:
+            reagent_ready = cold_plates.wait("reagent", args.ReagentTemperature)
+            protocol.comment("Setting the reagent block to {}".format(args.ReagentTemperature))
 
-    # Read targeting parameters into the dictionary if not running an Indexing PCR.
-    if "Illumina_Dual_Indexing" not in args.Template:
-        for i in range(10):
-            target = getattr(args, "Target_{}".format(i + 1), "")
-            if target:
-                # target_info_dict[i + 1] = target.split("|")
-                target_info_dict[i + 1] = target
+    # The temperature log and the plates are looked after even if a step fails.  The log is what
+    # Cold_Plate_Calibration.py fits the ramp model from.
+    try:
+        target_info_dict = defaultdict(list)
+
+        # Read targeting parameters into the dictionary if not running an Indexing PCR.
+        if "Illumina_Dual_Indexing" not in args.Template:
+            for i in range(10):
+                target = args.targets.get(i + 1, "")
+                if target:
+                    # target_info_dict[i + 1] = target.split("|")
+                    target_info_dict[i + 1] = target
 
-            # if len(target[0]) > 1:
-            else:
-                """
-                if not all('' == s or s.isspace() for s in target):
+                # if len(target[0]) > 1:
+                else:
+                    """
+                    if not all('' == s or s.isspace() for s in target):
+                        target_info_dict[i + 1] = target
+                    """
                     target_info_dict[i + 1] = target
-                """
-                target_info_dict[i + 1] = target
 
-    sample_data_dict, water_well_dict, target_well_dict, used_wells, layout_data, max_template_vol = \
-        sample_processing(args, sample_parameters, target_info_dict, utility)
+        # Dilution steps never move less than the smallest single channel pipette can or more than a dilution well
+        # holds.
+        min_volume = min((pipette.min_volume for pipette in (left_pipette, right_pipette)
+                          if "Single-Channel" in str(pipette)), default=1.0)
+        dilution_labware = labware.get(args.DilutionPlateSlot) or labware[args.PCR_PlateSlot]
+        sample_data_dict, water_well_dict, target_well_dict, used_wells, layout_data, max_template_vol = \
+            sample_processing(args, sample_parameters, target_info_dict, utility, min_volume,
+                              dilution_labware.wells()[0].max_volume)
 
-    # This will output a plate layout file.  Only does it during the simulation from our GUI
-    if protocol.is_simulating() and platform.system() == "Windows":
-        try:
-            run_date = datetime.datetime.today().strftime("%a %b %d %H:%M %Y")
-            plate_layout_string = \
-                "## {} Setup\n## Setup Date:\t{}\n## Template User:\t{}\n" \
-                "# Format:\tTemplate | Target | Template Dilution | Template Volume in Reaction\n\n\t"\
-                .format(args.Template, run_date, args.User)
+        # This will output a plate layout file.  Only does it during the simulation from our GUI or when
+        # PCR_PLATE_LAYOUT_FILE gives a file for it.
+        if protocol.is_simulating():
+            plate_layout_file = os.environ.get("PCR_PLATE_LAYOUT_FILE", "")
+            if not plate_layout_file and platform.system() == "Windows":
+                plate_layout_file = \
+                    "C:{0}Users{0}{1}{0}Documents{0}{2}_PlateLayout.tsv".format(os.sep, os.getlogin(), args.Template)
+
+            if plate_layout_file:
+                write_plate_layout(args, layout_data, plate_layout_file)
 
-            for i in range(12):
-                plate_layout_string += "{}\t".format(i+1)
+        # Now do the actual dispensing.
+        utility.track_reagents(target_info_dict)
+        utility.dispense_water(water_well_dict, left_pipette, right_pipette)
 
-            # I have to import this here because I have been unable to get natsort on the robot.
-            import natsort
+        if args.UseTemperatureModule and args.ReagentTemperature is not None:
+            cold_plates.wait_all(reagent_ready)
 
-            for well in natsort.natsorted(layout_data):
-                well_string = "\t".join(layout_data[well])
-                plate_layout_string += "\n{}\t{}\t".format(well, well_string)
+        utility.dispense_reagent_mix(labware, target_well_dict, target_info_dict, left_pipette, right_pipette)
 
-            plate_layout_file = \
-                open("C:{0}Users{0}{1}{0}Documents{0}{2}_PlateLayout.tsv".
-                     format(os.sep, os.getlogin(), args.Template), 'w')
+        if "Illumina_Dual_Indexing" in args.Template:
+            dispense_indexing_primers(args, protocol, utility, left_pipette, right_pipette, labware, sample_parameters,
+                                      sample_data_dict)
+
+        dispense_diluent(args, labware, sample_data_dict, sample_parameters, left_pipette, right_pipette, utility,
+                         protocol)
+
+        # Run_Estimator.py adds whatever is left of the ramp here.
+        if args.UseTemperatureModule:
+            protocol.comment("Waiting for the Temperature Module to reach {}".format(args.Temperature))
+            cold_plates.wait_all(plate_set, plate_ready)
+
+        dispense_samples(args, labware, sample_data_dict, sample_parameters, left_pipette, right_pipette, utility,
+                         protocol)
+        if "ddPCR" in args.Template:
+            fill_empty_wells(args, used_wells, labware, left_pipette, right_pipette, utility)
+
+        for stage, (travel_before, travel_after) in utility.travel.items():
+            if travel_before - travel_after >= 1:
+                protocol.comment("Well order reduced {} travel from {} mm to {} mm, saving {} mm"
+                                 .format(stage, round(travel_before), round(travel_after),
+                                         round(travel_before - travel_after)))
+
+        # If using Temperature Module, hold the PCR plate at set temperature until the user removes it and closes the
+        # program.
+        if args.UseTemperatureModule and not protocol.is_simulating():
+            protocol.set_rail_lights(True)
+            protocol.comment("Program is complete.  Temperature is holding at {}. Click RESUME to exit."
+                             .format(args.Temperature))
+
+            protocol.pause()
+            protocol.set_rail_lights(False)
+        else:
+            protocol.comment("Program Complete")
+    finally:
+        if args.UseTemperatureModule:
+            shut_down_cold_plates(args, protocol, cold_plates)
+
+    # The TSV file is removed so it can't be run twice by mistake.  A sample sheet from the runtime parameter is
+    # part of the run so there is nothing to remove.
+    if not protocol.is_simulating() and utility.parameter_file:
+        os.remove(utility.parameter_file)
 
-            plate_layout_file.write(plate_layout_string)
-            plate_layout_file.close()
 
-        except ModuleNotFoundError:
-            pass
+def first_tip(protocol, pipette, tipracks, well_name):
+    """
+    Return the tip the pipette starts from.  An 8-channel pipette picks up a whole column with its first channel in
+    row A, so a first tip in another row moves to the top of the next column.
+    @param protocol:
+    @param pipette:
+    @param tipracks:
+    @param well_name: LeftPipetteFirstTip or RightPipetteFirstTip from the TSV file.
+    @return:
+    """
+    tiprack = tipracks[0]
+    well_name = well_name.upper()
+    if "8-Channel" not in str(pipette) or well_name.startswith("A"):
+        return tiprack.wells_by_name()[well_name]
 
-    # Now do the actual dispensing.
-    water_aspirated = utility.dispense_water(water_well_dict, left_pipette, right_pipette)
-    utility.dispense_reagent_mix(labware, target_well_dict, target_info_dict, left_pipette, right_pipette)
+    column = int(well_name[1:])
+    if column >= len(tiprack.columns()):
+        raise Exception("{} picks up whole columns and there are none left after first tip {} in {}"
+                        .format(pipette, well_name, tiprack))
 
-    if "Illumina_Dual_Indexing" in args.Template:
-        dispense_indexing_primers(args, protocol, utility, left_pipette, right_pipette, labware, sample_parameters,
-                                  sample_data_dict)
+    tip = tiprack.columns()[column][0]
+    protocol.comment("{} picks up whole columns.  Starting at tip {} instead of {}"
+                     .format(pipette, tip.well_name, well_name))
 
-    water_aspirated = dispense_samples(args, labware, sample_data_dict, sample_parameters, left_pipette,
-                                       right_pipette, water_aspirated, utility, protocol)
-    if "ddPCR" in args.Template:
-        # fill_empty_wells(args, used_wells, water_aspirated, labware, left_pipette, right_pipette, utility)
-        fill_empty_wells(args, used_wells, labware, left_pipette, right_pipette, utility)
+    return tip
 
-    # If using Temperature Module, hold the PCR plate at set temperature until the user removes it and closes the program.
-    if args.UseTemperatureModule and not protocol.is_simulating():
-        protocol.set_rail_lights(True)
-        protocol.comment("Program is complete.  Temperature is holding at {}. Click RESUME to exit.".format(args.Temperature))
 
-        protocol.pause()
-        temp_mod.deactivate()
-        protocol.set_rail_lights(False)
-    else:
-        protocol.comment("Program Complete")
+def shut_down_cold_plates(args, protocol, cold_plates):
+    """
+    Write the temperature log and shut the cold plates down.  A real run turns them off.  A simulation leaves them
+    holding.
+    @param args:
+    @param protocol:
+    @param cold_plates: ColdPlateManager
+    """
+    temp_mod = cold_plates["plate"]
+    try:
+        if temp_mod.telemetry is not None:
+            temp_mod.telemetry.stop()
+            telemetry_file = telemetry_file_path(args, protocol)
+            if telemetry_file:
+                temp_mod.telemetry.write(telemetry_file)
+    finally:
+        if protocol.is_simulating():
+            cold_plates.close()
+        else:
+            cold_plates.deactivate()
+
+
+def telemetry_file_path(args, protocol):
+    """
+    Return where the temperature log goes, without the extension.  It goes with the plate layout when there is one,
+    in Documents on Windows and with the TSV file on the robot.
+    @param args:
+    @param protocol:
+    @return: "" if there is nowhere to put it.
+    """
+    file_name = "{}_Temperature".format(args.Template.strip())
+    plate_layout_file = os.environ.get("PCR_PLATE_LAYOUT_FILE", "")
 
+    if plate_layout_file:
+        return os.path.join(os.path.dirname(os.path.abspath(plate_layout_file)), file_name)
+    if platform.system() == "Windows":
+        return "C:{0}Users{0}{1}{0}Documents{0}{2}".format(os.sep, os.getlogin(), file_name)
     if not protocol.is_simulating():
-        os.remove(utility.parameter_file)
+        return "{0}var{0}lib{0}jupyter{0}notebooks{0}{1}".format(os.sep, file_name)
+
+    return ""
+
+
+def write_plate_layout(args, layout_data, plate_layout_file):
+    """
+    Write the plate layout as a TSV file.
+    @param args:
+    @param layout_data:
+    @param plate_layout_file:
+    """
+    try:
+        # I have to import this here because I have been unable to get natsort on the robot.
+        import natsort
+    except ModuleNotFoundError:
+        return
+
+    run_date = datetime.datetime.today().strftime("%a %b %d %H:%M %Y")
+    plate_layout_string = \
+        "## {} Setup\n## Setup Date:\t{}\n## Template User:\t{}\n" \
+        "# Format:\tTemplate | Target | Template Dilution | Template Volume in Reaction\n\n\t"\
+        .format(args.Template, run_date, args.User)
+
+    for i in range(12):
+        plate_layout_string += "{}\t".format(i+1)
+
+    for well in natsort.natsorted(layout_data):
+        well_string = "\t".join(layout_data[well])
+        plate_layout_string += "\n{}\t{}\t".format(well, well_string)
+
+    with open(plate_layout_file, 'w') as layout_file:
+        layout_file.write(plate_layout_string)
 
 
 def dispense_indexing_primers(args, protocol, utility, left_pipette, right_pipette, labware, sample_parameters,
@@ -395,8 +878,8 @@ def dispense_indexing_primers(args, protocol, utility, left_pipette, right_pipet
     # Determine primer volumes and dispense them.
     # 6.25 uM = 2 uL per 50 uL
     # 10 uM = 1.25 uL per 50 uL
-    # primer_volume = (float(args.PCR_Volume)/50) * 1.25
-    primer_volume = (float(args.PCR_Volume) / 50) * 2.0
+    # primer_volume = (args.PCR_Volume/50) * 1.25
+    primer_volume = (args.PCR_Volume / 50) * 2.0
     selected_pipette = utility.pipette_selection(left_pipette, right_pipette, primer_volume)
 
     # Step 3: Identify labware for primers and sample destinations
@@ -405,19 +888,17 @@ def dispense_indexing_primers(args, protocol, utility, left_pipette, right_pipet
 
     for sample_key in sample_parameters:
         destination_well = sample_data_dict[sample_key][3][0]
-        sample_data = sample_parameters[sample_key]
-        sample_well = sample_data[1]
-        d500, d700 = sample_data[4].split("+")
+        d500, d700 = sample_parameters[sample_key].targets[0].split("+")
 
         # Dispense D500 primer
-        utility.pipette_reagents(selected_pipette, primer_labware[primer_wells[d500]].bottom(float(args.BottomOffset)),
+        utility.pipette_reagents(selected_pipette, primer_labware[primer_wells[d500]].bottom(args.BottomOffset),
                                  sample_destination_labware[destination_well], primer_volume, NewTip=True, MixReaction=False,
-                                 touch=True)
+                                 liquid_class="glycerol_primer")
 
         # Dispense D700 primer
-        utility.pipette_reagents(selected_pipette, primer_labware[primer_wells[d700]].bottom(float(args.BottomOffset)),
+        utility.pipette_reagents(selected_pipette, primer_labware[primer_wells[d700]].bottom(args.BottomOffset),
                                  sample_destination_labware[destination_well], primer_volume, NewTip=True, MixReaction=False,
-                                 touch=True)
+                                 liquid_class="glycerol_primer")
 
 
 def fill_empty_wells(args, used_wells, labware_dict, left_pipette, right_pipette, utility):
@@ -431,80 +912,127 @@ def fill_empty_wells(args, used_wells, labware_dict, left_pipette, right_pipette
     row_list = ["A", "B", "C", "D", "E", "F", "G", "H"]
     row_index = row_list.index(row)
     wells_remaining = len(row_list)-row_index-1
-    water_aspirated = 25
     if wells_remaining > 0:
         sample_destination_labware = labware_dict[args.PCR_PlateSlot]
         reagent_labware = labware_dict[args.ReagentSlot]
-        water_res_well_dia = reagent_labware[args.WaterResWell].diameter
-        # cone_vol = utility.labware_cone_volume(args.ReagentSlot)
-        fill_pipette = \
-            utility.pipette_selection(left_pipette, right_pipette, water_aspirated)
-        water_tip_height = \
-            utility.res_tip_height(float(args.WaterResVol)-water_aspirated, water_res_well_dia)
-
+        destinations = []
         for i in range(wells_remaining):
             blank_well = "{}{}".format(row_list[i+row_index+1], column)
+            destinations.append((sample_destination_labware[blank_well], args.PCR_Volume))
 
-            utility.pipette_reagents(fill_pipette, reagent_labware[args.WaterResWell].bottom(water_tip_height),
-                                     sample_destination_labware[blank_well], float(args.PCR_Volume),
-                                     NewTip=False, MixReaction=False
-                                     )
+        fill_pipette = \
+            utility.pipette_selection(left_pipette, right_pipette,
+                                      utility.dispense_volume([volume for well, volume in destinations]))
 
-            water_aspirated = water_aspirated+float(args.PCR_Volume)
-            water_tip_height = utility.res_tip_height(float(args.WaterResVol)-water_aspirated, water_res_well_dia)
+        utility.distribute_reagents(fill_pipette, reagent_labware[args.WaterResWell], destinations,
+                                    liquid_class="water", stage="fill")
 
         fill_pipette.drop_tip()
 
 
-def dispense_samples(args, labware_dict, sample_data_dict, sample_parameters, left_pipette, right_pipette,
-                     water_aspirated, utility, protocol):
+def dilution_setup(args, labware_dict, utility):
     """
-    Dilute and dispense samples
-    @param utility:
+    Return the dilution labware and the order its wells are used in.
     @param args:
     @param labware_dict:
-    @param sample_data_dict:
-    @param sample_parameters:
-    @param left_pipette:
-    @param right_pipette:
-    @param water_aspirated:
+    @param utility:
+    @return:
     """
-    protocol.comment("\nDiluting and Dispensing Samples")
     try:
         dilution_labware = labware_dict[args.DilutionPlateSlot]
     except KeyError:
         dilution_labware = ""
 
-    bottom_offset = float(args.BottomOffset)
-    sample_destination_labware = labware_dict[args.PCR_PlateSlot]
-    reagent_labware = labware_dict[args.ReagentSlot]
-    water_res_well_dia = labware_dict[args.ReagentSlot][args.WaterResWell].diameter
-    water_tip_height = utility.res_tip_height(float(args.WaterResVol)-water_aspirated, water_res_well_dia)
-
     # If the user determines no dilutions are required, they can leave that slot blank.  I don't like this approach,
     # users could leave the information out, and dilutions might still be required.
     if dilution_labware:
         slot = args.DilutionPlateSlot
-        # labware_name = slot_dict[args.DilutionPlateSlot]
     else:
         slot = args.PCR_PlateSlot
-        # labware_name = slot_dict[args.PCR_PlateSlot]
 
     dilution_plate_layout, unused_layout = utility.plate_layout(slot)
 
+    return dilution_labware, dilution_plate_layout
+
+
+def dispense_diluent(args, labware_dict, sample_data_dict, sample_parameters, left_pipette, right_pipette, utility,
+                     protocol):
+    """
+    Assign dilution wells, one per dilution step, to each sample that needs them and fill all of them with diluent
+    using a single tip.  The wells are empty so there is no risk of contamination.  The list of dilution wells is
+    appended to the sample_data_dict entry for the sample.
+    @param args:
+    @param labware_dict:
+    @param sample_data_dict:
+    @param sample_parameters:
+    @param left_pipette:
+    @param right_pipette:
+    @param utility:
+    @param protocol:
+    """
+    dilution_labware, dilution_plate_layout = dilution_setup(args, labware_dict, utility)
+    destinations = []
     dilution_well_index = 0
 
     for sample_key in sample_parameters:
-        sample_source_labware = labware_dict[sample_parameters[sample_key][0]]
-        sample_source_well = sample_parameters[sample_key][1]
-        sample_dest_wells = sample_data_dict[sample_key][3]
-        sample_vol = sample_data_dict[sample_key][0]
         diluent_vol = sample_data_dict[sample_key][1]
         diluted_sample_vol = sample_data_dict[sample_key][2]
-        mix_volume = None
 
-        if float(args.PCR_Volume) > 20:
-            mix_volume = 17
+        if diluted_sample_vol == 0:
+            continue
+
+        dilution_wells = []
+        for step in range(sample_data_dict[sample_key][4]):
+            dilution_well = dilution_plate_layout[dilution_well_index]
+            dilution_wells.append(dilution_labware[dilution_well])
+            destinations.append((dilution_labware[dilution_well], diluent_vol))
+            dilution_well_index += 1
+
+        sample_data_dict[sample_key].append(dilution_wells)
+
+    if not destinations:
+        return
+
+    dispense_vol = [volume for well, volume in destinations]
+    if min(dispense_vol) <= 9:
+        volume = max(dispense_vol)
+    else:
+        volume = round(sum(dispense_vol), 2)
+
+    diluent_pipette = utility.pipette_selection(left_pipette, right_pipette, volume)
+    protocol.comment("\nDispensing Diluent with {}".format(diluent_pipette))
+
+    source_well = labware_dict[args.ReagentSlot][args.WaterResWell]
+    utility.distribute_reagents(diluent_pipette, source_well, destinations, liquid_class="water", stage="diluent")
+
+    utility.drop_any_tips([left_pipette, right_pipette])
+
+
+def dispense_samples(args, labware_dict, sample_data_dict, sample_parameters, left_pipette, right_pipette, utility,
+                     protocol):
+    """
+    Dilute and dispense samples.  The diluent must already be in the dilution wells.
+    @param utility:
+    @param args:
+    @param labware_dict:
+    @param sample_data_dict:
+    @param sample_parameters:
+    @param left_pipette:
+    @param right_pipette:
+    @param protocol:
+    """
+    protocol.comment("\nDiluting and Dispensing Samples")
+    dilution_labware, dilution_plate_layout = dilution_setup(args, labware_dict, utility)
+
+    bottom_offset = args.BottomOffset
+    sample_destination_labware = labware_dict[args.PCR_PlateSlot]
+
+    for sample_key, sample in sample_parameters.items():
+        sample_source_labware = labware_dict[sample.slot]
+        sample_source_well = sample.well
+        sample_dest_wells = sample_data_dict[sample_key][3]
+        sample_vol = sample_data_dict[sample_key][0]
+        diluted_sample_vol = sample_data_dict[sample_key][2]
 
         # If no dilution is necessary, dispense the sample and continue
         if diluted_sample_vol == 0:
@@ -515,67 +1043,55 @@ def dispense_samples(args, labware_dict, sample_data_dict, sample_parameters, le
             for well in sample_dest_wells:
                 utility.pipette_reagents(sample_pipette, sample_source_labware[sample_source_well],
                                          sample_destination_labware[well], sample_vol,
-                                         NewTip=True, MixReaction=True, touch=True, MixVolume=mix_volume
-                                         )
+                                         NewTip=True, MixReaction=True, liquid_class="dna")
         else:
-            water_aspirated, dilution_well_index = sample_dilution(args, sample_source_labware, sample_source_well, sample_vol, diluent_vol,
-                                              dilution_plate_layout, dilution_well_index, reagent_labware,
-                                              water_tip_height, dilution_labware, diluted_sample_vol, water_res_well_dia,
-                                              sample_dest_wells, sample_destination_labware, bottom_offset, left_pipette,
-                                              right_pipette, water_aspirated, utility)
+            sample_dilution(sample_source_labware, sample_source_well, sample_vol, sample_data_dict[sample_key][5],
+                            diluted_sample_vol, sample_dest_wells, sample_destination_labware, bottom_offset,
+                            left_pipette, right_pipette, utility)
 
     utility.drop_any_tips([left_pipette, right_pipette])
-    return water_aspirated
-
-def sample_dilution(args, sample_source_labware, sample_source_well, sample_vol, diluent_vol, dilution_plate_layout,
-                    dilution_well_index, reagent_labware, water_tip_height, dilution_labware, diluted_sample_vol,
-                    water_res_well_dia, sample_dest_wells, sample_destination_labware, bottom_offset, left_pipette, right_pipette,
-                    water_aspirated, utility):
-    # Adjust volume of diluted sample to make sure there is enough
-    # diluted_template_needed = round(diluted_sample_vol*(len(sample_dest_wells)+1.5), ndigits=1)
-    # diluted_template_factor = round(diluted_template_needed/(sample_vol+diluent_vol), ndigits=1)
-    # adjusted_sample_vol = round((sample_vol * diluted_template_factor), ndigits=1)
-    # diluent_vol = round((diluent_vol*diluted_template_factor), ndigits=1)
-
-    # Reset the pipettes for the new volumes
-    diluent_pipette = utility.pipette_selection(left_pipette, right_pipette, diluent_vol)
-    sample_pipette = utility.pipette_selection(left_pipette, right_pipette, sample_vol)
 
-    # Make dilution, diluent first
-    dilution_well = dilution_plate_layout[dilution_well_index]
 
-    utility.pipette_reagents(diluent_pipette, reagent_labware[args.WaterResWell].bottom(water_tip_height),
-                             dilution_labware[dilution_well], diluent_vol, NewTip=True, MixReaction=False,
-                             touch=True)
-    mix_volume = None
-    if diluted_sample_vol < 20:
-        mix_volume = 18
+def sample_dilution(sample_source_labware, sample_source_well, sample_vol, dilution_wells, diluted_sample_vol,
+                    sample_dest_wells, sample_destination_labware, bottom_offset, left_pipette, right_pipette, utility):
+    """
+    Add the sample to its dilution wells, which already hold the diluent, then dispense the diluted sample.  With more
+    than one dilution well each one is made from the one before it.
+    """
+
+    sample_pipette = utility.pipette_selection(left_pipette, right_pipette, sample_vol)
 
-    utility.pipette_reagents(sample_pipette, sample_source_labware[sample_source_well],
-                             dilution_labware[dilution_well], sample_vol, NewTip=True, MixReaction=True,
-                             MixVolume=mix_volume)
+    source_location = sample_source_labware[sample_source_well]
+    for dilution_well in dilution_wells:
+        utility.pipette_reagents(sample_pipette, source_location, dilution_well, sample_vol, NewTip=True,
+                                 MixReaction=True, liquid_class="dna")
+        source_location = dilution_well.bottom(bottom_offset)
 
-    water_aspirated += diluent_vol
-    dilution_well_index += 1
-    water_tip_height = \
-        utility.res_tip_height(float(args.WaterResVol) - water_aspirated, water_res_well_dia)
+    dilution_well = dilution_wells[-1]
 
     # Add diluted sample to PCR plate
     for well in sample_dest_wells:
         sample_pipette = \
             utility.pipette_selection(left_pipette, right_pipette, diluted_sample_vol)
-        mix_volume = None
-
-        if diluted_sample_vol < 20:
-            mix_volume = 18
 
-        utility.pipette_reagents(sample_pipette, dilution_labware[dilution_well].bottom(bottom_offset),
+        utility.pipette_reagents(sample_pipette, dilution_well.bottom(bottom_offset),
                                  sample_destination_labware[well], diluted_sample_vol, NewTip=True,
-                                 MixReaction=True, MixVolume=mix_volume
-                                 )
-    return water_aspirated, dilution_well_index
+                                 MixReaction=True, liquid_class="dna")
+
 
 class ColdPlateSlimDriver:
+    # Replies end with CRLF.
+    TERMINATOR = b"\r\n"
+
+    # Command: (seconds to wait for the reply, True if there must be a reply).  The set commands only acknowledge,
+    # and some firmware doesn't, so they get a short window and a missing reply is not an error.
+    COMMAND_TIMEOUTS = \
+        {"info": (2.0, True), "getTempActual": (1.0, True), "setTempTarget": (0.1, False), "tempOn": (0.1, False),
+         "tempOff": (0.1, False)}
+
+    # An acknowledgement that shows up after its window is skipped when reading the reply to the next command.
+    ACKNOWLEDGEMENTS = ("OK",)
+
     def __init__(
             self,
             protocol_context,
@@ -583,9 +1099,19 @@ class ColdPlateSlimDriver:
             max_temp_lag=0,
             heating_rate_deg_per_min=100,
             cooling_rate_deg_per_min=100,
+            port=None,
     ):
+        """
+        @param protocol_context:
+        @param temp_mode_number: The plate is on /dev/ttyUSB<temp_mode_number>.
+        @param max_temp_lag:
+        @param heating_rate_deg_per_min:
+        @param cooling_rate_deg_per_min:
+        @param port: Serial port to use instead, like the one Cold_Plate_Emulator.py makes.  The port is opened even
+            when simulating.
+        """
         self.serial_number = "29517"
-        self.device_name = "/dev/ttyUSB" + str(temp_mode_number)
+        self.device_name = port or "/dev/ttyUSB" + str(temp_mode_number)
         self.baudrate = 9600
         self.bytesize = serial.EIGHTBITS
         self.parity = serial.PARITY_NONE
@@ -595,13 +1121,18 @@ class ColdPlateSlimDriver:
         self.height = 45
 
         self.temp = 20
+        self.target_temp = None
+        self.ramp_model = self.load_ramp_model()
+        self.ramp = None
+        self.telemetry = None
+        self._serial_lock = threading.Lock()
         self.max_temp_lag = max_temp_lag
         self.heating_rate_deg_per_amin = heating_rate_deg_per_min
         self.cooling_rate_deg_per_min = cooling_rate_deg_per_min
         self.protocol = protocol_context
 
         # check context, skip if simulating Linux
-        if protocol_context.is_simulating():
+        if protocol_context.is_simulating() and port is None:
             print("simulation detected")
             print("Initializing in the dummy mode")
             self.serial_object = None
@@ -634,20 +1165,32 @@ class ColdPlateSlimDriver:
         self.serial_object.reset_input_buffer()
         self.serial_object.reset_output_buffer()
 
-    def _read_response(self):
+    def _read_response(self, timeout=None, skip_acknowledgements=False):
         """
-        Worker function
+        Read one reply line.  Returns as soon as the CRLF arrives.  Blank lines are skipped.
+        @param timeout: Seconds to wait for the reply.  Defaults to read_timeout.
+        @param skip_acknowledgements: Also skip late acknowledgements of set commands.
+        @return: The reply without the CRLF or None if no complete reply came in time.
         """
         if self.serial_object is None:
             return "dummy response"
 
-        output_lines = self.serial_object.readlines()
-        output_string = "".join(l.decode("utf-8") for l in output_lines)
-        return output_string
+        deadline = time.monotonic() + (self.read_timeout if timeout is None else timeout)
+        while True:
+            self.serial_object.timeout = max(0.0, deadline - time.monotonic())
+            line = self.serial_object.read_until(self.TERMINATOR)
+            if not line.endswith(self.TERMINATOR):
+                return None
+
+            reply = line.decode("utf-8", errors="replace").strip()
+            if reply and not (skip_acknowledgements and reply in self.ACKNOWLEDGEMENTS):
+                return reply
 
     def _send_command(self, my_command):
         """
-        Worker function
+        Send a command and return the reply.  Anything left over from an earlier command is thrown away first.
+        @param my_command:
+        @return: The reply, "" for a set command that was not acknowledged.
         """
         SERIAL_ACK = "\r\n"
 
@@ -658,9 +1201,27 @@ class ColdPlateSlimDriver:
             print("sending dummy command: " + my_command)
             return
 
-        self.serial_object.write(command.encode())
-        self.serial_object.flush()
-        return self._read_response()
+        # setTempTarget takes tenths of a degree, which can be negative.
+        command_name = my_command.rstrip("-0123456789")
+        timeout, reply_required = self.COMMAND_TIMEOUTS.get(command_name, (self.read_timeout, True))
+
+        # A ramp running in the background sends commands from its own thread.
+        with self._serial_lock:
+            self.serial_object.reset_input_buffer()
+            self.serial_object.write(command.encode())
+            self.serial_object.flush()
+            reply = self._read_response(timeout, skip_acknowledgements=reply_required)
+
+        if reply is None:
+            if reply_required:
+                raise Exception("No reply to {} from the temperature module on {} in {} seconds"
+                                .format(my_command, self.device_name, timeout))
+            return ""
+
+        if reply.lower().startswith(("error", "unknown", "invalid")):
+            raise Exception("Temperature module on {} rejected {}: {}".format(self.device_name, my_command, reply))
+
+        return reply
 
     def get_info(self):
         if self.serial_object is None:
@@ -670,10 +1231,20 @@ class ColdPlateSlimDriver:
     def get_temp(self):
         if self.serial_object is None:
             return self.temp
-        t = self._send_command("getTempActual")
-        return float(t)
+        reply = self._send_command("getTempActual")
+        try:
+            temp = float(reply)
+        except ValueError:
+            raise Exception("Temperature module on {} sent {} for getTempActual, not a temperature"
+                            .format(self.device_name, reply))
+
+        if not -40 <= temp <= 120:
+            raise Exception("Temperature module on {} reported {} C".format(self.device_name, temp))
+
+        return temp
 
     def set_temp(self, my_temp):
+        self.target_temp = my_temp
         if self.serial_object is None:
             self.temp = my_temp
             return
@@ -685,15 +1256,50 @@ class ColdPlateSlimDriver:
     def set_temperature(self, target_temp):
         self.set_temp_andWait(target_temp)
 
-    def time_to_reach_sample_temp(self, delta_temp):
-        x = delta_temp
-        if(x>0):
+    def load_ramp_model(self):
+        """
+        Return the fitted ramp model for this plate or {} if it has not been calibrated.
+        @return: Dictionary with heating and cooling dictionaries of dead_time_sec and tau_sec.
+        """
+        model_file = cold_plate_model_file_path()
+        if model_file is None:
+            return {}
+
+        with open(model_file) as json_file:
+            return json.load(json_file).get(self.serial_number, {})
+
+    def time_to_reach_sample_temp(self, delta_temp, tolerance=0.5):
+        """
+        Minutes for the plate to get within the tolerance of a setpoint delta_temp away.  Uses the fitted model for
+        this plate if there is one, otherwise the polynomial.
+        @param delta_temp: Setpoint less the plate temperature.
+        @param tolerance:
+        @return:
+        """
+        model = self.ramp_model.get("heating" if delta_temp > 0 else "cooling")
+        if model:
+            time_sec = model["dead_time_sec"]
+            if abs(delta_temp) > tolerance:
+                time_sec += model["tau_sec"] * math.log(abs(delta_temp) / tolerance)
+            return time_sec / 60
+
+        x = delta_temp
+        if(x>0):
             time = 0.364 + 0.559*x -0.0315*x**2 + 1.29E-03*x**3 -2.46E-05*x**4 + 2.21E-07*x**5 -7.09E-10*x**6
         else:
             time = -0.1 -0.329*x -0.00413*x**2 -0.0000569*x**3 + 0.0000000223*x**4
         return time
 
-    def quick_temp(self, temp_target, overshot = 10, undershot=3):
+    def quick_temp_plan(self, temp_target, overshot=10, undershot=3):
+        """
+        Work out the overshoot temperature and how long to hold it.  A plate calibrated with
+        Cold_Plate_Calibration.py uses its fitted model, others the polynomial.
+        @param temp_target:
+        @param overshot: Most the setpoint may go past the target.
+        @param undershot: Without a model the hold ends this far short of the target.  With one, steps no bigger than
+            this go straight to the target.
+        @return: Start temperature, overshoot temperature and hold time in minutes.
+        """
         start_temp = self.get_temp()
         delta_temp = temp_target - start_temp
 
@@ -704,7 +1310,44 @@ class ColdPlateSlimDriver:
             overshot_temp = max(temp_target - overshot, -10)
             undershot_temp = delta_temp + undershot
 
-        delay_min = self.time_to_reach_sample_temp(undershot_temp)
+        model = self.ramp_model.get("heating" if delta_temp > 0 else "cooling")
+        if not model:
+            return start_temp, overshot_temp, self.time_to_reach_sample_temp(undershot_temp)
+
+        # With the fitted model the largest overshoot allowed is always fastest.  The hold is sized so the plate
+        # reaches the target just as the switch to the target setpoint takes effect one dead time later.
+        if abs(delta_temp) <= undershot or overshot_temp == temp_target:
+            return start_temp, temp_target, 0
+
+        hold_sec = model["tau_sec"] * math.log((overshot_temp - start_temp) / (overshot_temp - temp_target))
+
+        return start_temp, overshot_temp, hold_sec / 60
+
+    def quick_temp_async(self, temp_target, overshot=10, undershot=3):
+        """
+        Start a quick_temp without waiting for it.  The overshoot is set now and a background thread sets the target
+        temperature when the hold time is up.  Call wait_until_ready on the ramp before the steps that need the
+        plate at temperature.
+        @param temp_target:
+        @param overshot:
+        @param undershot:
+        @return: TemperatureRamp
+        """
+        start_temp, overshot_temp, delay_min = self.quick_temp_plan(temp_target, overshot, undershot)
+
+        self.set_temp(overshot_temp)
+        self.protocol.comment("quick_temp from {} to {} running in the background.  Ready in about {} minutes"
+                              .format(start_temp, temp_target, round(delay_min, 1)))
+
+        # Nothing to wait for in a simulation.
+        if self.serial_object is None:
+            delay_min = 0
+
+        self.ramp = TemperatureRamp(self, temp_target, delay_min)
+        return self.ramp
+
+    def quick_temp(self, temp_target, overshot = 10, undershot=3):
+        start_temp, overshot_temp, delay_min = self.quick_temp_plan(temp_target, overshot, undershot)
 
         self.set_temp(overshot_temp)
         testmode = False
@@ -713,8 +1356,20 @@ class ColdPlateSlimDriver:
         self.protocol.delay(minutes=delay_min, msg="quick_temp from " + str(start_temp) + " to " + str(temp_target))
         self.set_temp(temp_target)
 
-    def set_temp_andWait(self, target_temp, timeout_min=30, tolerance=0.5):
-        interval_sec = 10
+    def set_temp_andWait(self, target_temp, timeout_min=30, tolerance=0.5, stable_sec=5, min_interval_sec=0.5,
+                         max_interval_sec=10):
+        """
+        Set the temperature and wait until the plate is stable at it.  The ramp model predicts when the plate gets
+        close so the wait sleeps through most of the ramp.  After that it polls sooner the smaller the error is and
+        finishes once every reading over the last stable_sec seconds is within the tolerance.
+        @param target_temp:
+        @param timeout_min:
+        @param tolerance: Degrees C
+        @param stable_sec: How long the readings have to stay within the tolerance.
+        @param min_interval_sec: Shortest time between readings.
+        @param max_interval_sec: Longest time between readings once the predicted ramp is over.
+        @return:
+        """
         SEC_IN_MIN = 60
 
         curr_temp = self.get_temp()
@@ -724,48 +1379,516 @@ class ColdPlateSlimDriver:
 
         self.set_temp(target_temp)
 
-        time_elapsed = 0
+        # The dummy plate is at the target as soon as it is set.  A simulation with a port waits for the plate.
+        if self.serial_object is None:
+            return target_temp
+
+        start_time = time.monotonic()
+        deadline = start_time + timeout_min * SEC_IN_MIN
+
+        # Sleep through most of the predicted ramp.  The rest is left to catch a plate that is slower than the model.
+        # Readings are cheap so a plate that is faster than the model is checked for every 30 seconds.
+        predicted_sec = self.time_to_reach_sample_temp(target_temp - curr_temp) * SEC_IN_MIN
+        wake_time = start_time + min(0.8 * predicted_sec, deadline - start_time)
+        if wake_time - start_time > max_interval_sec:
+            self.protocol.comment("Waiting about {} minutes for the temperature to reach {}"
+                                  .format(round(predicted_sec / SEC_IN_MIN, 1), target_temp))
+            while time.monotonic() < wake_time:
+                time.sleep(min(30, wake_time - time.monotonic()))
+                if abs(target_temp - self.get_temp()) <= tolerance:
+                    break
+
+        in_tolerance_since = None
+        while True:
+            now = time.monotonic()
+            curr_temp = self.get_temp()
+            error = target_temp - curr_temp
+
+            if abs(error) <= tolerance:
+                if in_tolerance_since is None:
+                    in_tolerance_since = now
+                if now - in_tolerance_since >= stable_sec:
+                    self.protocol.comment("Temperature stable at {} after {} minutes"
+                                          .format(curr_temp, round((now - start_time) / SEC_IN_MIN, 1)))
+                    return target_temp
+                interval_sec = min_interval_sec
+            else:
+                # Check again about halfway through the time the model gives for the rest of the ramp.
+                in_tolerance_since = None
+                interval_sec = 0.5 * self.time_to_reach_sample_temp(error) * SEC_IN_MIN
+                interval_sec = min(max_interval_sec, max(min_interval_sec, interval_sec))
 
-        while abs(self.get_temp() - target_temp) > tolerance:
-            self.protocol.comment(
-                f"Waiting for temp to reach target: {target_temp}, actual temp: {self.get_temp()}"
-            )
-            if not self.protocol.is_simulating():  # Skip delay during simulation
-                time.sleep(interval_sec)
-            time_elapsed += interval_sec
-            if time_elapsed > timeout_min * SEC_IN_MIN:
-                raise Exception("Temperature timeout")
+            if now + interval_sec > deadline:
+                raise Exception("Temperature timeout.  {} after {} minutes, target {}"
+                                .format(curr_temp, timeout_min, target_temp))
+            time.sleep(interval_sec)
 
-        return target_temp
+    def start_telemetry(self, interval_sec=5, max_samples=17280):
+        """
+        Start recording the temperature in the background.
+        @param interval_sec:
+        @param max_samples: Size of the ring buffer.  The default holds a day at 5 second intervals.
+        @return: TemperatureTelemetry
+        """
+        self.telemetry = TemperatureTelemetry(self, interval_sec, max_samples)
+        return self.telemetry
 
     def temp_off(self):
+        self.target_temp = None
         if self.serial_object is None:
             self.temp = 25
         else:
             self._send_command("tempOff")
 
     def deactivate(self):
+        if self.ramp is not None:
+            self.ramp.cancel()
+        if self.telemetry is not None:
+            self.telemetry.stop()
         self.temp_off()
 
-    def __del__(self):
-        self.temp_off()
-        if not self.protocol.is_simulating():
-            self.serial_object.close()
-        # self.serial_object.close()
+    def close(self):
+        """
+        Close the serial port.  The plate holds its temperature.
+        """
+        if self.serial_object is not None:
+            with self._serial_lock:
+                self.serial_object.close()
+
+
+class TemperatureTelemetry:
+    """
+    Reads the plate temperature every interval_sec in a background thread.  The readings go in a ring buffer so a
+    long run keeps only the most recent max_samples.  Reading errors are recorded and do not stop the sampler.
+    """
+    COLUMNS = ["Time", "Elapsed Seconds", "Setpoint", "Temperature", "Error"]
+
+    def __init__(self, driver, interval_sec=5, max_samples=17280):
+        self.driver = driver
+        self.interval_sec = interval_sec
+        self.readings = deque(maxlen=max_samples)
+        self.sample_count = 0
+        self.start_time = time.time()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="temperature_telemetry", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            temp, error = None, ""
+            try:
+                temp = self.driver.get_temp()
+            except Exception as reading_error:
+                error = str(reading_error)
+
+            now = time.time()
+            self.readings.append(
+                (datetime.datetime.fromtimestamp(now).isoformat(timespec="seconds"),
+                 round(now - self.start_time, 1), self.driver.target_temp, temp, error))
+            self.sample_count += 1
+
+            if self._stop.wait(self.interval_sec):
+                return
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    @property
+    def dropped(self):
+        """
+        Number of readings pushed out of the ring buffer.
+        """
+        return self.sample_count - len(self.readings)
+
+    def write(self, file_path):
+        """
+        Write the readings as file_path.csv and file_path.json.
+        @param file_path: File name without the extension.
+        """
+        readings = list(self.readings)
+
+        with open("{}.csv".format(file_path), "w", newline="") as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(self.COLUMNS)
+            writer.writerows(readings)
+
+        with open("{}.json".format(file_path), "w") as json_file:
+            json.dump({"device": self.driver.device_name, "serial_number": self.driver.serial_number,
+                       "interval_sec": self.interval_sec, "dropped": self.dropped,
+                       "readings": [dict(zip(self.COLUMNS, reading)) for reading in readings]}, json_file, indent=1)
+
+
+class TemperatureRamp:
+    """
+    Handle for a quick_temp running in the background.  The overshoot temperature is already set.  A thread waits
+    out the hold time and then sets the target temperature.
+    """
+    def __init__(self, driver, temp_target, hold_min):
+        self.driver = driver
+        self.temp_target = temp_target
+        self.hold_min = hold_min
+        self.ready_time = time.monotonic() + hold_min * 60
+        self.error = None
+        self._cancel = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="quick_temp", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            if not self._cancel.wait(self.hold_min * 60):
+                self.driver.set_temp(self.temp_target)
+        except Exception as error:
+            # Raised again in wait_until_ready so it is not lost in the thread.
+            self.error = error
+
+    @property
+    def ready(self):
+        return not self._thread.is_alive()
+
+    def seconds_left(self):
+        return max(0.0, self.ready_time - time.monotonic())
+
+    def wait_until_ready(self):
+        """
+        Block until the target temperature has been set.
+        @return: Target temperature.
+        """
+        if not self.ready:
+            self.driver.protocol.comment("Waiting {} minutes for the temperature module to reach {}"
+                                         .format(round(self.seconds_left() / 60, 1), self.temp_target))
+            self._thread.join()
+
+        if self.error is not None:
+            raise self.error
+
+        return self.temp_target
+
+    def cancel(self):
+        self._cancel.set()
+        self._thread.join()
+
+
+class BlockProtocol:
+    """
+    Stands in for the protocol context in a ColdPlateManager driver.  Comments from the block's worker thread are
+    queued with the block name and written by the protocol thread so they stay in order in the run log.  Everything
+    else goes to the protocol context.
+    """
+    def __init__(self, protocol, name, comments):
+        self._protocol = protocol
+        self._name = name
+        self._comments = comments
+
+    def comment(self, msg):
+        self._comments.append("{}: {}".format(self._name, msg))
+
+    def __getattr__(self, attribute):
+        return getattr(self._protocol, attribute)
+
+
+class ColdPlateManager:
+    """
+    Runs several cold plates at once, like a reagent block and a plate block held at different temperatures.  Each
+    block keeps one ColdPlateSlimDriver, and so one serial connection, for the whole run and has its own worker
+    thread that sends its commands in order.  set_temp, wait and quick_temp return concurrent.futures.Future
+    right away so ramps on different blocks overlap.  The protocol thread collects them with wait_all.  Code running
+    in an asyncio loop can await the async_ methods instead.
+    """
+    def __init__(self, protocol, blocks):
+        """
+        @param protocol:
+        @param blocks: Dictionary of block name: serial port.  None for a port is /dev/ttyUSB<position in blocks>.
+        """
+        self.protocol = protocol
+        self.drivers = {}
+        self.info = {}
+        self._executors = {}
+        # list.append and list.pop are atomic so the worker threads can share this without a lock.
+        self._comments = []
+
+        for temp_mode_number, (name, port) in enumerate(blocks.items()):
+            self.add(name, port, temp_mode_number)
+
+    @staticmethod
+    def discover_ports(pattern="/dev/ttyUSB*"):
+        """
+        Return the serial ports that answer the info command, in number order.
+        @param pattern:
+        @return: Dictionary of port: info reply.
+        """
+        def port_number(port):
+            digits = port[len(port.rstrip("0123456789")):]
+            return int(digits) if digits else -1
+
+        found = {}
+        connection = SimpleNamespace(is_simulating=lambda: False, comment=print)
+        for port in sorted(glob.glob(pattern), key=port_number):
+            try:
+                driver = ColdPlateSlimDriver(connection, port=port)
+            except serial.SerialException:
+                continue
+
+            with suppress(Exception):
+                found[port] = driver._send_command("info")
+            driver.close()
+
+        return found
+
+    @classmethod
+    def discover(cls, protocol, names=("plate", "reagent"), pattern="/dev/ttyUSB*"):
+        """
+        Make a manager with one block for each of the names from the ports that answer, in port order.  When
+        simulating the blocks without a port run in the dummy mode.
+        @param protocol:
+        @param names:
+        @param pattern:
+        @return: ColdPlateManager
+        """
+        ports = list(cls.discover_ports(pattern))
+
+        # A single plate whose firmware is slow to answer info, or doesn't, is assumed to be on /dev/ttyUSB0 the way
+        # it always was.
+        if not ports and len(names) == 1 and not protocol.is_simulating():
+            protocol.comment("No cold plate answered on {}.  Using /dev/ttyUSB0".format(pattern))
+            return cls(protocol, {names[0]: "/dev/ttyUSB0"})
+
+        if len(ports) < len(names) and not protocol.is_simulating():
+            raise Exception("Found {} cold plates for {} blocks: {}".format(len(ports), len(names), ", ".join(names)))
+
+        ports += [None] * (len(names) - len(ports))
+        return cls(protocol, dict(zip(names, ports)))
+
+    def add(self, name, port=None, temp_mode_number=0):
+        """
+        Connect a block and start its worker thread.
+        @param name:
+        @param port:
+        @param temp_mode_number: Used for /dev/ttyUSB<temp_mode_number> when there is no port.
+        @return: ColdPlateSlimDriver
+        """
+        if name in self.drivers:
+            raise Exception("There is already a cold plate block named {}".format(name))
+
+        driver = ColdPlateSlimDriver(BlockProtocol(self.protocol, name, self._comments),
+                                     temp_mode_number=temp_mode_number, port=port)
+
+        # A plate that reports its serial number gets its own ramp model.  One that doesn't answer info has no
+        # serial number and so no model.
+        try:
+            self.info[name] = driver.get_info()
+        except Exception as error:
+            self.info[name] = ""
+            driver.serial_number = ""
+            driver.ramp_model = {}
+            self.protocol.comment("{}: no info from the cold plate on {}.  {}".format(name, driver.device_name, error))
+
+        serial_number = re.search(r"\bSN\s*(\w+)", self.info[name])
+        if serial_number:
+            driver.serial_number = serial_number.group(1)
+            driver.ramp_model = driver.load_ramp_model()
+
+        self.drivers[name] = driver
+        self._executors[name] = concurrent.futures.ThreadPoolExecutor(max_workers=1,
+                                                                      thread_name_prefix="cold_plate_" + name)
+        return driver
+
+    def __getitem__(self, name):
+        return self.drivers[name]
+
+    def submit(self, name, function, *args, **kwargs):
+        """
+        Run function(driver, *args, **kwargs) on the block's worker thread.
+        @return: concurrent.futures.Future
+        """
+        return self._executors[name].submit(function, self.drivers[name], *args, **kwargs)
+
+    def set_temp(self, name, target_temp):
+        return self.submit(name, ColdPlateSlimDriver.set_temp, target_temp)
+
+    def wait(self, name, target_temp, **kwargs):
+        """
+        Set the temperature and wait until the block is stable at it.  kwargs go to set_temp_andWait.
+        @return: concurrent.futures.Future with the target temperature.
+        """
+        return self.submit(name, ColdPlateSlimDriver.set_temp_andWait, target_temp, **kwargs)
+
+    def quick_temp(self, name, temp_target, overshot=10, undershot=3):
+        """
+        Overshoot to the target the way quick_temp does.
+        @return: concurrent.futures.Future with the target temperature once it is set.
+        """
+        return self.submit(name, lambda driver: driver.quick_temp_async(temp_target, overshot, undershot)
+                           .wait_until_ready())
+
+    async def async_set_temp(self, name, target_temp):
+        return await asyncio.wrap_future(self.set_temp(name, target_temp))
+
+    async def async_wait(self, name, target_temp, **kwargs):
+        return await asyncio.wrap_future(self.wait(name, target_temp, **kwargs))
+
+    async def async_quick_temp(self, name, temp_target, overshot=10, undershot=3):
+        return await asyncio.wrap_future(self.quick_temp(name, temp_target, overshot, undershot))
+
+    def flush_comments(self):
+        """
+        Write the queued block comments to the run log.  Call from the protocol thread.
+        """
+        while self._comments:
+            self.protocol.comment(self._comments.pop(0))
+
+    def wait_all(self, *futures):
+        """
+        Block the protocol thread until the futures are done, writing the block comments as they come.
+        @return: List of the results in order.  The first error is raised.
+        """
+        pending = set(futures)
+        while pending:
+            done, pending = concurrent.futures.wait(pending, timeout=1)
+            self.flush_comments()
+
+        return [future.result() for future in futures]
+
+    def close(self):
+        """
+        Stop the worker threads once their commands are done, stop the temperature logs and close the serial ports.
+        The blocks hold their temperatures.
+        """
+        for executor in self._executors.values():
+            executor.shutdown(wait=True)
+        for driver in self.drivers.values():
+            if driver.telemetry is not None:
+                driver.telemetry.stop()
+            driver.close()
+        self.flush_comments()
+
+    def deactivate(self):
+        """
+        Turn every block off and close the serial ports.  Commands that have not started are dropped and ramps are
+        cancelled so a failed run does not wait for them.  A wait that is running ends when its port closes.
+        """
+        for name, driver in self.drivers.items():
+            if driver.ramp is not None:
+                driver.ramp.cancel()
+            self._executors[name].shutdown(wait=False, cancel_futures=True)
+
+        for driver in self.drivers.values():
+            driver.deactivate()
+            driver.close()
+        self.flush_comments()
+
+
+class WellGeometry:
+    """
+    Liquid height for a volume in a well using the depth, diameter or length and width, and totalLiquidVolume from
+    the labware definition.  A circular well that holds less than a cylinder of its depth is treated as a cylinder on
+    a cone that takes up the difference.  The cone is never taken as taller than the well is wide so any error puts the
+    tip deeper rather than above the liquid.  Rectangular wells are treated as flat bottomed.
+
+    The volume to height table is built once for each well type with one entry per uL.
+    """
+    _tables = {}
+
+    def __init__(self, well):
+        key = (well.parent.load_name, well.depth, well.diameter, well.length, well.width, well.max_volume)
+        if key not in WellGeometry._tables:
+            WellGeometry._tables[key] = self._build_table(well)
+        self.area, self.table = WellGeometry._tables[key]
+
+    @staticmethod
+    def _build_table(well):
+        volumes = np.arange(0, math.ceil(well.max_volume) + 1, dtype=float)
+
+        if well.diameter:
+            area = math.pi * (well.diameter / 2) ** 2
+            cone_height = 3 * (area * well.depth - well.max_volume) / (2 * area)
+            cone_height = min(max(cone_height, 0), well.diameter)
+        else:
+            area = well.length * well.width
+            cone_height = 0
+
+        cone_vol = area * cone_height / 3
+        heights = cone_height + (volumes - cone_vol) / area
+        if cone_height:
+            in_cone = volumes < cone_vol
+            heights[in_cone] = np.cbrt(3 * volumes[in_cone] * cone_height ** 2 / area)
+
+        return area, heights
+
+    def height(self, volume):
+        """
+        Return the height of the liquid surface in mm above the bottom of the well.
+        @param volume:
+        @return:
+        """
+        if volume <= 0:
+            return 0.0
+
+        last = len(self.table) - 1
+        if volume >= last:
+            return float(self.table[last] + (volume - last) / self.area)
+
+        i = int(volume)
+        return float(self.table[i] + (volume - i) * (self.table[i + 1] - self.table[i]))
+
+
+class VolumeTracker:
+    """
+    Liquid volume in each well keyed by (slot, well).  Wells that were never given a volume and have not had anything
+    dispensed into them are not tracked.
+    """
+    def __init__(self):
+        self._volumes = {}
+        self._max_volumes = {}
+
+    @staticmethod
+    def _key(well):
+        return str(well.parent.parent), well.well_name
+
+    def set_volume(self, well, volume):
+        key = self._key(well)
+        self._volumes[key] = float(volume)
+        self._max_volumes[key] = max(float(volume), well.max_volume)
+
+    def volume(self, well):
+        return self._volumes.get(self._key(well))
+
+    def aspirate(self, well, volume):
+        key = self._key(well)
+        if key not in self._volumes:
+            return
+
+        remaining_vol = round(self._volumes[key] - volume, 2)
+        if remaining_vol < 0:
+            raise Exception("{} would run dry.  {} uL requested, {} uL left"
+                            .format(well, volume, round(self._volumes[key], 2)))
+        self._volumes[key] = remaining_vol
+
+    def dispense(self, well, volume):
+        key = self._key(well)
+        if key not in self._volumes:
+            self._volumes[key] = 0.0
+            self._max_volumes[key] = well.max_volume
+
+        new_vol = round(self._volumes[key] + volume, 2)
+        if new_vol > self._max_volumes[key]:
+            raise Exception("{} would overflow.  {} uL is more than the {} uL it holds"
+                            .format(well, new_vol, self._max_volumes[key]))
+        self._volumes[key] = new_vol
+
 
 class Utilities:
     def __init__(self, protocol):
 
-        # TSV file location on OT-2
-        tsv_file_path = "{0}var{0}lib{0}jupyter{0}notebooks{0}ProcedureFile.tsv".format(os.sep)
-        self.on_ot2 = True
-        # If not on the OT-2, get temp TSV file location on Windows Computers for simulation
-        if not os.path.isfile(tsv_file_path):
-            self.on_ot2 = False
-            tsv_file_path = "C:{0}Users{0}{1}{0}Documents{0}TempTSV.tsv".format(os.sep, os.getlogin())
-
-        self.parameter_file = tsv_file_path
-        self.sample_dictionary = defaultdict(list)
+        # The sample sheet comes from the runtime parameter.  The TSV file is only used without it.
+        self.sample_sheet = sample_sheet_contents(protocol)
+        self.parameter_file = None
+        self.on_ot2 = False
+        if not self.sample_sheet:
+            self.parameter_file = parameter_file_path()
+            self.on_ot2 = \
+                self.parameter_file == "{0}var{0}lib{0}jupyter{0}notebooks{0}ProcedureFile.tsv".format(os.sep)
+        self.sample_dictionary = {}
         self.protocol = protocol
         self.args = None
         self.slot_list = \
@@ -773,14 +1896,36 @@ class Utilities:
         self.tipbox_dict = \
             {"p10_multi": "opentrons_96_tiprack_10ul", "p10_single": "opentrons_96_tiprack_10ul",
              "p20_single_gen2": ["opentrons_96_tiprack_20ul", "opentrons_96_filtertiprack_20ul"],
-             "p300_single_gen2": ["opentrons_96_tiprack_300ul", "opentrons_96_filtertiprack_200ul"]
+             "p300_single_gen2": ["opentrons_96_tiprack_300ul", "opentrons_96_filtertiprack_200ul"],
+             "p20_multi_gen2": ["opentrons_96_tiprack_20ul", "opentrons_96_filtertiprack_20ul"],
+             "p300_multi_gen2": ["opentrons_96_tiprack_300ul", "opentrons_96_filtertiprack_200ul"]
+             }
+        # Largest volume we put in each tip type, keyed by tip size in uL.
+        self.tip_volume_limits = {10: 9.5, 20: 19.0, 200: 195.0, 300: 295.0}
+
+        # Disposal volume (uL) used when distributing reagents.  Flow rates come from the liquid classes.
+        self.distribute_settings = \
+            {"p10_single": {"disposal_vol": 1.0}, "p10_multi": {"disposal_vol": 1.0},
+             "p20_single_gen2": {"disposal_vol": 2.0}, "p300_single_gen2": {"disposal_vol": 30.0},
+             "p20_multi_gen2": {"disposal_vol": 2.0}, "p300_multi_gen2": {"disposal_vol": 30.0}
              }
+        self.liquid_classes = {}
+
+        # Pipette mount: the (aspirate, dispense, blow out) flow rates the pipette was loaded with.
+        self._default_flow_rates = {}
         self._labware_dict = {}
         self._slot_dict = {}
         self._left_tiprack_list = []
         self._right_tiprack_list = []
         self.left_pipette = None
         self.right_pipette = None
+        self.volumes = VolumeTracker()
+
+        # Stage name: [mm of X/Y travel before, after order_wells] for the distributes.  Logged at the end of the run.
+        self.travel = OrderedDict()
+
+        # How far below the liquid surface the tip goes when aspirating from a reservoir, mm.
+        self.tip_submerge = 2.0
 
     def dispense_reagent_mix(self, labware_dict, target_well_dict, target_info_dict, left_pipette, right_pipette):
         """
@@ -795,43 +1940,44 @@ class Utilities:
         """
 
         sample_destination_labware = labware_dict[self.args.PCR_PlateSlot]
-
-        # Dispense reagents into all wells
-        reagent_aspirated = float(self.args.MasterMixPerRxn)
+        reagent_per_rxn = self.args.MasterMixPerRxn
 
         for target in target_well_dict:
             reagent_slot = self.args.ReagentSlot
             if "Illumina_Dual_Indexing" in self.args.Template:
                 reagent_source_well = self.args.PCR_ReagentWell
-                reagent_well_vol = float(self.args.TotalReagentVolume)
             else:
                 reagent_source_well = target_info_dict[int(target)][1]
-                reagent_well_vol = float(target_info_dict[int(target)][2])
 
-            target_well_list = target_well_dict[target]
             reagent_source_labware = labware_dict[reagent_slot]
-            reagent_well_dia = reagent_source_labware[reagent_source_well].diameter
+            target_well_list = \
+                self.multi_channel_dispense(self.multi_channel_pipette(left_pipette, right_pipette),
+                                            reagent_source_labware[reagent_source_well], sample_destination_labware,
+                                            {well: reagent_per_rxn for well in target_well_dict[target]}, "master mix",
+                                            "master_mix")
+            if not target_well_list:
+                continue
+
+            # Same rule as the water.  Small volumes stay with the P20, otherwise the pipette is picked on the total
+            # volume so the P300 can multi-dispense the master mix.
+            if reagent_per_rxn <= 9:
+                volume = reagent_per_rxn
+            else:
+                volume = reagent_per_rxn * len(target_well_list)
 
-            reagent_pipette = \
-                self.pipette_selection(left_pipette, right_pipette, float(self.args.MasterMixPerRxn))
+            reagent_pipette = self.pipette_selection(left_pipette, right_pipette, volume)
 
             if "Illumina_Dual_Indexing" not in self.args.Template:
                 #  If there is no reagent to pipette, then there should be no log entry.
-                if target_info_dict[int(target)][1] == "0.0":
-                    self.protocol.comment("\nDispensing {} target with {}"
-                                          .format(target_info_dict[int(target)][1], reagent_pipette))
+                if target_info_dict[int(target)][1] != "0.0":
+                    self.protocol.comment("\nDispensing {} master mix with {}"
+                                          .format(target_info_dict[int(target)][0], reagent_pipette))
             else:
                 self.protocol.comment("\nDispensing Master Mix with {}".format(reagent_pipette))
 
-            for well in target_well_list:
-                reagent_tip_height = self.res_tip_height(reagent_well_vol - reagent_aspirated, reagent_well_dia)
-                self.pipette_reagents(reagent_pipette,
-                                         reagent_source_labware[reagent_source_well].bottom(reagent_tip_height),
-                                         sample_destination_labware[well], float(self.args.MasterMixPerRxn),
-                                         NewTip=False, MixReaction=False, touch=True, MixVolume=None
-                                         )
-
-                reagent_aspirated += float(self.args.MasterMixPerRxn)
+            destinations = [(sample_destination_labware[well], reagent_per_rxn) for well in target_well_list]
+            self.distribute_reagents(reagent_pipette, reagent_source_labware[reagent_source_well], destinations,
+                                     liquid_class="master_mix", stage="master mix")
 
             # Drop any tips the pipettes might have.
             if "Illumina_Dual_Indexing" not in self.args.Template:
@@ -847,23 +1993,78 @@ class Utilities:
             except AttributeError:
                 pass
 
+    def liquid_class(self, pipette, name):
+        """
+        Return the settings for a liquid class and set the pipette blow out flow rate for it.  Aspirate, dispense and
+        mix rates are passed to each command.
+        @param pipette:
+        @param name: Liquid class name.
+        @return:
+        """
+        try:
+            liquid = self.liquid_classes[name]
+        except KeyError:
+            raise Exception("No liquid class named {}".format(name))
+
+        default_rates = self._default_flow_rates.setdefault(
+            pipette.mount, (pipette.flow_rate.aspirate, pipette.flow_rate.dispense, pipette.flow_rate.blow_out))
+        pipette.flow_rate.aspirate, pipette.flow_rate.dispense = default_rates[0], default_rates[1]
+        pipette.flow_rate.blow_out = round(default_rates[2] * liquid.blow_out_rate, 2)
+
+        return liquid
+
+    def liquid_delay(self, seconds):
+        if seconds > 0:
+            self.protocol.delay(seconds=seconds)
+
+    def touch_tip(self, pipette, liquid):
+        if liquid.touch_tip:
+            pipette.touch_tip(radius=0.79, v_offset=-2, speed=liquid.touch_speed)
+
+    def plan_mix(self, pipette, well, liquid):
+        """
+        Choose the mix repetitions, volume and rate for what is in a well now.  Each stroke is taken to exchange the
+        share of the well it draws up so (1 - mix volume / well volume) ** repetitions of the well is left unmixed.
+        The largest mix volume the well and tip allow gives the fewest repetitions.  Small mix volumes are mixed
+        slower so a stroke never takes less than mix_stroke_time.
+        @param pipette:
+        @param well:
+        @param liquid: Liquid class settings.
+        @return: Repetitions, volume, rate and the share left unmixed.  Repetitions is 0 if the well can't be mixed.
+        """
+        well_vol = self.volumes.volume(well)
+        if well_vol is None:
+            well_vol = self.args.PCR_Volume
+
+        mix_vol = round(min(well_vol * liquid.mix_fraction, self.tip_capacity(pipette)), 1)
+        if mix_vol < pipette.min_volume or liquid.mix_reps < 1:
+            return 0, mix_vol, liquid.mix_rate, 1.0
+
+        unmixed_per_stroke = 1 - mix_vol / well_vol
+        repetitions = 1
+        if unmixed_per_stroke > 0:
+            repetitions = math.ceil(round(math.log(liquid.mix_target) / math.log(unmixed_per_stroke), 4))
+        repetitions = max(1, min(repetitions, liquid.mix_reps))
+
+        rate = min(liquid.mix_rate, mix_vol / (liquid.mix_stroke_time * pipette.flow_rate.aspirate))
+
+        return repetitions, mix_vol, round(rate, 2), unmixed_per_stroke ** repetitions
+
     def pipette_reagents(self, pipette, source_location, destination_location, volume, NewTip, MixReaction,
-                         touch=False, MixVolume=None):
+                         liquid_class="dna"):
         """
-        Generic function to dispense material into designated well.
-        @param MixVolume:
+        Generic function to dispense material into designated well.  How the liquid is handled comes from its liquid
+        class.  Mixing is planned from the volume in the destination well.
         @param pipette:
         @param source_location:
         @param destination_location:
         @param volume:
         @param NewTip:
         @param MixReaction:
-        @param touch:
+        @param liquid_class: Name of the liquid class.
         @return:
         """
-
-        def tip_touch():
-            pipette.touch_tip(radius=0.79, v_offset=-2, speed=10)
+        liquid = self.liquid_class(pipette, liquid_class)
 
         if NewTip:
             if pipette.has_tip:
@@ -872,103 +2073,230 @@ class Utilities:
         if not pipette.has_tip:
             pipette.pick_up_tip()
 
-        pipette.aspirate(volume, source_location, rate=0.75)
-        if touch:
-            tip_touch()
+        pipette.aspirate(volume, source_location, rate=liquid.aspirate_rate)
+        self.volumes.aspirate(self.location_well(source_location), volume)
+        self.liquid_delay(liquid.aspirate_delay)
 
-        pipette.dispense(volume, destination_location, rate=0.75)
-
-        if not MixReaction:
-            pipette.blow_out()
+        # The air gap has to fit in the tip with the liquid.
+        air_gap = round(min(liquid.air_gap, self.tip_capacity(pipette) - volume), 1)
+        if air_gap > 0:
+            pipette.air_gap(air_gap)
+        else:
+            air_gap = 0
+
+        pipette.dispense(volume + air_gap, destination_location, rate=liquid.dispense_rate)
+        self.volumes.dispense(self.location_well(destination_location), volume)
+        self.liquid_delay(liquid.dispense_delay)
+
+        if MixReaction and liquid.mix_reps:
+            destination_well = self.location_well(destination_location)
+            repetitions, mix_vol, rate, unmixed = self.plan_mix(pipette, destination_well, liquid)
+            if repetitions:
+                self.protocol.comment("Mix plan: {} times with {} of {} uL at {}x, {}% unmixed".format(
+                    repetitions, mix_vol, self.volumes.volume(destination_well), rate, round(unmixed * 100, 1)))
+                pipette.mix(repetitions=repetitions, volume=mix_vol, rate=rate)
+            else:
+                self.protocol.comment("Mix plan: {} uL in {} is too little to mix with {}"
+                                      .format(self.volumes.volume(destination_well), destination_well, pipette))
 
-        if MixReaction:
-            v = float(self.args.PCR_Volume)
-            if MixVolume:
-                v = MixVolume
-            vol = round(v * 0.65, ndigits=1)
-            pipette.mix(repetitions=4, volume=vol, rate=2.0)
+        if liquid.blow_out == "destination":
             pipette.blow_out()
-            tip_touch()
+        elif liquid.blow_out == "source":
+            pipette.blow_out(self.location_well(source_location))
+        elif liquid.blow_out == "trash":
+            pipette.blow_out(pipette.trash_container)
 
-        if touch:
-            tip_touch()
+        self.touch_tip(pipette, liquid)
 
         if NewTip:
             pipette.drop_tip()
 
         return pipette
 
-    def res_tip_height(self, res_vol, well_dia):
+    def track_reagents(self, target_info_dict):
         """
-        Calculate the height of the liquid in a reservoir and return the value to set the pipette tip height.
-        This works for both conical shapes and cylinders.
-        @param res_vol:
-        @param well_dia:
+        Give the water and reagent wells their starting volumes.
+        @param target_info_dict:
+        """
+        reagent_labware = self._labware_dict[self.args.ReagentSlot]
+        self.volumes.set_volume(reagent_labware[self.args.WaterResWell], self.args.WaterResVol)
+
+        if "Illumina_Dual_Indexing" in self.args.Template:
+            self.volumes.set_volume(reagent_labware[self.args.PCR_ReagentWell], self.args.TotalReagentVolume)
+            return
+
+        for target in target_info_dict:
+            # Blank targets and targets without a reagent volume are not tracked.
+            if not target_info_dict[target] or target_info_dict[target][2] is None:
+                continue
+            with suppress(KeyError):
+                reagent_well = reagent_labware[target_info_dict[target][1]]
+                self.volumes.set_volume(reagent_well, target_info_dict[target][2])
+
+    @staticmethod
+    def location_well(location):
+        """
+        Return the well for a well or a location in a well.
+        @param location:
         @return:
         """
-        cone_vol = self.labware_cone_volume(self.args.ReagentSlot)
-        bottom_offset = float(self.args.BottomOffset)
-        cone_height = (3 * cone_vol / (math.pi * ((well_dia / 2) ** 2)))
+        if hasattr(location, "labware"):
+            return location.labware.as_well()
+        return location
 
-        if cone_vol > 500:
-            offset = 11
-            cone_offset = 5
-        else:
-            offset = 5
-            cone_offset = 2
+    def aspirate_location(self, well, volume):
+        """
+        Record the aspiration and return where to put the tip.  The height is set for what will be left in the well
+        so the tip stays below the surface.  Wells we are not tracking are used as is.
+        @param well:
+        @param volume:
+        @return:
+        """
+        self.volumes.aspirate(well, volume)
+        remaining_vol = self.volumes.volume(well)
+        if remaining_vol is None:
+            return well
 
-        if res_vol > cone_vol:
-            height = ((res_vol - cone_vol) / (math.pi * ((well_dia / 2) ** 2))) - offset + cone_height
-        else:
-            height = (3 * res_vol / (math.pi * ((well_dia / 2) ** 2))) - cone_offset
+        return well.bottom(self.res_tip_height(remaining_vol, well))
+
+    def res_tip_height(self, res_vol, well):
+        """
+        Return the pipette tip height for the liquid in a well.  The tip goes tip_submerge mm below the surface but
+        never lower than the bottom offset.
+        @param res_vol:
+        @param well:
+        @return:
+        """
+        bottom_offset = self.args.BottomOffset
+        height = WellGeometry(well).height(res_vol) - self.tip_submerge
 
         if height < bottom_offset:
             height = bottom_offset
 
         return round(height, ndigits=1)
 
-    def labware_cone_volume(self, labware_slot):
+    @staticmethod
+    def pipette_selection(left_pipette, right_pipette, volume):
         """
-        Based on the labware and reservoir return the volume at which the cylinder shape transitions to the
-        conical shape.
-
-        @param labware_slot:
+        Function to select a pipette based on expected volumes.  Only single channel pipettes are returned.
+        @param left_pipette:
+        @param right_pipette:
+        @param volume:
         @return:
         """
-        cone_vol = 200
-        labware = getattr(self.args, "Slot{}".format(labware_slot), "")
+        # ToDo: This will not run on a FLEX and is error prone.  Need to allow more pipettes
+        if volume > 20:
+            pipettes = [right_pipette, left_pipette]
+            model = "P300 Single-Channel GEN2"
+        else:
+            pipettes = [left_pipette, right_pipette]
+            model = "P20 Single-Channel GEN2"
 
-        if "_1.5ml" in labware:
-            cone_vol = 415
+        single_channel = [pipette for pipette in pipettes if "Single-Channel" in str(pipette)]
+        for pipette in single_channel:
+            if model in str(pipette):
+                return pipette
 
-        elif "_5000ul_" in labware:
-            cone_vol = 1300
+        if single_channel:
+            return single_channel[0]
 
-        return cone_vol
+        raise Exception("The samples and any wells that are not whole columns need a single channel pipette.  "
+                        "Both mounts have {} and {}.".format(left_pipette, right_pipette))
 
     @staticmethod
-    def pipette_selection(left_pipette, right_pipette, volume):
+    def multi_channel_pipette(left_pipette, right_pipette):
         """
-        Function to select a pipette based on expected volumes.  Will also adjust volume is pipette needs to pick up >1x
+        Return the 8-channel pipette if one is loaded.
         @param left_pipette:
         @param right_pipette:
-        @param volume:
         @return:
         """
-        # ToDo: This will not run on a FLEX and is error prone.  Need to allow more pipettes
-        pipette = ""
-        if volume > 20:
-            if "P300 Single-Channel GEN2" in str(right_pipette):
-                pipette = right_pipette
-            else:
-                pipette = left_pipette
-        elif volume <= 20:
-            if "P20 Single-Channel GEN2" in str(left_pipette):
-                pipette = left_pipette
-            else:
-                pipette = right_pipette
+        for pipette in [left_pipette, right_pipette]:
+            if "8-Channel" in str(pipette):
+                return pipette
 
-        return pipette
+        return None
+
+    @staticmethod
+    def multi_channel_source(well):
+        """
+        True if all 8 channels can reach the liquid.  That needs a trough longer than the 63 mm from the first to the
+        last channel.
+        @param well:
+        @return:
+        """
+        return bool(well.width) and well.width > 7 * 9
+
+    @staticmethod
+    def channel_wells(well, channels):
+        """
+        Return the wells an 8-channel pipette reaches when its first channel is at this well.
+        @param well:
+        @param channels:
+        @return:
+        """
+        if channels == 1:
+            return [well]
+
+        for column in well.parent.columns():
+            if well in column:
+                index = column.index(well)
+                return column[index:index+channels]
+
+        return [well]
+
+    @staticmethod
+    def column_plan(labware, well_values):
+        """
+        Find the columns where every well gets the same reagent and volume so they can be done with one 8-channel
+        transfer.
+        @param labware:
+        @param well_values: Dictionary of well name to what the well gets.  Usually the volume.
+        @return: List of (first well name, value) for the whole columns and a list of the wells that are left.
+        """
+        columns = []
+        column_wells = set()
+        for column in labware.columns():
+            well_names = [well.well_name for well in column]
+
+            if len(well_names) != 8 or any(well_name not in well_values for well_name in well_names):
+                continue
+
+            if len({well_values[well_name] for well_name in well_names}) == 1:
+                columns.append((well_names[0], well_values[well_names[0]]))
+                column_wells.update(well_names)
+
+        remaining_wells = [well_name for well_name in well_values if well_name not in column_wells]
+
+        return columns, remaining_wells
+
+    def multi_channel_dispense(self, pipette, source_well, destination_labware, well_values, reagent, liquid_class):
+        """
+        Distribute to the whole columns with the 8-channel pipette.
+        @param pipette:
+        @param source_well:
+        @param destination_labware:
+        @param well_values: Dictionary of well name to volume.
+        @param reagent: Name used in the run log.
+        @param liquid_class:
+        @return: List of the wells that still need to be done with a single channel.
+        """
+        if pipette is None:
+            return list(well_values)
+
+        if not self.multi_channel_source(source_well):
+            self.protocol.comment("{} is not in a reservoir all 8 channels can reach.  Using single channel."
+                                  .format(reagent))
+            return list(well_values)
+
+        columns, remaining_wells = self.column_plan(destination_labware, well_values)
+        if columns:
+            self.protocol.comment("\nDistributing {} to {} columns with {}".format(reagent, len(columns), pipette))
+            destinations = [(destination_labware[well], volume) for well, volume in columns]
+            self.distribute_reagents(pipette, source_well, destinations, liquid_class=liquid_class, stage=reagent)
+            pipette.drop_tip()
+
+        return remaining_wells
 
     def dispense_water(self, water_well_dict, left_pipette, right_pipette):
         """
@@ -978,159 +2306,284 @@ class Utilities:
         @param water_well_dict:
         @param left_pipette:
         @param right_pipette:
-        @return:
         """
 
         # reagent_labware = self._labware_dict[self.args.ReagentSlot]
         sample_destination_labware = self._labware_dict[self.args.PCR_PlateSlot]
-        '''
-        bottom_offset = float(args.BottomOffset)
-        cone_vol = Utilities.labware_cone_volume(args, reagent_labware)
-        water_res_well_dia = reagent_labware[args.WaterResWell].diameter
-        water_tip_height = Utilities.res_tip_height(float(args.WaterResVol), water_res_well_dia, cone_vol, bottom_offset)
-        water_aspirated = 0
-        '''
-
-        destination_wells = []
-        dispense_vol = []
-        water_aspirated = 0
-
-        for well in water_well_dict:
-            destination_wells.append(sample_destination_labware[well])
-            # destination_wells.append(well)
-            dispense_vol.append(round(float(water_well_dict[well]), 2))
-            water_aspirated += water_well_dict[well]
-
-        water_aspirated = round(water_aspirated, 2)
-        if min(dispense_vol) <= 9:
-            volume = max(dispense_vol)
-        else:
-            volume = water_aspirated
+        source_well = self._labware_dict[self.args.ReagentSlot][self.args.WaterResWell]
+
+        well_volumes = {well: round(float(water_well_dict[well]), 2) for well in water_well_dict}
+        remaining_wells = \
+            self.multi_channel_dispense(self.multi_channel_pipette(left_pipette, right_pipette), source_well,
+                                        sample_destination_labware, well_volumes, "water", "water")
+        if not remaining_wells:
+            return
+
+        destinations = []
+        for well in remaining_wells:
+            destinations.append((sample_destination_labware[well], well_volumes[well]))
 
         # Define the pipette for dispensing the water.
-        water_pipette = self.pipette_selection(left_pipette, right_pipette, volume)
+        water_pipette = \
+            self.pipette_selection(left_pipette, right_pipette,
+                                   self.dispense_volume([volume for well, volume in destinations]))
         self.protocol.comment("\nDistributing water with {} pipette".format(water_pipette))
 
         # Use custom distribute command to dispense water.
-        self.distribute_reagents(water_pipette, destination_wells, dispense_vol)
+        self.distribute_reagents(water_pipette, source_well, destinations, liquid_class="water")
 
         self.drop_any_tips([left_pipette, right_pipette])
 
-        return water_aspirated
+    @staticmethod
+    def dispense_volume(volumes):
+        """
+        Return the volume to select a pipette on when one tip dispenses to several wells.  Small volumes need the
+        accuracy of the P20 so the largest single volume is used.  Otherwise it is the total so one aspiration of the
+        larger pipette can cover several wells.
+        @param volumes: List of the volumes dispensed to each well.
+        @return:
+        """
+        if min(volumes) <= 9:
+            return max(volumes)
+
+        return round(sum(volumes), 2)
 
-    def distribute_reagents(self, pipette, destination_wells, dispense_vol):
+    def tip_capacity(self, pipette, tip_type=None):
         """
-        Dispense reagents using a custom distribute function.
+        Return the volume we allow in a tip.  Leaves a little room at the top of the tip.
         @param pipette:
-        @param destination_wells:
-        @param dispense_vol:
+        @param tip_type: Tip rack load name.  If not given it is taken from the tip racks assigned to the pipette.
+        @return:
         """
+        if tip_type is None:
+            tip_type = pipette.tip_racks[0].load_name
 
-        # ToDo: This needs work.
-        p20_default_rate = 7.50
-        p300_default_rate = 75.0
-        #  p300_default_rate = 92.86
-        # p20 = False
-        source_well = self._labware_dict[self.args.ReagentSlot][self.args.WaterResWell]
+        max_tip_vol = 0
+        for tip_vol in self.tip_volume_limits:
+            if "_{}ul".format(tip_vol) in tip_type:
+                max_tip_vol = self.tip_volume_limits[tip_vol]
 
-        p20_tips = False
-        p200_tips = False
-        p300_tips = False
-
-        if "p300_single_gen2" in self.protocol.params.left_pipette and "P300 Single-Channel GEN2" in str(pipette):
-            if any("300" in str(s) for s in self._left_tiprack_list):
-                p300_tips = True
-            elif any("200" in str(s) for s in self._left_tiprack_list):
-                p200_tips = True
-        elif "p20_single_gen2" in self.protocol.params.left_pipette and "P20 Single-Channel GEN2" in str(pipette):
-            p20_tips = True
-        elif "p300_single_gen2" in self.protocol.params.right_pipette and "P300 Single-Channel GEN2" in str(pipette):
-            if any("300" in str(s) for s in self._left_tiprack_list):
-                p300_tips = True
-            elif any("200" in str(s) for s in self._left_tiprack_list):
-                p200_tips = True
-        elif "p20_single_gen2" in self.protocol.params.right_pipette and "P20 Single-Channel GEN2" in str(pipette):
-            p20_tips = True
-
-        if p20_tips:
-            max_tip_vol = 19.0
-        elif p200_tips:
-            max_tip_vol = 195.0
-        elif p300_tips:
-            max_tip_vol = 295.0
-
-        if "P300 Single-Channel GEN2" in str(pipette):
-            # print("Distributing Water With P300 Single-Channel GEN2")
-            # touch = False
-            # r = 0.25
-            # s = 10
-            default_rate = p300_default_rate
-            pipette.flow_rate.aspirate = 30
-            pipette.flow_rate.dispense = 10
-            pipette.flow_rate.blow_out = 50
-            disposal_vol = 30
-
-        elif "P20 Single-Channel GEN2" in str(pipette):
-            print("Distributing Water With P20 Single-Channel GEN2")
-            # p20 = True
-            # touch = False
-            # r = 0.80
-            # s = 10
-            default_rate = p20_default_rate
-            pipette.flow_rate.aspirate = 6.5
-            pipette.flow_rate.dispense = 5.0
-            pipette.flow_rate.blow_out = 7.0
-            disposal_vol = 2.0
-
-        total_vol = 0
-        # p20_vol = 0.0
-        # p20_dispense_list = []
-        # p20_destination_wells = []
-        water_res_vol = float(self.args.WaterResVol)
-
-        tip_vol = 0.0
-        dispense_list = []
-        well_distribution = []
+        if not max_tip_vol:
+            raise Exception("No tip volume defined for {}".format(tip_type))
 
-        if not pipette.has_tip:
-            pipette.pick_up_tip()
+        return min(max_tip_vol, pipette.max_volume)
 
-        i = 0
+    @staticmethod
+    def plan_aspirations(destinations, capacity, keep_order=False):
+        """
+        Pack the (destination, volume) pairs into as few aspirations as possible using first fit decreasing.  Volumes
+        larger than the capacity are split into equal parts rounded to 0.1 uL, with the last part taking what is left
+        so the parts add up to the volume.  Each aspiration keeps the wells in their input order.
+        @param destinations: List of (destination well, volume) tuples
+        @param capacity: Largest volume that can be dispensed from one aspiration.
+        @param keep_order: Fill each aspiration with the next wells in the list instead.  Used when the wells are
+        already in travel order so an aspiration only covers wells that are close together.
+        @return: List of aspirations, each a list of (destination well, volume) tuples
+        """
+        parts = []
+        for index, (well, volume) in enumerate(destinations):
+            if volume <= 0:
+                continue
+            split = math.ceil(round(volume / capacity, 4))
+            while True:
+                part_volume = round(volume / split, 1)
+                last_volume = round(volume - part_volume * (split - 1), 4)
+                if last_volume <= capacity + 1e-6:
+                    break
+                # Rounding the other parts down left too much for the last one.
+                split += 1
+
+            for i in range(split - 1):
+                parts.append((index, well, part_volume))
+            parts.append((index, well, last_volume))
+
+        aspirations = []
+        free_space = []
+        if keep_order:
+            for part in parts:
+                if aspirations and part[2] <= free_space[-1] + 1e-6:
+                    aspirations[-1].append(part)
+                    free_space[-1] = round(free_space[-1] - part[2], 4)
+                else:
+                    aspirations.append([part])
+                    free_space.append(round(capacity - part[2], 4))
 
-        # Trying to keep the tip from being submerged in the source well liquid
-        for volume, dest_well in zip(dispense_vol, destination_wells):
-            total_vol += volume
-            tip_vol += volume
-            dispense_list.append(volume)
-            well_distribution.append(dest_well)
-            i += 1
+            return [[(well, volume) for index, well, volume in aspiration] for aspiration in aspirations]
 
-            # For some reason this value is getting 1e-5 added to it occasionally.  Rounding corrects this.
-            tip_vol = round(tip_vol, 1)
+        for part in sorted(parts, key=lambda x: (-x[2], x[0])):
+            for i in range(len(aspirations)):
+                if part[2] <= free_space[i] + 1e-6:
+                    aspirations[i].append(part)
+                    free_space[i] = round(free_space[i] - part[2], 4)
+                    break
+            else:
+                aspirations.append([part])
+                free_space.append(round(capacity - part[2], 4))
 
-            # Need to keep the volume in the tips below their max vol while dynamically changing the tip height.
-            #  My hack to get a dispense like function that will keep the same tip
-            if i == len(dispense_vol) or dispense_vol[i] + tip_vol + disposal_vol >= max_tip_vol:
-                water_res_vol = round(water_res_vol, 1)
-                height = self.res_tip_height(water_res_vol, source_well.diameter)
-                aspirated_vol = tip_vol + disposal_vol
+        aspirations = [sorted(aspiration) for aspiration in aspirations]
+        aspirations.sort()
 
-                pipette.aspirate(volume=aspirated_vol, location=source_well.bottom(height))
+        return [[(well, volume) for index, well, volume in aspiration] for aspiration in aspirations]
 
-                for destination_well, dispensed_vol in zip(well_distribution, dispense_list):
-                    if dispensed_vol > 0:
-                        pipette.dispense(volume=dispensed_vol, location=destination_well)
+    @staticmethod
+    def travel_distance(wells, start=None, end=None):
+        """
+        Return the X/Y distance in mm the gantry travels to visit the wells in order.
+        @param wells:
+        @param start: Well the pipette starts at.
+        @param end: Well the pipette finishes at.
+        @return:
+        """
+        path = [well.top().point for well in wells]
+        if start is not None:
+            path.insert(0, start.top().point)
+        if end is not None:
+            path.append(end.top().point)
 
-                pipette.blow_out(source_well)
-                water_res_vol -= tip_vol
-                tip_vol = 0.0
-                del dispense_list[:i]
-                del well_distribution[:i]
+        distance = 0
+        for i in range(1, len(path)):
+            distance += math.hypot(path[i].x - path[i-1].x, path[i].y - path[i-1].y)
+
+        return distance
 
-        # Reset flow rates to default values
-        pipette.flow_rate.aspirate = default_rate
-        pipette.flow_rate.dispense = default_rate
-        pipette.flow_rate.blow_out = default_rate
+    def order_wells(self, wells, start=None, end=None):
+        """
+        Order the wells to minimize gantry travel.  A nearest neighbor tour from the start well is improved with 2-opt
+        using the well X/Y coordinates from the labware definitions.
+        @param wells:
+        @param start: Well the pipette starts at.
+        @param end: Well the pipette finishes at.
+        @return: The ordered wells, the distance in mm before and after ordering.
+        """
+        before = self.travel_distance(wells, start, end)
+        if len(wells) < 3 and start is None:
+            return list(wells), before, before
+
+        points = [(well.top().point.x, well.top().point.y) for well in wells]
+
+        def dist(a, b):
+            return math.hypot(a[0] - b[0], a[1] - b[1])
+
+        # Nearest neighbor
+        remaining = list(range(len(wells)))
+        if start is not None:
+            position = (start.top().point.x, start.top().point.y)
+        else:
+            position = points[0]
+        tour = []
+        while remaining:
+            nearest = min(remaining, key=lambda i: dist(position, points[i]))
+            remaining.remove(nearest)
+            tour.append(nearest)
+            position = points[nearest]
+
+        # 2-opt.  The ends of the path are fixed by the start and end wells if we have them.
+        path = [points[i] for i in tour]
+        if start is not None:
+            path.insert(0, (start.top().point.x, start.top().point.y))
+        if end is not None:
+            path.append((end.top().point.x, end.top().point.y))
+        first = 1 if start is not None else 0
+        last = len(path) - 1 if end is not None else len(path)
+        improved = True
+        while improved:
+            improved = False
+            for i in range(max(first, 1), last - 1):
+                for j in range(i + 1, last):
+                    a, b = path[i - 1], path[i]
+                    c = path[j]
+                    d = path[j + 1] if j + 1 < len(path) else None
+                    old_length = dist(a, b) + (dist(c, d) if d else 0)
+                    new_length = dist(a, c) + (dist(b, d) if d else 0)
+                    if new_length < old_length - 1e-6:
+                        path[i:j + 1] = reversed(path[i:j + 1])
+                        tour[i - first:j + 1 - first] = reversed(tour[i - first:j + 1 - first])
+                        improved = True
+
+        ordered_wells = [wells[i] for i in tour]
+        after = self.travel_distance(ordered_wells, start, end)
+
+        # Never return something worse than what we were given.
+        if after > before:
+            return list(wells), before, before
+
+        return ordered_wells, before, after
+
+    def distribute_reagents(self, pipette, source_well, destinations, tip_type=None, liquid_class="water",
+                            stage=None):
+        """
+        Dispense reagents using a custom distribute function.  Each aspiration is packed with as many wells as the tip
+        will hold less the disposal volume and air gap.  The disposal volume is blown back into the source well.
+        Volumes are per channel.  With an 8-channel pipette the destinations are the first wells of the columns.
+
+        The wells are put in travel order first and each aspiration takes the next wells in that order, so it only
+        covers wells that are close together.  Replicates are in neighboring wells so they stay together.
+        @param pipette:
+        @param source_well:
+        @param destinations: List of (destination well, volume) tuples
+        @param tip_type: Tip rack load name.  Defaults to the tips loaded for the pipette.
+        @param liquid_class: Name of the liquid class.  Touch tip is done after each aspiration.
+        @param stage: Name the travel saving is logged under.  Defaults to the liquid class.
+        """
+
+        liquid = self.liquid_class(pipette, liquid_class)
+        channels = 8 if "8-Channel" in str(pipette) else 1
+        disposal_vol = self.distribute_settings[pipette.name]["disposal_vol"]
+        capacity = self.tip_capacity(pipette, tip_type) - disposal_vol - liquid.air_gap
+
+        # Travel for the wells packed in the order they were given, each aspiration a trip from the source well.
+        before = sum(self.travel_distance([well for well, volume in aspiration], source_well, source_well)
+                     for aspiration in self.plan_aspirations(destinations, capacity))
+
+        volumes = defaultdict(float)
+        for well, volume in destinations:
+            volumes[well] += volume
+        ordered_wells, __, __ = self.order_wells(list(volumes), start=source_well)
+        aspirations = self.plan_aspirations([(well, volumes[well]) for well in ordered_wells], capacity,
+                                            keep_order=True)
+
+        # Each aspiration starts and ends at the source well so only the order within it matters.
+        after = 0
+        for i in range(len(aspirations)):
+            wells = [well for well, volume in aspirations[i]]
+            aspiration_volumes = dict(aspirations[i])
+            ordered_wells, __, aspiration_travel = self.order_wells(wells, start=source_well, end=source_well)
+            aspirations[i] = [(well, aspiration_volumes[well]) for well in ordered_wells]
+            after += aspiration_travel
+
+        travel = self.travel.setdefault(stage or liquid_class, [0.0, 0.0])
+        travel[0] += before
+        travel[1] += after
+
+        if not pipette.has_tip:
+            pipette.pick_up_tip()
+
+        for aspiration in aspirations:
+            # For some reason the volumes occasionally have 1e-5 added to them.  Rounding corrects this.
+            tip_vol = round(sum(volume for well, volume in aspiration), 1)
+            aspirated_vol = tip_vol + disposal_vol
+
+            pipette.aspirate(volume=aspirated_vol,
+                             location=self.aspirate_location(source_well, aspirated_vol * channels),
+                             rate=liquid.aspirate_rate)
+            self.liquid_delay(liquid.aspirate_delay)
+            self.touch_tip(pipette, liquid)
+
+            for destination_well, dispensed_vol in aspiration:
+                # The air gap is taken before moving to each well and dispensed with the liquid.
+                if liquid.air_gap > 0:
+                    pipette.air_gap(liquid.air_gap)
+                pipette.dispense(volume=dispensed_vol + liquid.air_gap, location=destination_well,
+                                 rate=liquid.dispense_rate)
+                self.liquid_delay(liquid.dispense_delay)
+                for well in self.channel_wells(destination_well, channels):
+                    self.volumes.dispense(well, dispensed_vol)
+
+            if liquid.blow_out == "trash":
+                pipette.blow_out(pipette.trash_container)
+            else:
+                pipette.blow_out(source_well)
+                self.volumes.dispense(source_well, disposal_vol * channels)
 
     @ property
     def tipracks(self):
@@ -1142,15 +2595,23 @@ class Utilities:
 
     def labware_parsing(self):
         for i in range(11):
-            labware = getattr(self.args, "{}".format(self.slot_list[i]))
+            labware = self.args.labware_slots[str(i + 1)]
 
             if labware:
                 self._slot_dict[str(i + 1)] = labware
                 self._labware_dict[str(i + 1)] = self.protocol.load_labware(labware, str(i + 1))
 
-                if labware in self.tipbox_dict[self.protocol.params.left_pipette]:
+                left_tips = labware in self.tipbox_dict[self.protocol.params.left_pipette]
+                right_tips = labware in self.tipbox_dict[self.protocol.params.right_pipette]
+
+                # When both pipettes use the same tips, give the box to the pipette with fewer boxes.
+                if left_tips and right_tips:
+                    left_tips = len(self._left_tiprack_list) <= len(self._right_tiprack_list)
+                    right_tips = not left_tips
+
+                if left_tips:
                     self._left_tiprack_list.append(self._labware_dict[str(i + 1)])
-                elif labware in self.tipbox_dict[self.protocol.params.right_pipette]:
+                elif right_tips:
                     self._right_tiprack_list.append(self._labware_dict[str(i + 1)])
 
     def plate_layout(self, slot):
@@ -1196,46 +2657,13 @@ class Utilities:
 
     def parse_sample_template(self):
         """
-        Parse the TSV file and return data objects to run def.
+        Parse the sample sheet and return data objects to run def.  The TSV file is only read when there is no sample
+        sheet parameter, which only happens in simulations.
         @return:
         """
-        line_num = 0
-        options_dictionary = defaultdict(str)
-        index_file = list(csv.reader(open(self.parameter_file), delimiter='\t'))
-
-        for line in index_file:
-            if line_num == 0:
-                options_dictionary["Version"] = line[1]
-                options_dictionary["Template"] = line[0].strip("#")
-            line_num += 1
-            col_count = len(line)
-            tmp_line = []
-            sample_key = ""
-            if col_count > 0 and "#" not in line[0] and len(line[0].split("#")[0]) > 0:
-                # Skip any lines that are blank or comments.
-                for i in range(7):
-                    try:
-                        line[i] = line[i].split("#")[0]  # Strip out end-of-line comments.
-                    except IndexError:
-                        continue
-
-                    if i == 0 and "--" in line[0]:
-                        key = line[0].strip('--')
-                        key_value = line[1]
-                        if options_dictionary["Template"] != " Illumina_Dual_Indexing" and "Target_" in key or "PositiveControl_" in key:
-                            try:
-                                key_value = (line[1], line[2], line[3])
-                            except IndexError:
-                                pass
-                            options_dictionary[key] = key_value
-
-                        options_dictionary[key] = key_value
-                    elif "--" not in line[0] and int(line[0]) < 12:
-                        sample_key = line[0], line[1]
-                        tmp_line.append(line[i])
-                if sample_key:
-                    self.sample_dictionary[sample_key] = tmp_line
-
-        self.args = SimpleNamespace(**options_dictionary)
-        self.args.UseTemperatureModule = strtobool(str(self.args.UseTemperatureModule))
+        if self.sample_sheet:
+            self.args, self.sample_dictionary = read_procedure_text(self.sample_sheet)
+        else:
+            self.args, self.sample_dictionary = read_procedure_file(self.parameter_file)
+        self.liquid_classes = load_liquid_classes(self.args)
         return self.sample_dictionary, self.args
@@ -0,0 +1,268 @@
+"""
+Estimates how long an OT-2 run takes from its run log.
+
+The run log is the text from opentrons.simulate.format_runlog or Mock_Protocol.format_runlog, or the
+ProgramFileSimulation.txt written by Simulate_PCR.py.  Each command is timed with a simple kinematic model of the
+OT-2.  Moves go up to a travel height, across and back down with trapezoidal speed profiles.  Plunger moves take the
+volume over the flow rate in the log, so the liquid class rates PCR.py uses are included.  The aspirate and
+dispense lines inside a mix are timed one at a time, so mix repetitions are included.  Delays are taken from the
+log.
+
+The temperature module ramps in the background while the first stages run.  The ramp starts at "Setting Temperature
+Module to", quick_temp logs how long it takes with "Ready in about N minutes" and PCR.py logs "Waiting for the
+Temperature Module" where the run waits for it.  Whatever is left of the ramp at that point is added to the stage.
+
+Well positions come from the well name and slot in the log on a standard grid for the labware.  They are close
+enough for travel times but are not the exact positions from the labware definitions.
+
+Each comment that follows a blank line starts a new stage.  PCR.py logs those at the start of each dispensing step.
+
+    python Run_Estimator.py [run log file]
+
+With no file PCR.py is run through Mock_Protocol to get the run log.
+"""
+import gzip
+import math
+import re
+import sys
+from collections import OrderedDict
+from types import SimpleNamespace
+
+__version__ = "0.1.0"
+
+# Speeds in mm/sec, accelerations in mm/sec^2, heights in mm and times in seconds.
+DEFAULT_MODEL = \
+    {"xy_speed": 400.0, "xy_acceleration": 2000.0, "z_speed": 125.0, "z_acceleration": 1500.0,
+     "arc_same_labware": 10.0, "arc_travel": 60.0, "touch_tip_path": 16.0, "touch_tip_speed": 10.0,
+     "blow_out_time": 1.0, "pick_up_tip_time": 3.0, "drop_tip_time": 2.0}
+
+# Front left corner of each OT-2 deck slot.
+SLOT_ORIGINS = \
+    {1: (0.0, 0.0), 2: (132.5, 0.0), 3: (265.0, 0.0), 4: (0.0, 90.5), 5: (132.5, 90.5), 6: (265.0, 90.5),
+     7: (0.0, 181.0), 8: (132.5, 181.0), 9: (265.0, 181.0), 10: (0.0, 271.5), 11: (132.5, 271.5),
+     12: (265.0, 271.5)}
+
+# Labware name: (well pitch, A1 x, A1 y).  Anything not listed is taken as a 96 well grid.
+WELL_GRIDS = \
+    {"384": (4.5, 12.13, 76.49), "24 Tube Rack": (19.89, 18.21, 75.43), "15 Tube Rack": (25.0, 13.88, 67.74),
+     "12 Well": (9.0, 14.38, 42.78)}
+STANDARD_GRID = (9.0, 14.38, 74.24)
+
+LOCATION = re.compile(r"(?P<well>[A-P])(?P<column>\d+) of (?P<labware>.+) on slot (?P<slot>\d+)")
+VOLUME = re.compile(r"^(?P<action>Aspirating|Dispensing) (?P<volume>[\d.]+) uL (from|into) (?P<location>.+) "
+                    r"at (?P<flow>[\d.]+) uL/sec")
+DELAY = re.compile(r"^Delaying for (?P<minutes>\d+) minutes and (?P<seconds>[\d.]+) seconds")
+RAMP_START = "Setting Temperature Module to "
+RAMP_READY = re.compile(r"Ready in about (?P<minutes>[\d.]+) minutes")
+RAMP_WAIT = "Waiting for the Temperature Module"
+
+
+def read_runlog(run_log):
+    """
+    Return the lines of a run log.  Takes the text or the name of a file, which can be gzip compressed.  The step
+    numbers Simulate_PCR.py adds are removed.
+    @param run_log:
+    @return:
+    """
+    if "\n" not in run_log and run_log.endswith(".gz"):
+        with gzip.open(run_log, "rt", encoding="utf-8") as log_file:
+            run_log = log_file.read()
+    elif "\n" not in run_log:
+        with open(run_log, encoding=runlog_encoding(run_log)) as log_file:
+            run_log = log_file.read()
+
+    lines = run_log.split("\n")
+    if "Step\tCommand" in lines:
+        lines = [re.sub(r"^\d+\t", "", line) for line in lines[lines.index("Step\tCommand") + 1:]]
+
+    return lines
+
+
+def runlog_encoding(file_name):
+    with open(file_name, "rb") as log_file:
+        start = log_file.read(2)
+
+    # Simulate_PCR.py writes UTF-16 on Windows.
+    if start in (b"\xff\xfe", b"\xfe\xff"):
+        return "utf-16"
+    return "utf-8"
+
+
+def well_point(location):
+    """
+    Return the X/Y position in mm of the well named in a run log location.
+    @param location: Text such as "A1 of BioRad ddPCR 96 Well Plate 100 µL on slot 5"
+    @return: (x, y, labware) or None for locations that are not a well.
+    """
+    match = LOCATION.search(location)
+    if not match:
+        if "slot 12" in location:
+            return SLOT_ORIGINS[12][0] + 64, SLOT_ORIGINS[12][1] + 43, "trash"
+        return None
+
+    pitch, x, y = STANDARD_GRID
+    for name in WELL_GRIDS:
+        if name in match.group("labware"):
+            pitch, x, y = WELL_GRIDS[name]
+
+    slot_x, slot_y = SLOT_ORIGINS[int(match.group("slot"))]
+    row = ord(match.group("well")) - ord("A")
+    column = int(match.group("column")) - 1
+
+    return slot_x + x + pitch * column, slot_y + y - pitch * row, match.group("slot")
+
+
+def move_time(distance, speed, acceleration):
+    """
+    Time for a move that starts and ends at rest with a trapezoidal, or if it is short a triangular, speed profile.
+    @param distance:
+    @param speed:
+    @param acceleration:
+    @return:
+    """
+    distance = abs(distance)
+    if distance == 0:
+        return 0.0
+
+    if distance >= speed ** 2 / acceleration:
+        return distance / speed + speed / acceleration
+
+    return 2 * math.sqrt(distance / acceleration)
+
+
+class RunEstimator:
+    def __init__(self, model=None):
+        self.model = SimpleNamespace(**dict(DEFAULT_MODEL, **(model or {})))
+        self.position = None
+
+    def travel_time(self, location):
+        """
+        Time to move the pipette to a location in the log.  Moves within one labware use a short arc.
+        @param location:
+        @return:
+        """
+        point = well_point(location)
+        if point is None or self.position is None:
+            if point is not None:
+                self.position = point
+            return 0.0
+
+        x, y, labware = point
+        last_x, last_y, last_labware = self.position
+        self.position = point
+        if (x, y) == (last_x, last_y):
+            return 0.0
+
+        model = self.model
+        arc = model.arc_same_labware if labware == last_labware else model.arc_travel
+        z_time = 2 * move_time(arc, model.z_speed, model.z_acceleration)
+
+        return z_time + move_time(math.hypot(x - last_x, y - last_y), model.xy_speed, model.xy_acceleration)
+
+    def command_time(self, line):
+        """
+        Return the time in seconds for one line of the run log.  Comments and blank lines take no time.
+        @param line:
+        @return:
+        """
+        model = self.model
+        line = line.strip()
+
+        match = VOLUME.match(line)
+        if match:
+            return self.travel_time(match.group("location")) + \
+                float(match.group("volume")) / float(match.group("flow"))
+
+        match = DELAY.match(line)
+        if match:
+            return int(match.group("minutes")) * 60 + float(match.group("seconds"))
+
+        if line.startswith("Blowing out at ") or line.startswith("Blowing out into "):
+            return self.travel_time(line.split(" ", 3)[3]) + model.blow_out_time
+        if line.startswith("Touching tip"):
+            return model.touch_tip_path / model.touch_tip_speed
+        if line.startswith("Picking up tip from "):
+            return self.travel_time(line[len("Picking up tip from "):]) + model.pick_up_tip_time
+        if line.startswith("Dropping tip into "):
+            return self.travel_time(line[len("Dropping tip into "):]) + model.drop_tip_time
+
+        return 0.0
+
+    def estimate(self, run_log):
+        """
+        Estimate the time for a run.
+        @param run_log: Run log text, file name or list of lines.
+        @return: Total seconds and an ordered dictionary of stage name to seconds.
+        """
+        lines = read_runlog(run_log) if isinstance(run_log, str) else run_log
+        self.position = None
+        stages = OrderedDict([("Setup", 0.0)])
+        stage = "Setup"
+        previous_line = None
+
+        # Seconds into the run the ramp started, how long it takes and when the run waits for it.
+        elapsed = 0.0
+        ramp_start = ramp_seconds = ramp_wait = None
+
+        for line in lines:
+            seconds = self.command_time(line)
+
+            if line.strip().startswith(RAMP_START):
+                ramp_start, ramp_seconds, ramp_wait = elapsed, None, None
+            elif RAMP_READY.search(line) and ramp_start is not None:
+                ramp_seconds = float(RAMP_READY.search(line).group("minutes")) * 60
+            elif line.strip().startswith(RAMP_WAIT) and ramp_start is not None:
+                ramp_wait = elapsed
+
+            # The ramp comments can come before or after the wait so add the wait once all of them are in.
+            if ramp_seconds is not None and ramp_wait is not None:
+                seconds += max(0.0, ramp_start + ramp_seconds - ramp_wait)
+                ramp_start = ramp_seconds = ramp_wait = None
+
+            elapsed += seconds
+            if not seconds and previous_line == "" and line.strip() and not line.startswith("\t"):
+                # The pipette used is already in the log so keep the stage names short.
+                stage = line.strip().split(" with ")[0]
+                stages[stage] = stages.get(stage, 0.0)
+
+            stages[stage] += seconds
+            previous_line = line.strip()
+
+        return sum(stages.values()), stages
+
+
+def estimate(run_log, model=None):
+    """
+    Estimate the time for a run with the default model.  Any model values given replace the defaults.
+    @param run_log: Run log text, file name or list of lines.
+    @param model: Dictionary of DEFAULT_MODEL values to change.
+    @return: Total seconds and an ordered dictionary of stage name to seconds.
+    """
+    return RunEstimator(model).estimate(run_log)
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return "{}:{:02d}:{:02d}".format(hours, minutes, seconds)
+
+
+def format_estimate(total, stages):
+    lines = ["Estimated run time {}".format(format_duration(total))]
+    for stage in stages:
+        if stages[stage]:
+            lines.append("  {}\t{}".format(format_duration(stages[stage]), stage))
+
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        run_time, stage_times = estimate(sys.argv[1])
+    else:
+        import Mock_Protocol
+
+        protocol_context = Mock_Protocol.simulate()
+        run_time, stage_times = estimate(Mock_Protocol.format_runlog(protocol_context.commands))
+
+    print(format_estimate(run_time, stage_times))
@@ -0,0 +1,132 @@
+"""
+Writes a simulation run log one numbered step at a time.
+
+runlog_lines walks the run log from opentrons.simulate, the commands from Mock_Protocol or plain lines of text and
+yields the lines format_runlog would give, without building the whole string.  write_runlog writes them as they
+come to a file or stdout, as text or JSON Lines, gzip compressed if asked for or if the file name ends in .gz.
+"""
+import gzip
+import json
+import os
+import platform
+import sys
+from contextlib import contextmanager
+
+__version__ = "0.1.0"
+
+
+def runlog_commands(run_log):
+    """
+    Yield (level, command name, text, logs) for each command.
+    @param run_log: opentrons.simulate run log, Mock_Protocol commands or lines of text.
+    """
+    for command in run_log:
+        if isinstance(command, str):
+            yield 0, "", command, []
+        elif "payload" in command:
+            yield command["level"], command.get("name", ""), command["payload"].get("text", ""), \
+                command.get("logs") or []
+        else:
+            yield command["depth"], command["name"], command["text"], []
+
+
+def runlog_lines(run_log):
+    """
+    Yield the lines of the run log the same way opentrons.simulate.format_runlog lays them out.  Commands with more
+    than one line of text, like comments that start with a newline, give one line each.
+    @param run_log: opentrons.simulate run log, Mock_Protocol commands or lines of text.
+    """
+    for level, name, text, logs in runlog_commands(run_log):
+        indent = "\t" * level
+        for line in (indent + text).split("\n"):
+            yield line
+
+        if logs:
+            yield indent + "Logs from this command:"
+            for log in logs:
+                yield indent + "{} ({}): {}".format(log.levelname, log.module, log.msg % log.args)
+
+
+def runlog_records(run_log):
+    """
+    Yield one dictionary per line for JSON Lines output.
+    @param run_log:
+    """
+    for level, name, text, logs in runlog_commands(run_log):
+        for line in text.split("\n"):
+            # The opentrons run log has no command names.
+            record = {"level": level, "name": name, "text": line}
+            if not name:
+                del record["name"]
+            yield record
+
+        for log in logs:
+            yield {"level": level, "name": "log", "text": "{} ({}): {}".format(log.levelname, log.module,
+                                                                               log.msg % log.args)}
+
+
+def default_output(file_name):
+    """
+    The simulation file our GUI reads on Windows computers.  Elsewhere the run log goes to stdout.
+    @param file_name:
+    @return: File name and encoding.
+    """
+    if platform.system() == "Windows":
+        return "C:{0}Users{0}{1}{0}Documents{0}{2}".format(os.sep, os.getlogin(), file_name), "UTF-16"
+
+    return None, "utf-8"
+
+
+@contextmanager
+def open_output(output=None, compress=None, encoding="utf-8"):
+    """
+    Open the output for writing text.  None or "-" is stdout.
+    @param output:
+    @param compress: gzip the file.  Defaults to True for names ending in .gz.
+    @param encoding:
+    """
+    if output in (None, "-"):
+        yield sys.stdout
+        sys.stdout.flush()
+        return
+
+    if compress is None:
+        compress = output.endswith(".gz")
+
+    if compress:
+        outfile = gzip.open(output, "wt", encoding=encoding)
+    else:
+        outfile = open(output, "w", encoding=encoding)
+
+    try:
+        yield outfile
+    finally:
+        outfile.close()
+
+
+def write_runlog(run_log, output=None, header="", compress=None, json_lines=False, encoding="utf-8"):
+    """
+    Write the run log with numbered steps.
+    @param run_log: opentrons.simulate run log, Mock_Protocol commands or lines of text.
+    @param output: File name.  None or "-" for stdout.
+    @param header: Text written before the steps.  In JSON Lines it is the first record.
+    @param compress: gzip the output.  Defaults to True for names ending in .gz.
+    @param json_lines: Write one JSON object per step instead of text.
+    @param encoding:
+    @return: Number of steps written.
+    """
+    step = 0
+    with open_output(output, compress, encoding) as outfile:
+        if json_lines:
+            if header:
+                outfile.write(json.dumps({"header": header}) + "\n")
+
+            for step, record in enumerate(runlog_records(run_log), start=1):
+                record["step"] = step
+                outfile.write(json.dumps(record, ensure_ascii=False) + "\n")
+        else:
+            outfile.write("{}Step\tCommand\n".format(header))
+            for step, line in enumerate(runlog_lines(run_log), start=1):
+                outfile.write("{}\t{}\n".format(step, line))
+
+    return step
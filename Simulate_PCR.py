@@ -1,10 +1,21 @@
 """
 This is to run a simulation of PCR.py
 """
+import argparse
+import contextlib
 import datetime
+import io
 import os
 import platform
-from opentrons.simulate import simulate, format_runlog
+import sys
+import tempfile
+import time
+from opentrons.simulate import simulate
+import Labware_Index
+import PCR
+import Run_Log
+import Run_Estimator
+import Simulation_Cache
 
 # metadata
 metadata = {
@@ -14,26 +25,116 @@ metadata = {
     }
 requirements = {"robotType": "OT-2", "apiLevel": "2.20"}
 
+
+def plate_layout_file(tsv_file):
+    """
+    The plate layout file PCR.py writes for our GUI.  PCR_PLATE_LAYOUT_FILE if it is set, otherwise the file in
+    Documents on Windows computers.
+    @param tsv_file:
+    @return: "" if there is nowhere to put it.
+    """
+    if os.environ.get("PCR_PLATE_LAYOUT_FILE"):
+        return os.environ["PCR_PLATE_LAYOUT_FILE"]
+
+    if platform.system() == "Windows" and os.path.isfile(tsv_file):
+        settings, samples = PCR.read_procedure_file(tsv_file)
+        return "C:{0}Users{0}{1}{0}Documents{0}{2}_PlateLayout.tsv".format(os.sep, os.getlogin(), settings.Template)
+
+    return ""
+
+
+def run_simulation(tsv_file, labware_path):
+    """
+    Simulate PCR.py.  The plate layout goes to a temporary file so it can be cached.
+    @param tsv_file:
+    @param labware_path:
+    @return: Run log lines, plate layout and what PCR.py printed.
+    """
+    # Only load the custom labware the TSV file uses.
+    labware_paths = Labware_Index.labware_paths(tsv_file=tsv_file, labware_path=labware_path)
+    output = io.StringIO()
+
+    saved_layout_file = os.environ.get("PCR_PLATE_LAYOUT_FILE")
+
+    with tempfile.TemporaryDirectory() as temp_path:
+        layout_file = os.path.join(temp_path, "PlateLayout.tsv")
+        os.environ["PCR_PLATE_LAYOUT_FILE"] = layout_file
+
+        try:
+            with open('PCR.py') as protocol_file, contextlib.redirect_stdout(output):
+                run_log, __bundle__ = simulate(protocol_file, custom_labware_paths=labware_paths)
+        except Exception:
+            # Show what PCR.py printed before it failed.
+            sys.stdout.write(output.getvalue())
+            raise
+        finally:
+            if saved_layout_file is None:
+                os.environ.pop("PCR_PLATE_LAYOUT_FILE", None)
+            else:
+                os.environ["PCR_PLATE_LAYOUT_FILE"] = saved_layout_file
+
+        plate_layout = ""
+        if os.path.isfile(layout_file):
+            with open(layout_file, encoding="utf-8") as layout:
+                plate_layout = layout.read()
+
+    return list(Run_Log.runlog_lines(run_log)), plate_layout, output.getvalue()
+
+
 if __name__ == "__main__":
-    protocol_file = open('PCR.py')
+    parser = argparse.ArgumentParser(description="Simulate PCR.py and write the numbered run log.")
+    parser.add_argument("--output", default=None,
+                        help="Run log file.  Defaults to ProgramFileSimulation.txt in Documents on Windows and stdout "
+                             "elsewhere.  Use - for stdout.")
+    parser.add_argument("--gzip", action="store_true", help="gzip the run log.  Implied by a .gz file name.")
+    parser.add_argument("--jsonl", action="store_true", help="Write the run log as JSON Lines.")
+    parser.add_argument("--no-cache", action="store_true", help="Simulate even if the TSV file is cached.")
+    options = parser.parse_args()
+
+    tsv_file = Labware_Index.default_tsv_file()
     labware_path = "{}{}custom_labware".format(os.getcwd(), os.sep)
-    run_log, __bundle__ = simulate(protocol_file, custom_labware_paths=[labware_path])
+    gui_layout_file = plate_layout_file(tsv_file)
+
+    # An unchanged TSV file gives the same run log so use the cached one if there is one.  Batch_Simulate.py also
+    # caches failed runs.  Those are simulated again so the error is shown.
+    cache = cache_key = cached = None
+    if not options.no_cache and os.path.isfile(tsv_file):
+        cache = Simulation_Cache.SimulationCache(labware_path=labware_path)
+        cache_key = cache.key(tsv_file, "PCR.py", use_opentrons=True)
+        cached = cache.get(cache_key)
+
+    if cached is not None and cached.stats["result"] == "PASS":
+        run_log, plate_layout, printed = cached.run_log.split("\n"), cached.plate_layout, cached.stats["output"]
+    else:
+        start_time = time.perf_counter()
+        run_log, plate_layout, printed = run_simulation(tsv_file, labware_path)
+
+        if cache is not None:
+            stats = Simulation_Cache.result_stats(
+                "PASS", output=printed,
+                simulation_seconds=round(time.perf_counter() - start_time, 2))
+            cache.put(cache_key, "\n".join(run_log), plate_layout, stats)
+            cache.evict()
+
+    print(printed, end="")
+    if gui_layout_file and plate_layout:
+        with open(gui_layout_file, "w") as layout_file:
+            layout_file.write(plate_layout)
+
     run_date = datetime.datetime.today().strftime("%a %b %d %H:%M %Y")
-    i = 1
-    t = format_runlog(run_log).split("\n")
 
-    #outstring = "Opentrons OT-2 Steps for {}.\nDate:  {}\nProgram File: PCR.py\n\nStep\tCommand\n" \
+    #header = "Opentrons OT-2 Steps for {}.\nDate:  {}\nProgram File: PCR.py\n\n" \
     #    .format(metadata['protocolName'], run_date)
 
-    outstring = "Opentrons OT-2 Steps for {}.\nDate:  {}\nProgram File: ddPCR.py\n\nStep\tCommand\n" \
+    header = "Opentrons OT-2 Steps for {}.\nDate:  {}\nProgram File: ddPCR.py\n\n" \
         .format(metadata['protocolName'], run_date)
 
-    for l in t:
-        outstring += "{}\t{}\n".format(i, l)
-        i += 1
-    if platform.system() == "Windows":
-        outfile = open("C:{0}Users{0}{1}{0}Documents{0}ProgramFileSimulation.txt"
-                       .format(os.sep, os.getlogin()), 'w', encoding="UTF-16")
-        outfile.write(outstring)
-        outfile.close()
-    protocol_file.close()
+    output, encoding = options.output, "utf-8"
+    if output is None:
+        output, encoding = Run_Log.default_output("ProgramFileSimulation.txt")
+
+    Run_Log.write_runlog(run_log, output, header, compress=options.gzip or None, json_lines=options.jsonl,
+                         encoding=encoding)
+
+    run_time, stage_times = Run_Estimator.estimate(run_log)
+    print(Run_Estimator.format_estimate(run_time, stage_times))
@@ -0,0 +1,243 @@
+"""
+Content addressed on-disk cache of simulation results.
+
+The key is the SHA-256 of everything a simulation depends on: the TSV file, the protocol file, the custom labware
+definitions, the liquid class and cold plate model files, the opentrons version and, for Mock_Protocol runs,
+Mock_Protocol.py itself.  Any change to one of them
+gives a new key so stale results are never returned.  Each entry holds the run log as plain lines, the plate layout
+and a stats.json made by result_stats.  Simulate_PCR.py and Batch_Simulate.py share entries, so the run time
+estimate is not stored.  It is worked out from the run log so changes to Run_Estimator.py are always used.
+
+Entries are written to a temporary folder and renamed into place so parallel simulations can share the cache.  The
+modification time of stats.json is the last time the entry was used.  evict removes the least recently used entries
+until the cache is under its size limit.
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+from types import SimpleNamespace
+import Labware_Index
+
+__version__ = "0.1.0"
+
+RUN_LOG_FILE = "run_log.txt"
+PLATE_LAYOUT_FILE = "plate_layout.tsv"
+STATS_FILE = "stats.json"
+
+# Changed whenever what is stored in an entry changes so older entries are not read.
+ENTRY_VERSION = "2"
+
+
+def opentrons_version():
+    try:
+        from importlib.metadata import version, PackageNotFoundError
+        return version("opentrons")
+    except (ImportError, PackageNotFoundError):
+        return "not installed"
+
+
+def file_hash(file_name):
+    with open(file_name, "rb") as hash_file:
+        return hashlib.sha256(hash_file.read()).hexdigest()
+
+
+def result_stats(result, warnings=(), output="", error="", trace="", simulation_seconds=0.0):
+    """
+    The stats.json for an entry.
+    @param result: PASS or FAIL
+    @param warnings: List of warnings from the simulation.
+    @param output: What the protocol printed to stdout.
+    @param error: One line description of the error for a FAIL.
+    @param trace: Traceback for a FAIL.
+    @param simulation_seconds:
+    @return:
+    """
+    return {"result": result, "warnings": list(warnings), "output": output, "error": error, "traceback": trace,
+            "simulation_seconds": simulation_seconds}
+
+
+def settings_file_path(environment_variable, file_name):
+    """
+    The same locations PCR.py uses for LiquidClasses.json and ColdPlateModels.json.  The environment variable if it
+    is set, then the OT-2 notebooks folder.
+    @param environment_variable: PCR_LIQUID_CLASS_FILE or PCR_COLD_PLATE_MODEL_FILE
+    @param file_name:
+    @return: File path or None if there isn't one.
+    """
+    for file_path in (os.environ.get(environment_variable, ""),
+                      "{0}var{0}lib{0}jupyter{0}notebooks{0}{1}".format(os.sep, file_name)):
+        if os.path.isfile(file_path):
+            return file_path
+
+    return None
+
+
+def settings_hash():
+    """
+    Hash of the liquid class and cold plate model files.  They change the pipetting rates, delays and the cold plate
+    hold, so the run log and run time estimate depend on them.
+    @return:
+    """
+    file_hashes = []
+    for environment_variable, file_name in (("PCR_LIQUID_CLASS_FILE", "LiquidClasses.json"),
+                                            ("PCR_COLD_PLATE_MODEL_FILE", "ColdPlateModels.json")):
+        file_path = settings_file_path(environment_variable, file_name)
+        file_hashes.append("{}:{}".format(file_name, file_hash(file_path) if file_path else "none"))
+
+    return hashlib.sha256("\n".join(file_hashes).encode()).hexdigest()
+
+
+class SimulationCache:
+    def __init__(self, cache_path=None, max_bytes=200 * 1024 * 1024, labware_path=None):
+        repo_path = os.path.dirname(os.path.abspath(__file__))
+        self.cache_path = cache_path or os.path.join(repo_path, ".simulation_cache")
+        self.max_bytes = max_bytes
+        self.labware_path = labware_path
+        self._labware_hash = None
+
+    def labware_hash(self):
+        """
+        Hash of the custom labware.  Uses the file hashes Labware_Index already keeps.
+        @return:
+        """
+        if self._labware_hash is None:
+            default_labware_path, cache_path = Labware_Index.default_paths()
+            index = Labware_Index.build_index(self.labware_path or default_labware_path, cache_path)
+            labware_hashes = ["{}:{}".format(load_name, index[load_name]["hash"]) for load_name in sorted(index)]
+            self._labware_hash = hashlib.sha256("\n".join(labware_hashes).encode()).hexdigest()
+
+        return self._labware_hash
+
+    def key(self, tsv_file, protocol_file, use_opentrons=False):
+        """
+        Return the cache key for a simulation.
+        @param tsv_file:
+        @param protocol_file:
+        @param use_opentrons: True for opentrons.simulate, False for Mock_Protocol.
+        @return:
+        """
+        if use_opentrons:
+            simulator = "opentrons"
+        else:
+            simulator = "mock {}".format(file_hash(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                                "Mock_Protocol.py")))
+
+        parts = [ENTRY_VERSION, file_hash(tsv_file), file_hash(protocol_file), self.labware_hash(), settings_hash(),
+                 opentrons_version(), simulator]
+
+        return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.cache_path, key[:2], key)
+
+    def get(self, key):
+        """
+        Return the cached result or None.  Marks the entry as just used.
+        @param key:
+        @return: SimpleNamespace with run_log, plate_layout and stats.
+        """
+        entry_path = self.entry_path(key)
+        stats_file = os.path.join(entry_path, STATS_FILE)
+
+        try:
+            with open(stats_file) as stats:
+                result = SimpleNamespace(stats=json.load(stats), plate_layout="")
+            with open(os.path.join(entry_path, RUN_LOG_FILE), encoding="utf-8") as run_log:
+                result.run_log = run_log.read()
+            if os.path.isfile(os.path.join(entry_path, PLATE_LAYOUT_FILE)):
+                with open(os.path.join(entry_path, PLATE_LAYOUT_FILE), encoding="utf-8") as plate_layout:
+                    result.plate_layout = plate_layout.read()
+            os.utime(stats_file)
+        except FileNotFoundError:
+            # Not cached, or evicted while we were reading it.
+            return None
+
+        return result
+
+    def put(self, key, run_log, plate_layout, stats):
+        """
+        Store a result.  If another process stored the same key first, that entry is kept.
+        @param key:
+        @param run_log:
+        @param plate_layout:
+        @param stats: Dictionary from result_stats.
+        """
+        entry_path = self.entry_path(key)
+        if os.path.isdir(entry_path):
+            return
+
+        temp_path = "{}.{}.tmp".format(entry_path, os.getpid())
+        os.makedirs(temp_path, exist_ok=True)
+        with open(os.path.join(temp_path, RUN_LOG_FILE), "w", encoding="utf-8") as run_log_file:
+            run_log_file.write(run_log)
+        if plate_layout:
+            with open(os.path.join(temp_path, PLATE_LAYOUT_FILE), "w", encoding="utf-8") as plate_layout_file:
+                plate_layout_file.write(plate_layout)
+        with open(os.path.join(temp_path, STATS_FILE), "w") as stats_file:
+            json.dump(stats, stats_file, indent=1)
+
+        try:
+            os.rename(temp_path, entry_path)
+        except OSError:
+            shutil.rmtree(temp_path, ignore_errors=True)
+
+    def entries(self):
+        """
+        Return (last used, size in bytes, path) for each entry.
+        @return:
+        """
+        entries = []
+        if not os.path.isdir(self.cache_path):
+            return entries
+
+        for prefix in os.listdir(self.cache_path):
+            prefix_path = os.path.join(self.cache_path, prefix)
+            if not os.path.isdir(prefix_path):
+                continue
+
+            for key in os.listdir(prefix_path):
+                entry_path = os.path.join(prefix_path, key)
+                stats_file = os.path.join(entry_path, STATS_FILE)
+                if key.endswith(".tmp") or not os.path.isfile(stats_file):
+                    continue
+
+                size = sum(os.path.getsize(os.path.join(entry_path, file_name))
+                           for file_name in os.listdir(entry_path))
+                entries.append((os.path.getmtime(stats_file), size, entry_path))
+
+        return entries
+
+    def size(self):
+        return sum(size for last_used, size, entry_path in self.entries())
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache is no larger than max_bytes.
+        @return: Number of entries removed.
+        """
+        entries = sorted(self.entries())
+        total_size = sum(size for last_used, size, entry_path in entries)
+        removed = 0
+
+        for last_used, size, entry_path in entries:
+            if total_size <= self.max_bytes:
+                break
+            shutil.rmtree(entry_path, ignore_errors=True)
+            total_size -= size
+            removed += 1
+
+        return removed
+
+    def clear(self):
+        shutil.rmtree(self.cache_path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    simulation_cache = SimulationCache()
+    cache_entries = simulation_cache.entries()
+    print("{} cached simulations using {} kB in {}".format(
+        len(cache_entries), round(sum(entry[1] for entry in cache_entries) / 1024), simulation_cache.cache_path))
+    if cache_entries:
+        print("Oldest entry last used {}".format(time.ctime(min(cache_entries)[0])))
@@ -0,0 +1,54 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from PCR import calculate_volumes
+
+ARGS = SimpleNamespace(PCR_Volume=22.0, MasterMixPerRxn=11.0)
+
+
+def test_neat_samples_are_not_diluted():
+    (sample_vol, diluent_vol, diluted_sample_vol, water_vol, dilution, steps), max_template_vol = \
+        calculate_volumes(ARGS, [5.0], [20.0], well_counts=[4])
+
+    assert max_template_vol == 11.0
+    assert sample_vol[0] == 4.0
+    assert diluent_vol[0] == 0
+    assert diluted_sample_vol[0] == 0
+    assert steps[0] == 0
+    assert water_vol[0] == pytest.approx(7.0)
+
+
+@pytest.mark.parametrize("concentration", [50.0, 400.0, 3000.0, 20000.0])
+@pytest.mark.parametrize("well_count", [1, 2, 8])
+def test_dilution_steps_stay_above_the_pipette_minimum(concentration, well_count):
+    (sample_vol, diluent_vol, diluted_sample_vol, water_vol, dilution, steps), max_template_vol = \
+        calculate_volumes(ARGS, [concentration], [20.0], well_counts=[well_count], min_volume=1.0)
+
+    assert steps[0] >= 1
+    assert sample_vol[0] >= 1.0
+    assert diluted_sample_vol[0] >= 2.0
+    assert dilution[0] == pytest.approx((1 + diluent_vol[0] / sample_vol[0]) ** steps[0], rel=0.02)
+
+    # Each step makes enough for the wells plus 3 more.
+    assert sample_vol[0] + diluent_vol[0] >= diluted_sample_vol[0] * (well_count + 3) - 0.1
+
+
+def test_concentrated_sample_is_raised_to_the_minimum():
+    (sample_vol, diluent_vol, diluted_sample_vol, water_vol, dilution, steps), max_template_vol = \
+        calculate_volumes(ARGS, [3000.0], [20.0], well_counts=[2], min_volume=1.0)
+
+    # Sized for its wells alone this would be 0.4 uL of sample per step.
+    assert sample_vol[0] == 1.0
+    assert diluent_vol[0] == pytest.approx(np.sqrt(dilution[0]) - 1)
+
+
+def test_dilution_that_does_not_fit_a_well_raises():
+    with pytest.raises(Exception, match="dilution well holds"):
+        calculate_volumes(ARGS, [3000.0], [20.0], well_counts=[2], min_volume=1.0, max_step_volume=10.0)
+
+
+def test_template_that_does_not_fit_raises():
+    with pytest.raises(Exception, match="does not fit"):
+        calculate_volumes(ARGS, [1.0], [20.0])
@@ -0,0 +1,71 @@
+import csv
+import json
+
+import numpy as np
+import pytest
+
+import Cold_Plate_Calibration
+
+
+def synthetic_trace(steps, dead_time, tau, interval=5.0, hold=600.0, start_temp=22.0, noise=0.0, seed=0):
+    """
+    Readings from a first order plus dead time plate stepped through the setpoints.
+    @return: List of (seconds, setpoint, temperature).
+    """
+    generator = np.random.default_rng(seed)
+    samples = []
+    temp = start_temp
+    time = 0.0
+    for setpoint in steps:
+        step_start, step_temp = time, temp
+        while time < step_start + hold:
+            temp = float(Cold_Plate_Calibration.predict(np.array([time - step_start]), step_temp, setpoint,
+                                                        dead_time, tau)[0])
+            samples.append((time, setpoint, round(temp + generator.normal(0, noise), 2)))
+            time += interval
+
+    return samples
+
+
+def test_fit_recovers_dead_time_and_tau():
+    samples = synthetic_trace([4.0, 20.0, 8.0], dead_time=8.0, tau=45.0, noise=0.05)
+    segments = Cold_Plate_Calibration.split_segments(samples)
+
+    fit = Cold_Plate_Calibration.fit_segments(segments["cooling"])
+    assert fit["dead_time_sec"] == pytest.approx(8.0, abs=3.0)
+    assert fit["tau_sec"] == pytest.approx(45.0, rel=0.1)
+    assert fit["rmse"] < 0.2
+
+
+def test_small_steps_are_ignored():
+    samples = synthetic_trace([21.0, 22.5], dead_time=5.0, tau=60.0)
+    segments = Cold_Plate_Calibration.split_segments(samples)
+    assert segments == {"heating": [], "cooling": []}
+    assert Cold_Plate_Calibration.fit_segments([]) is None
+
+
+def test_calibrate_from_log_files(tmp_path):
+    samples = synthetic_trace([4.0, 30.0, 4.0], dead_time=5.0, tau=60.0)
+    readings = [{"Time": "", "Elapsed Seconds": seconds, "Setpoint": setpoint, "Temperature": temp, "Error": ""}
+                for seconds, setpoint, temp in samples]
+
+    csv_file = tmp_path / "run_Temperature.csv"
+    with open(csv_file, "w", newline="") as log_file:
+        writer = csv.DictWriter(log_file, fieldnames=list(readings[0]))
+        writer.writeheader()
+        writer.writerows(readings)
+
+    json_file = tmp_path / "run_Temperature.json"
+    json_file.write_text(json.dumps({"serial_number": "12345", "readings": readings}))
+
+    serial_number, model = Cold_Plate_Calibration.calibrate([str(csv_file), str(json_file)])
+    assert serial_number == "12345"
+    assert model["heating"]["tau_sec"] == pytest.approx(60.0, rel=0.1)
+    # The first setpoint in each log has no step to fit.
+    assert model["heating"]["segments"] == 2
+    assert model["cooling"]["segments"] == 2
+
+    model_file = tmp_path / "ColdPlateModels.json"
+    Cold_Plate_Calibration.save_model(str(model_file), serial_number, model)
+    Cold_Plate_Calibration.save_model(str(model_file), "67890", model)
+    assert set(json.loads(model_file.read_text())) == {"12345", "67890"}
@@ -0,0 +1,84 @@
+import sys
+import time
+from types import SimpleNamespace
+
+import pytest
+
+if sys.platform.startswith("win"):
+    pytest.skip("The emulator needs a pseudo-terminal", allow_module_level=True)
+
+import PCR
+from Cold_Plate_Emulator import ColdPlateEmulator
+
+# A plate fast enough to ramp within a test.
+FAST_PLATE = {"heating": (0.2, 0.5), "cooling": (0.2, 0.5)}
+FAST_MODEL = {"heating": {"dead_time_sec": 0.2, "tau_sec": 0.5}, "cooling": {"dead_time_sec": 0.2, "tau_sec": 0.5}}
+
+
+def connect(**emulator_settings):
+    emulator = ColdPlateEmulator(**dict(FAST_PLATE, **emulator_settings)).start()
+    protocol = SimpleNamespace(is_simulating=lambda: False, comment=lambda msg: None)
+    driver = PCR.ColdPlateSlimDriver(protocol, port=emulator.port)
+    driver.ramp_model = FAST_MODEL
+    return emulator, driver
+
+
+@pytest.fixture(params=[True, False], ids=["ack", "no-ack"])
+def plate(request):
+    emulator, driver = connect(acknowledge=request.param)
+    yield emulator, driver
+    driver.close()
+    emulator.stop()
+
+
+def test_info_and_temperature(plate):
+    emulator, driver = plate
+    assert "SN 29517" in driver.get_info()
+    assert driver.get_temp() == pytest.approx(22.0)
+
+
+def test_set_temp_does_not_wait_out_the_read_timeout(plate):
+    emulator, driver = plate
+    start_time = time.monotonic()
+    driver.set_temp(4)
+    assert time.monotonic() - start_time < 0.5
+    assert emulator.commands[-2:] == ["setTempTarget040", "tempOn"]
+
+
+def test_negative_setpoint(plate):
+    emulator, driver = plate
+    start_time = time.monotonic()
+    driver.set_temp(-6)
+    assert time.monotonic() - start_time < 0.5
+    assert emulator.commands[-2] == "setTempTarget-60"
+
+
+def test_set_temp_and_wait(plate):
+    emulator, driver = plate
+    assert driver.set_temp_andWait(10, timeout_min=1, stable_sec=0.5) == 10
+    assert abs(driver.get_temp() - 10) <= 0.5
+
+
+def test_late_acknowledgement_is_not_a_temperature():
+    emulator, driver = connect(reply_delay=0.15, jitter=0)
+    try:
+        for i in range(3):
+            driver.set_temp(10)
+            assert driver.get_temp() > 0
+    finally:
+        driver.close()
+        emulator.stop()
+
+
+def test_error_reply_raises(plate):
+    emulator, driver = plate
+    with pytest.raises(Exception, match="rejected"):
+        driver._send_command("setTempTargetabc")
+
+
+def test_no_reply_to_a_required_command_raises(plate, monkeypatch):
+    emulator, driver = plate
+    monkeypatch.setitem(PCR.ColdPlateSlimDriver.COMMAND_TIMEOUTS, "info", (0.2, True))
+    monkeypatch.setattr(emulator, "reply", lambda command: None)
+    with pytest.raises(Exception, match="No reply to info"):
+        driver.get_info()
@@ -0,0 +1,85 @@
+import asyncio
+import sys
+import time
+from types import SimpleNamespace
+
+import pytest
+
+if sys.platform.startswith("win"):
+    pytest.skip("The emulator needs a pseudo-terminal", allow_module_level=True)
+
+import PCR
+from Cold_Plate_Emulator import ColdPlateEmulator
+
+FAST_MODEL = {"heating": {"dead_time_sec": 0.2, "tau_sec": 0.5}, "cooling": {"dead_time_sec": 0.2, "tau_sec": 0.5}}
+
+
+@pytest.fixture
+def blocks():
+    emulators = {name: ColdPlateEmulator(serial_number=serial_number, heating=(0.2, 0.5), cooling=(0.2, 0.5),
+                                         reply_delay=0.05).start()
+                 for name, serial_number in (("plate", "111"), ("reagent", "222"))}
+    comments = []
+    protocol = SimpleNamespace(is_simulating=lambda: False, comment=comments.append)
+    manager = PCR.ColdPlateManager(protocol, {name: emulator.port for name, emulator in emulators.items()})
+    for driver in manager.drivers.values():
+        driver.ramp_model = FAST_MODEL
+
+    yield manager, emulators, comments
+
+    manager.close()
+    for emulator in emulators.values():
+        emulator.stop()
+
+
+def test_serial_numbers_come_from_info(blocks):
+    manager, emulators, comments = blocks
+    assert manager["plate"].serial_number == "111"
+    assert manager["reagent"].serial_number == "222"
+
+
+def test_ramps_overlap(blocks):
+    manager, emulators, comments = blocks
+    start_time = time.monotonic()
+    one = manager.wait_all(manager.wait("plate", 10, stable_sec=2))
+    one_time = time.monotonic() - start_time
+
+    start_time = time.monotonic()
+    both = manager.wait_all(manager.wait("plate", 16, stable_sec=2), manager.wait("reagent", 14, stable_sec=2))
+    both_time = time.monotonic() - start_time
+
+    assert one == [10] and both == [16, 14]
+    assert both_time < 1.5 * one_time
+    assert any(comment.startswith("reagent: ") for comment in comments)
+
+
+def test_asyncio(blocks):
+    manager, emulators, comments = blocks
+
+    async def ramp_both():
+        return await asyncio.gather(manager.async_wait("plate", 8, stable_sec=0.5),
+                                    manager.async_set_temp("reagent", 6))
+
+    assert asyncio.run(ramp_both()) == [8, None]
+
+
+def test_deactivate_turns_the_blocks_off(blocks):
+    manager, emulators, comments = blocks
+    manager.deactivate()
+    for emulator in emulators.values():
+        assert emulator.commands[-1] == "tempOff"
+
+
+def test_single_block_falls_back_to_usb0(monkeypatch):
+    opened = []
+    monkeypatch.setattr(PCR.ColdPlateManager, "discover_ports", staticmethod(lambda pattern: {}))
+    monkeypatch.setattr(PCR.ColdPlateManager, "__init__", lambda self, protocol, blocks: opened.append(blocks))
+    comments = []
+    protocol = SimpleNamespace(is_simulating=lambda: False, comment=comments.append)
+
+    PCR.ColdPlateManager.discover(protocol, ["plate"])
+    assert opened == [{"plate": "/dev/ttyUSB0"}]
+    assert comments
+
+    with pytest.raises(Exception, match="Found 0 cold plates"):
+        PCR.ColdPlateManager.discover(protocol, ["plate", "reagent"])
@@ -0,0 +1,70 @@
+import random
+from collections import defaultdict
+
+import pytest
+
+from PCR import Utilities
+
+
+def check_plan(destinations, capacity, keep_order=False):
+    aspirations = Utilities.plan_aspirations(destinations, capacity, keep_order)
+
+    totals = defaultdict(float)
+    for aspiration in aspirations:
+        assert sum(volume for well, volume in aspiration) <= capacity + 1e-6
+        for well, volume in aspiration:
+            assert volume > 0
+            totals[well] += volume
+
+    for well, volume in destinations:
+        assert totals.get(well, 0.0) == pytest.approx(max(volume, 0.0), abs=1e-6)
+
+    return aspirations
+
+
+def test_split_parts_add_up():
+    aspirations = check_plan([("A1", 100.0)], 40.0)
+    assert sorted(volume for aspiration in aspirations for well, volume in aspiration) == [33.3, 33.3, 33.4]
+
+
+def test_remainder_never_overfills_the_tip():
+    check_plan([("A1", 56.82), ("A2", 37.9), ("A3", 5.0)], 19.0)
+
+
+def test_empty_wells_are_skipped():
+    assert Utilities.plan_aspirations([("A1", 0.0), ("A2", -1.0)], 19.0) == []
+
+
+def test_wells_keep_their_order_within_an_aspiration():
+    destinations = [("A{}".format(i), 2.0) for i in range(1, 9)]
+    aspirations = check_plan(destinations, 19.0)
+    order = [well for well, volume in destinations]
+    for aspiration in aspirations:
+        wells = [well for well, volume in aspiration]
+        assert wells == sorted(wells, key=order.index)
+
+
+def test_keep_order_packs_consecutive_wells():
+    destinations = [("A{}".format(i), volume) for i, volume in enumerate([8.0, 2.0, 9.0, 5.0, 5.0, 12.0], 1)]
+    aspirations = Utilities.plan_aspirations(destinations, 19.0, keep_order=True)
+    assert [[well for well, volume in aspiration] for aspiration in aspirations] == \
+        [["A1", "A2", "A3"], ["A4", "A5"], ["A6"]]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_plates(seed):
+    generator = random.Random(seed)
+    capacity = generator.choice([9.5, 19.0, 195.0, 295.0])
+    destinations = [("W{}".format(i), round(generator.uniform(0.5, 3 * capacity), generator.choice([1, 2])))
+                    for i in range(generator.randint(1, 96))]
+    check_plan(destinations, capacity)
+    check_plan(destinations, capacity, keep_order=True)
+
+
+def test_pipette_volume_is_the_total_for_larger_volumes():
+    # Seven 20 uL fill wells go in one P300 aspiration, not fourteen P20 ones.
+    assert Utilities.dispense_volume([20.0] * 7) == 140.0
+
+
+def test_pipette_volume_is_the_largest_well_for_small_volumes():
+    assert Utilities.dispense_volume([2.5, 8.0, 15.0]) == 15.0
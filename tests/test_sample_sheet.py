@@ -0,0 +1,36 @@
+from types import SimpleNamespace
+
+import pytest
+from opentrons.protocols.parameters.exceptions import RuntimeParameterRequired
+
+from PCR import sample_sheet_contents
+
+
+class MissingSheet:
+    @property
+    def contents(self):
+        raise RuntimeParameterRequired("CSV parameter needs to be set to a file for full analysis or run.")
+
+
+class BrokenSheet:
+    @property
+    def contents(self):
+        raise UnicodeDecodeError("utf-8", b"\xff", 0, 1, "invalid start byte")
+
+
+def protocol(sample_sheet, simulating):
+    return SimpleNamespace(params=SimpleNamespace(sample_sheet=sample_sheet), is_simulating=lambda: simulating)
+
+
+def test_simulation_without_a_sheet_uses_the_tsv_file():
+    assert sample_sheet_contents(protocol(MissingSheet(), True)) == ""
+
+
+def test_run_without_a_sheet_fails():
+    with pytest.raises(RuntimeParameterRequired):
+        sample_sheet_contents(protocol(MissingSheet(), False))
+
+
+def test_unreadable_sheet_is_not_ignored():
+    with pytest.raises(UnicodeDecodeError):
+        sample_sheet_contents(protocol(BrokenSheet(), True))